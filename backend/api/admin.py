@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Cuenta, Pago, Profile, Proveedor, PresupuestoMensual, Aporte, GastoPresupuesto, DeudaPresupuesto, AhorroPresupuesto, MovimientoPresupuesto
+from .models import Cuenta, Pago, Profile, Proveedor, PresupuestoMensual, Aporte, GastoPresupuesto, DeudaPresupuesto, AhorroPresupuesto, MovimientoPresupuesto, SaldoPresupuesto, CambioSync, Tarea, ResumenMensual, DocumentoBusqueda
 
 @admin.register(Profile)
 class ProfileAdmin(admin.ModelAdmin):
@@ -15,3 +15,20 @@ admin.site.register(GastoPresupuesto)
 admin.site.register(DeudaPresupuesto)
 admin.site.register(AhorroPresupuesto)
 admin.site.register(MovimientoPresupuesto)
+admin.site.register(SaldoPresupuesto)
+admin.site.register(CambioSync)
+
+@admin.register(Tarea)
+class TareaAdmin(admin.ModelAdmin):
+    list_display = ('id', 'tipo', 'estado', 'intentos', 'usuario', 'fecha_creacion')
+    list_filter = ('estado', 'tipo')
+
+@admin.register(ResumenMensual)
+class ResumenMensualAdmin(admin.ModelAdmin):
+    list_display = ('familia', 'mes', 'categoria', 'proveedor', 'usuario', 'total_cuentas', 'total_pagos', 'total_gastos')
+    list_filter = ('familia', 'categoria')
+
+@admin.register(DocumentoBusqueda)
+class DocumentoBusquedaAdmin(admin.ModelAdmin):
+    list_display = ('tipo', 'objeto_id', 'titulo', 'fecha')
+    list_filter = ('tipo',)
@@ -0,0 +1,143 @@
+"""
+Almacenamiento de archivos direccionado por contenido.
+
+Cada subida se escribe a un temporal mientras se calcula su SHA-256; si ya
+existe un blob con ese hash el temporal se descarta y solo se suma una
+referencia. Los archivos quedan en `blobs/ab/<sha256><ext>` y la tabla
+ArchivoAlmacenado lleva la cuenta de cuántos FileField apuntan a cada uno:
+borrar (o reemplazar) un archivo resta una referencia y el blob se elimina
+del disco solo al quitar la última.
+
+La referencia se suma durante el save() de la fila dueña del FileField, que
+es atómico (ArchivosAtomicosMixin en api/models.py): si la fila no se guarda
+la referencia se deshace con ella. Un blob nuevo queda entonces en disco sin
+fila y lo reutiliza la próxima subida del mismo contenido.
+
+Los archivos anteriores (facturas/, comprobantes/, ...) no se cuentan
+hasta pasarlos al almacén con `manage.py deduplicar_archivos`.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.files.storage import FileSystemStorage
+from django.conf import settings
+from django.core.signing import BadSignature, TimestampSigner, b62_encode
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import ArchivoAlmacenado
+
+DIRECTORIO = 'blobs'
+DIRECTORIO_DERIVADOS = 'derivados'  # miniaturas y vistas previas por sha256, ver api/derivados.py
+
+
+class FirmadorMedia(TimestampSigner):
+    # Marca de tiempo redondeada a media vigencia: la URL de un archivo no cambia en cada
+    # respuesta y el navegador reutiliza lo que ya tiene en caché; vale entre media y una vigencia
+    def timestamp(self):
+        paso = max(settings.FAMILION_MEDIA_FIRMA_VIGENCIA // 2, 1)
+        return b62_encode(int(time.time()) // paso * paso)
+
+
+firmador = FirmadorMedia(salt='api.media')
+
+
+def firma(nombre):
+    # Solo "marca:firma"; el nombre ya va en la URL
+    return firmador.sign(nombre)[len(nombre) + len(firmador.sep):]
+
+
+def firma_valida(nombre, recibida):
+    try:
+        firmador.unsign(f'{nombre}{firmador.sep}{recibida}', max_age=settings.FAMILION_MEDIA_FIRMA_VIGENCIA)
+    except BadSignature:  # también SignatureExpired
+        return False
+    return True
+
+
+def nombre_blob(sha256, extension):
+    return f'{DIRECTORIO}/{sha256[:2]}/{sha256}{extension}'
+
+
+def es_blob(nombre):
+    return bool(nombre) and nombre.startswith(DIRECTORIO + '/')
+
+
+class AlmacenamientoDeduplicado(FileSystemStorage):
+    def _save(self, name, content):
+        extension = os.path.splitext(name)[1].lower()
+        temporales = self.path(os.path.join(DIRECTORIO, 'tmp'))
+        os.makedirs(temporales, exist_ok=True)
+        sha256, tamano = hashlib.sha256(), 0
+        fd, temporal = tempfile.mkstemp(dir=temporales, suffix=extension)
+        try:
+            with os.fdopen(fd, 'wb') as destino:
+                for chunk in content.chunks():
+                    sha256.update(chunk)
+                    destino.write(chunk)
+                    tamano += len(chunk)
+            return self.guardar_blob(temporal, sha256.hexdigest(), extension, tamano)
+        finally:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+
+    def guardar_blob(self, origen, sha256, extension, tamano, referencias=1):
+        """Registra `referencias` nuevas del blob y mueve `origen` al almacén si aún no estaba."""
+        nombre = nombre_blob(sha256, extension)
+        while True:
+            try:
+                with transaction.atomic():
+                    blob, _ = ArchivoAlmacenado.objects.get_or_create(
+                        sha256=sha256, defaults={'nombre': nombre, 'tamano': tamano}
+                    )
+            except IntegrityError:
+                # Otra subida del mismo contenido ganó la carrera
+                blob = ArchivoAlmacenado.objects.filter(sha256=sha256).first()
+                if blob is None:
+                    continue
+            # Sin filas: `deduplicar_archivos` borró el blob sin uso entretanto y se vuelve a crear
+            if ArchivoAlmacenado.objects.filter(sha256=sha256).update(referencias=F('referencias') + referencias):
+                break
+        destino = self.path(blob.nombre)
+        if not os.path.exists(destino):
+            os.makedirs(os.path.dirname(destino), exist_ok=True)
+            os.replace(origen, destino)
+            os.chmod(destino, self.file_permissions_mode or 0o644)
+        return blob.nombre
+
+    def url(self, name):
+        # Firmada para que /media/ la acepte sin cabecera Authorization (ver api/media.py)
+        return f'{super().url(name)}?firma={firma(name)}'
+
+    def delete(self, name):
+        if not es_blob(name):
+            return super().delete(name)
+        liberar(name, self)
+
+
+def liberar(nombre, storage):
+    """Quita una referencia al blob `nombre`; los archivos fuera del almacén no se tocan."""
+    if not es_blob(nombre):
+        return
+    with transaction.atomic():
+        blob = ArchivoAlmacenado.objects.select_for_update().filter(nombre=nombre).first()
+        if blob is None:
+            return
+        if blob.referencias > 1:
+            ArchivoAlmacenado.objects.filter(pk=blob.pk).update(referencias=F('referencias') - 1)
+            return
+        blob.delete()
+    borrar_al_confirmar(blob, storage)
+
+
+def borrar_al_confirmar(blob, storage):
+    """Tras el commit, borra del disco el archivo (y sus derivados) de un blob ya eliminado de la tabla."""
+    def borrar_archivo():
+        # Una subida del mismo contenido pudo recrearlo entre el commit y este callback
+        if not ArchivoAlmacenado.objects.filter(nombre=blob.nombre).exists():
+            FileSystemStorage.delete(storage, blob.nombre)
+            shutil.rmtree(storage.path(f'{DIRECTORIO_DERIVADOS}/{blob.sha256}'), ignore_errors=True)
+    transaction.on_commit(borrar_archivo)
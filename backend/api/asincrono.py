@@ -0,0 +1,131 @@
+"""
+Versiones async de los endpoints de lectura más pedidos, para servir con
+uvicorn (backend/asgi.py):
+
+- asinc/historial/: el listado de cuentas con los filtros del historial.
+- asinc/presupuestos/<pk>/resumen/: totales del mes y desglose por
+  categoría, consultados a la vez.
+- asinc/usuarios/ y asinc/proveedores-por-categoria/: datos de referencia
+  con la misma caché y ETag que las vistas normales.
+
+Las respuestas son idénticas a las de las vistas DRF equivalentes. Las
+consultas independientes van en hilos distintos (cada uno con su propia
+conexión), así una respuesta lenta no retiene a un worker: el event loop
+sigue atendiendo otros pedidos mientras tanto.
+"""
+import asyncio
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.http import HttpResponse
+from django.views.decorators.http import require_safe
+from rest_framework import exceptions
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from . import cache, lectura
+from .filters import CuentaFilter
+from .models import PresupuestoMensual, Profile
+from .renderers import JSONRapidoRenderer
+from .serializers import CuentaSerializer, ProveedorSerializer, ResumenPresupuestoSerializer, campos_solicitados
+from .views import cuentas_con_detalle, proveedores_de, usuario_con_color
+
+
+def en_hilo(funcion):
+    """
+    Como sync_to_async, pero en un hilo del pool y no en el hilo único del
+    pedido: varias llamadas en asyncio.gather() corren en paralelo.
+    """
+    def envoltura(*args, **kwargs):
+        close_old_connections()
+        try:
+            return funcion(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(envoltura, thread_sensitive=False)
+
+
+def respuesta_json(datos, status=200):
+    return HttpResponse(JSONRapidoRenderer().render(datos), status=status, content_type='application/json')
+
+
+async def autenticar(request):
+    # Los mismos autenticadores que DRF (JWT); la consulta del usuario va por sync_to_async
+    drf_request = Request(request, authenticators=[clase() for clase in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    usuario = await sync_to_async(lambda: drf_request.user)()
+    if not usuario.is_authenticated:
+        raise exceptions.NotAuthenticated()
+    return drf_request
+
+
+def vista_async(vista):
+    """Autentica, y convierte las excepciones de DRF en la misma respuesta que daría una APIView."""
+    @require_safe
+    @wraps(vista)
+    async def envoltura(request, *args, **kwargs):
+        try:
+            return await vista(await autenticar(request), *args, **kwargs)
+        except exceptions.APIException as exc:
+            datos = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+            respuesta = respuesta_json(datos, status=exc.status_code)
+            if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+                autenticador = api_settings.DEFAULT_AUTHENTICATION_CLASSES[0]()
+                respuesta['WWW-Authenticate'] = autenticador.authenticate_header(request)
+            return respuesta
+    return envoltura
+
+
+def respuesta_referencia(request, entrada):
+    respuesta = HttpResponse(status=304) if cache.vigente(request, entrada) else respuesta_json(entrada['datos'])
+    respuesta['ETag'] = entrada['etag']
+    respuesta['Cache-Control'] = 'private, no-cache'
+    return respuesta
+
+
+def listar_cuentas(request):
+    campos = campos_solicitados(request)
+    filtro = CuentaFilter(request.query_params, queryset=cuentas_con_detalle(campos), request=request)
+    if not filtro.is_valid():
+        raise exceptions.ValidationError(filtro.errors)
+    datos = lectura.listar(CuentaSerializer, filtro.qs, request)
+    if datos is None:
+        datos = CuentaSerializer(filtro.qs, many=True, context={'request': request}).data
+    return datos
+
+
+@vista_async
+async def historial(request):
+    # Sin paginar, como /api/cuentas/ sin ?page_size=
+    return respuesta_json(await en_hilo(listar_cuentas)(request))
+
+
+@vista_async
+async def resumen_presupuesto(request, pk):
+    # Totales (una fila de SaldoPresupuesto) y desglose por categoría, en paralelo
+    presupuesto, desglose = await asyncio.gather(
+        PresupuestoMensual.objects.con_saldo().filter(pk=pk).afirst(),
+        en_hilo(PresupuestoMensual(pk=pk).desglose_por_categoria)(),
+    )
+    if presupuesto is None:
+        raise exceptions.NotFound()
+    presupuesto.desglose_por_categoria = desglose
+    return respuesta_json(ResumenPresupuestoSerializer(presupuesto).data)
+
+
+@vista_async
+async def usuarios(request):
+    async def construir():
+        return [usuario_con_color(p) async for p in Profile.objects.select_related('user')]
+
+    return respuesta_referencia(request, await cache.aentrada_referencia('usuarios', '*', construir))
+
+
+@vista_async
+async def proveedores_por_categoria(request):
+    categoria = request.query_params.get('categoria')
+
+    async def construir():
+        return ProveedorSerializer([p async for p in proveedores_de(categoria)], many=True).data
+
+    return respuesta_referencia(request, await cache.aentrada_referencia('proveedores', categoria or '*', construir))
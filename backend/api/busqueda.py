@@ -0,0 +1,203 @@
+"""
+Búsqueda de texto en cuentas, deudas y movimientos (/api/buscar/?q=).
+
+Cada registro tiene un DocumentoBusqueda con su título y texto:
+
+- Cuenta: nombre; descripción, categoría y nombre del proveedor.
+- DeudaPresupuesto: motivo; comentario y categoría.
+- MovimientoPresupuesto: descripción; tipo.
+
+Las señales (api/signals.py) lo actualizan en cada escritura y las rutas
+que usan bulk_create llaman a `indexar()`. El índice depende de la base:
+
+- SQLite: tabla FTS5 de contenido externo sobre api_documentobusqueda,
+  mantenida por triggers (migración 0017). Sin acentos ni mayúsculas, por
+  prefijo, ordenada por bm25 con el título pesando más que el texto.
+- PostgreSQL: índice GIN sobre el tsvector (configuración 'simple', sin
+  acentos con translate()), ordenado por ts_rank. El fragmento sale del
+  texto original, así que una palabra con acento no queda marcada.
+- Otras bases o SQLite sin FTS5: LIKE sobre título y texto, por fecha.
+
+`manage.py reconstruir_busqueda` rehace los documentos y el índice.
+"""
+import re
+
+from django.db import connection, transaction
+from django.db.models import Q
+
+from .models import Cuenta, DeudaPresupuesto, MovimientoPresupuesto, Proveedor, DocumentoBusqueda
+
+TIPOS = {'cuenta': Cuenta, 'deuda': DeudaPresupuesto, 'movimiento': MovimientoPresupuesto}
+TIPO_DE = {modelo: tipo for tipo, modelo in TIPOS.items()}
+TABLA_FTS = 'api_documentobusqueda_fts'
+# Pesos de bm25 por columna (título, texto)
+PESOS = (10.0, 1.0)
+# PostgreSQL: la configuración 'simple' no quita acentos y unaccent es una extensión que
+# no siempre está; translate() es IMMUTABLE y sirve en el índice (migración 0018)
+ACENTOS = ('áàâäãéèêëíìîïóòôöõúùûüñç', 'aaaaaeeeeiiiiooooouuuunc')
+
+
+def sin_acentos_pg(expresion):
+    return f"translate(lower({expresion}), '{ACENTOS[0]}', '{ACENTOS[1]}')"
+
+
+VECTOR_PG = (
+    f"setweight(to_tsvector('simple', {sin_acentos_pg('titulo')}), 'A') || "
+    f"setweight(to_tsvector('simple', {sin_acentos_pg('texto')}), 'B')"
+)
+MARCAS = ('«', '»')
+MAXIMO_TERMINOS = 10
+LOTE = 1000
+
+_con_fts = {}
+
+
+def _unir(*partes):
+    return ' '.join(parte for parte in partes if parte)
+
+
+def _fecha(valor):
+    return valor.date() if hasattr(valor, 'date') else valor
+
+
+def documento(obj, proveedores=None):
+    """DocumentoBusqueda de un registro; `proveedores` ({id: nombre}) evita una consulta por cuenta."""
+    if isinstance(obj, Cuenta):
+        proveedor = proveedores.get(obj.proveedor_id, '') if proveedores is not None else obj.proveedor.nombre
+        return DocumentoBusqueda(tipo='cuenta', objeto_id=obj.pk, titulo=obj.nombre or '', fecha=obj.fecha_vencimiento,
+                                 texto=_unir(obj.descripcion, obj.categoria, proveedor))
+    if isinstance(obj, DeudaPresupuesto):
+        return DocumentoBusqueda(tipo='deuda', objeto_id=obj.pk, titulo=obj.motivo, fecha=_fecha(obj.fecha),
+                                 texto=_unir(obj.comentario, obj.categoria))
+    if isinstance(obj, MovimientoPresupuesto):
+        return DocumentoBusqueda(tipo='movimiento', objeto_id=obj.pk, titulo=obj.descripcion, fecha=_fecha(obj.fecha),
+                                 texto=obj.get_tipo_display())
+    raise TypeError(f'{type(obj).__name__} no se indexa para búsqueda')
+
+
+def indexar(objs):
+    """Crea o actualiza los documentos de `objs` en una consulta por lote."""
+    objs = [obj for obj in objs if obj is not None and obj.pk is not None]
+    ids_proveedor = {obj.proveedor_id for obj in objs if isinstance(obj, Cuenta)}
+    proveedores = dict(Proveedor.objects.filter(pk__in=ids_proveedor).values_list('pk', 'nombre')) if ids_proveedor else {}
+    documentos = [documento(obj, proveedores) for obj in objs]
+    DocumentoBusqueda.objects.bulk_create(
+        documentos, batch_size=LOTE, update_conflicts=True,
+        unique_fields=['tipo', 'objeto_id'], update_fields=['titulo', 'texto', 'fecha'],
+    )
+
+
+def desindexar(modelo, ids):
+    DocumentoBusqueda.objects.filter(tipo=TIPO_DE[modelo], objeto_id__in=list(ids)).delete()
+
+
+def reindexar_proveedor(proveedor):
+    # El nombre del proveedor forma parte del texto de sus cuentas
+    cuentas = Cuenta.objects.filter(proveedor=proveedor).only('id', 'nombre', 'descripcion', 'categoria', 'fecha_vencimiento', 'proveedor_id')
+    for inicio in range(0, cuentas.count(), LOTE):
+        indexar(cuentas.order_by('id')[inicio:inicio + LOTE])
+
+
+def usa_fts():
+    # La tabla FTS5 solo existe si la migración pudo crearla
+    alias = connection.alias
+    if alias not in _con_fts:
+        _con_fts[alias] = connection.vendor == 'sqlite' and TABLA_FTS in connection.introspection.table_names()
+    return _con_fts[alias]
+
+
+def motor():
+    if usa_fts():
+        return 'fts5'
+    return 'postgresql' if connection.vendor == 'postgresql' else 'like'
+
+
+@transaction.atomic
+def reconstruir():
+    DocumentoBusqueda.objects.all().delete()
+    total = 0
+    for modelo in TIPOS.values():
+        consulta = modelo.objects.order_by('pk')
+        for inicio in range(0, consulta.count(), LOTE):
+            lote = list(consulta[inicio:inicio + LOTE])
+            indexar(lote)
+            total += len(lote)
+    if usa_fts():
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {TABLA_FTS}({TABLA_FTS}) VALUES ('rebuild')")
+            cursor.execute(f"INSERT INTO {TABLA_FTS}({TABLA_FTS}) VALUES ('optimize')")
+    return total
+
+
+def terminos(q):
+    # Solo palabras: la sintaxis de consulta de FTS5 / tsquery no llega desde el cliente
+    return re.findall(r'\w+', q.lower())[:MAXIMO_TERMINOS]
+
+
+def _filtro_tipos(tipos, columna):
+    if not tipos:
+        return '', []
+    return f" AND {columna} IN ({', '.join(['%s'] * len(tipos))})", list(tipos)
+
+
+def _buscar_fts(palabras, tipos, limite, desplazamiento):
+    consulta = ' '.join(f'"{palabra}"*' for palabra in palabras)
+    filtro, parametros = _filtro_tipos(tipos, 'd.tipo')
+    desde = f'FROM {TABLA_FTS} f JOIN api_documentobusqueda d ON d.id = f.rowid WHERE {TABLA_FTS} MATCH %s{filtro}'
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT count(*) {desde}', [consulta, *parametros])
+        total = cursor.fetchone()[0]
+        cursor.execute(
+            f"SELECT d.tipo, d.objeto_id, d.titulo, d.fecha, "
+            f"snippet({TABLA_FTS}, -1, %s, %s, '…', 12), bm25({TABLA_FTS}, %s, %s) AS rango "
+            f"{desde} ORDER BY rango, d.id LIMIT %s OFFSET %s",
+            [*MARCAS, *PESOS, consulta, *parametros, limite, desplazamiento],
+        )
+        # bm25 es negativo: más relevante = más bajo
+        filas = [(tipo, objeto_id, titulo, fecha, fragmento, -rango) for tipo, objeto_id, titulo, fecha, fragmento, rango in cursor.fetchall()]
+    return total, filas
+
+
+def _buscar_postgresql(palabras, tipos, limite, desplazamiento):
+    consulta = ' & '.join(f'{palabra}:*' for palabra in palabras)
+    filtro, parametros = _filtro_tipos(tipos, 'tipo')
+    desde = f"FROM api_documentobusqueda, to_tsquery('simple', {sin_acentos_pg('%s')}) q WHERE ({VECTOR_PG}) @@ q{filtro}"
+    opciones = f'StartSel={MARCAS[0]}, StopSel={MARCAS[1]}, MaxWords=12, MinWords=4'
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT count(*) {desde}', [consulta, *parametros])
+        total = cursor.fetchone()[0]
+        cursor.execute(
+            f"SELECT tipo, objeto_id, titulo, fecha, ts_headline('simple', titulo || ' ' || texto, q, %s), "
+            f"ts_rank({VECTOR_PG}, q) AS rango {desde} ORDER BY rango DESC, id LIMIT %s OFFSET %s",
+            [opciones, consulta, *parametros, limite, desplazamiento],
+        )
+        filas = cursor.fetchall()
+    return total, filas
+
+
+def _buscar_like(palabras, tipos, limite, desplazamiento):
+    documentos = DocumentoBusqueda.objects.all()
+    if tipos:
+        documentos = documentos.filter(tipo__in=tipos)
+    for palabra in palabras:
+        documentos = documentos.filter(Q(titulo__icontains=palabra) | Q(texto__icontains=palabra))
+    total = documentos.count()
+    filas = [
+        (d.tipo, d.objeto_id, d.titulo, d.fecha, _unir(d.titulo, d.texto)[:120], None)
+        for d in documentos.order_by('-fecha', '-id')[desplazamiento:desplazamiento + limite]
+    ]
+    return total, filas
+
+
+def buscar(q, tipos=None, limite=20, desplazamiento=0):
+    """(total, resultados) de la página pedida, de más a menos relevante."""
+    palabras = terminos(q)
+    if not palabras:
+        return 0, []
+    buscar_en = {'fts5': _buscar_fts, 'postgresql': _buscar_postgresql, 'like': _buscar_like}[motor()]
+    total, filas = buscar_en(palabras, tipos, limite, desplazamiento)
+    return total, [
+        {'tipo': tipo, 'id': objeto_id, 'titulo': titulo, 'fecha': fecha, 'fragmento': fragmento,
+         'relevancia': round(rango, 4) if rango is not None else None}
+        for tipo, objeto_id, titulo, fecha, fragmento, rango in filas
+    ]
@@ -0,0 +1,86 @@
+"""
+Caché de datos de referencia (proveedores, usuarios, categorías).
+
+Cada grupo tiene una versión guardada en la caché; invalidar un grupo
+cambia su versión y deja huérfanas todas sus entradas, sin necesidad de
+conocer cada clave (p. ej. una por categoría). Las respuestas llevan un
+ETag fuerte calculado sobre el contenido para responder 304.
+
+La versión cambia al confirmar la transacción que escribió: si cambiara
+antes, un request concurrente podría volver a armar la entrada con los
+datos sin confirmar todavía y dejarla en la caché por TIMEOUT.
+"""
+import hashlib
+import json
+import uuid
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.http import parse_etags
+from rest_framework.response import Response
+
+TIMEOUT = 60 * 60
+
+
+def version(grupo):
+    clave = f'ref:{grupo}:version'
+    actual = cache.get(clave)
+    if actual is None:
+        actual = uuid.uuid4().hex
+        cache.set(clave, actual, None)
+    return actual
+
+
+def invalidar(*grupos):
+    # Fuera de una transacción on_commit corre en el acto
+    transaction.on_commit(lambda: cache.set_many({f'ref:{grupo}:version': uuid.uuid4().hex for grupo in grupos}, None))
+
+
+def entrada_referencia(grupo, clave, construir):
+    """{'etag', 'datos'} de `construir()` cacheados bajo (grupo, clave)."""
+    cache_key = f'ref:{grupo}:{version(grupo)}:{clave}'
+    entrada = cache.get(cache_key)
+    if entrada is None:
+        entrada = armar_entrada(construir())
+        cache.set(cache_key, entrada, TIMEOUT)
+    return entrada
+
+
+async def aentrada_referencia(grupo, clave, construir):
+    # Igual que entrada_referencia(), para vistas async: `construir` es una corrutina
+    clave_version = f'ref:{grupo}:version'
+    actual = await cache.aget(clave_version)
+    if actual is None:
+        actual = uuid.uuid4().hex
+        await cache.aset(clave_version, actual, None)
+    cache_key = f'ref:{grupo}:{actual}:{clave}'
+    entrada = await cache.aget(cache_key)
+    if entrada is None:
+        entrada = armar_entrada(await construir())
+        await cache.aset(cache_key, entrada, TIMEOUT)
+    return entrada
+
+
+def armar_entrada(datos):
+    contenido = json.dumps(datos, sort_keys=True, cls=DjangoJSONEncoder).encode()
+    return {'etag': f'"{hashlib.sha256(contenido).hexdigest()[:32]}"', 'datos': datos}
+
+
+def vigente(request, entrada):
+    # True si el cliente ya tiene esta versión (If-None-Match)
+    if_none_match = request.headers.get('If-None-Match')
+    return bool(if_none_match) and (entrada['etag'] in parse_etags(if_none_match) or if_none_match.strip() == '*')
+
+
+def respuesta_referencia(request, grupo, clave, construir):
+    """
+    Devuelve una Response con los datos de `construir()` cacheados bajo
+    (grupo, clave), o un 304 si el cliente ya tiene la misma versión.
+    """
+    entrada = entrada_referencia(grupo, clave, construir)
+    response = Response(status=304) if vigente(request, entrada) else Response(entrada['datos'])
+    response['ETag'] = entrada['etag']
+    # El navegador guarda la copia pero revalida siempre con If-None-Match
+    response['Cache-Control'] = 'private, no-cache'
+    return response
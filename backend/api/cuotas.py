@@ -0,0 +1,106 @@
+"""
+Generación de las cuotas de una deuda en los presupuestos de los meses
+siguientes, como operación por lotes: el número de consultas no depende
+de la cantidad de cuotas.
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+
+from .models import PresupuestoMensual, SaldoPresupuesto, DeudaPresupuesto
+from . import busqueda, saldos, sync
+
+
+def fechas_cuotas(fecha_inicio, cuotas, frecuencia):
+    fechas = []
+    for i in range(cuotas):
+        if frecuencia == 'mensual':
+            mes = (fecha_inicio.month + i - 1) % 12 + 1
+            year = fecha_inicio.year + ((fecha_inicio.month + i - 1) // 12)
+            fechas.append(date(year, mes, 1))
+        elif frecuencia == 'quincenal':
+            fechas.append(fecha_inicio + timedelta(days=15*i))
+        elif frecuencia == 'semanal':
+            fechas.append(fecha_inicio + timedelta(days=7*i))
+        else:
+            fechas.append(fecha_inicio)
+    return fechas
+
+
+def presupuestos_por_mes(familia, meses, usuario):
+    # Devuelve {fecha_mes: presupuesto} creando de una vez los meses que falten
+    existentes = {p.fecha_mes: p for p in PresupuestoMensual.objects.filter(familia=familia, fecha_mes__in=meses)}
+    faltantes = [mes for mes in sorted(meses) if mes not in existentes]
+    if not faltantes:
+        return existentes
+    # ignore_conflicts: si otra petición creó el mes entretanto, la restricción única lo resuelve
+    PresupuestoMensual.objects.bulk_create(
+        [PresupuestoMensual(familia=familia, fecha_mes=mes, monto_objetivo=0, creado_por=usuario) for mes in faltantes],
+        ignore_conflicts=True,
+    )
+    existentes = {p.fecha_mes: p for p in PresupuestoMensual.objects.filter(familia=familia, fecha_mes__in=meses)}
+    # bulk_create no dispara post_save: saldos y bitácora de sync de los meses nuevos se registran aquí
+    SaldoPresupuesto.objects.bulk_create(
+        [SaldoPresupuesto(presupuesto=existentes[mes]) for mes in faltantes],
+        ignore_conflicts=True,
+    )
+    sync.registrar(existentes[mes] for mes in faltantes)
+    return existentes
+
+
+def tiene_cuotas(deuda):
+    # Deudas en varias cuotas o que empiezan en otro mes que su presupuesto
+    return deuda.cuotas_totales > 1 or bool(deuda.fecha_inicio and deuda.fecha_inicio.month != deuda.presupuesto.fecha_mes.month)
+
+
+def generar_cuotas(deuda, usuario):
+    """
+    Crea la deuda remanente de cada cuota en el presupuesto de su mes.
+    Devuelve la lista de presupuestos afectados (el de la deuda primero).
+    """
+    presupuestos_afectados = [deuda.presupuesto]
+    if not tiene_cuotas(deuda):
+        return presupuestos_afectados
+
+    fecha_inicio = deuda.fecha_inicio or deuda.presupuesto.fecha_mes
+    monto_cuota = deuda.monto / deuda.cuotas_totales if deuda.cuotas_totales > 1 else deuda.monto
+    monto_cuota = Decimal(monto_cuota).quantize(Decimal('0.01'))
+    fechas = fechas_cuotas(fecha_inicio, deuda.cuotas_totales, deuda.frecuencia or 'mensual')
+    presupuestos = presupuestos_por_mes(deuda.presupuesto.familia, {date(f.year, f.month, 1) for f in fechas}, usuario)
+
+    # Misma verificación de duplicados de antes, en una sola consulta
+    ya_generadas = set(
+        DeudaPresupuesto.objects.filter(
+            presupuesto__in=presupuestos.values(),
+            motivo=deuda.motivo,
+            monto=monto_cuota,
+            cuotas_totales=1,
+            pagado=False
+        ).values_list('presupuesto_id', flat=True)
+    )
+    nuevas = []
+    for fecha_cuota in fechas:
+        presupuesto = presupuestos[date(fecha_cuota.year, fecha_cuota.month, 1)]
+        if presupuesto.id == deuda.presupuesto_id:
+            continue
+        if presupuesto.id not in ya_generadas:
+            ya_generadas.add(presupuesto.id)
+            nuevas.append(DeudaPresupuesto(
+                presupuesto=presupuesto,
+                monto=monto_cuota,
+                motivo=deuda.motivo,
+                pagado=False,
+                comentario=f'Deuda remanente de cuota generada automáticamente',
+                cuenta_origen=deuda.cuenta_origen,
+                cuotas_totales=1,
+                cuotas_pagadas=0,
+                frecuencia='mensual',
+                fecha_inicio=fecha_cuota,
+                categoria=deuda.categoria
+            ))
+        presupuestos_afectados.append(presupuesto)
+
+    DeudaPresupuesto.objects.bulk_create(nuevas)
+    saldos.actualizar(nuevo=saldos.contribucion(*nuevas))
+    sync.registrar(nuevas)
+    busqueda.indexar(nuevas)
+    return presupuestos_afectados
@@ -0,0 +1,200 @@
+"""
+Derivados de facturas y comprobantes: miniatura y vista previa livianas.
+
+Al guardar un archivo se programa su procesamiento en un pool de hilos
+local (sin broker); la subida no espera. Como los archivos están
+direccionados por contenido, los derivados se guardan junto al hash
+(`derivados/<sha256>/<tipo>.jpg`) y se comparten entre todas las filas
+que usan el mismo archivo:
+
+- miniatura: lado mayor de MINIATURA px, para listados.
+- previa: para imágenes, la versión recomprimida de tamaño web; para PDF,
+  la primera página renderizada (pypdfium2 o, si no está, pdftoppm).
+
+Si se pide un derivado que el pool todavía no generó, api/media.py lo
+genera en el momento, así las URL que exponen los serializers siempre
+son válidas.
+"""
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from .almacenamiento import DIRECTORIO_DERIVADOS, es_blob
+from .models import ArchivoAlmacenado
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow es opcional: sin él no hay derivados
+    Image = None
+
+try:
+    import pypdfium2
+except ImportError:
+    pypdfium2 = None
+
+logger = logging.getLogger(__name__)
+
+TIPOS = ('miniatura', 'previa')
+MINIATURA = 320
+PREVIA = 1600
+CALIDAD = {'miniatura': 70, 'previa': 80}
+EXTENSIONES_IMAGEN = {'.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp', '.tif', '.tiff'}
+
+_pool = None
+_pool_lock = threading.Lock()
+# Un candado por archivo mientras alguien lo procesa: nombre -> [Lock, usuarios]
+_candados = {}
+_candados_lock = threading.Lock()
+# Trabajos en curso; cada uno se quita solo al terminar
+_pendientes = set()
+_pendientes_lock = threading.Lock()
+
+
+def pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'FAMILION_DERIVADOS_WORKERS', 2), thread_name_prefix='derivados'
+            )
+        return _pool
+
+
+def renderizador_pdf():
+    if pypdfium2 is not None:
+        return 'pdfium'
+    if shutil.which('pdftoppm'):
+        return 'pdftoppm'
+    return None
+
+
+def soportado(nombre):
+    if Image is None or not es_blob(nombre):
+        return False
+    extension = os.path.splitext(nombre)[1].lower()
+    return extension in EXTENSIONES_IMAGEN or (extension == '.pdf' and renderizador_pdf() is not None)
+
+
+def nombre_derivado(nombre, tipo):
+    sha256 = os.path.splitext(os.path.basename(nombre))[0]
+    return f'{DIRECTORIO_DERIVADOS}/{sha256}/{tipo}.jpg'
+
+
+def original_de(nombre_derivado_):
+    """Blob de origen de `derivados/<sha256>/<tipo>.jpg`, o None si no existe."""
+    partes = nombre_derivado_.split('/')
+    if len(partes) != 3 or partes[0] != DIRECTORIO_DERIVADOS or partes[2] not in {f'{t}.jpg' for t in TIPOS}:
+        return None
+    return ArchivoAlmacenado.objects.filter(sha256=partes[1]).values_list('nombre', flat=True).first()
+
+
+def programar(nombre):
+    """Encola la generación de los derivados de `nombre` cuando la transacción confirme."""
+    if soportado(nombre):
+        transaction.on_commit(lambda: _encolar(nombre))
+
+
+def _encolar(nombre):
+    trabajo = pool().submit(generar, nombre)
+    with _pendientes_lock:
+        _pendientes.add(trabajo)
+    trabajo.add_done_callback(_terminado)
+
+
+def _terminado(trabajo):
+    with _pendientes_lock:
+        _pendientes.discard(trabajo)
+
+
+def esperar():
+    # Para tests y comandos: bloquea hasta terminar lo encolado
+    while True:
+        with _pendientes_lock:
+            trabajos = list(_pendientes)
+        if not trabajos:
+            return
+        for trabajo in trabajos:
+            trabajo.result()
+
+
+@contextmanager
+def candado(nombre):
+    with _candados_lock:
+        entrada = _candados.setdefault(nombre, [threading.Lock(), 0])
+        entrada[1] += 1
+    try:
+        with entrada[0]:
+            yield
+    finally:
+        # El último en soltarlo lo borra: no quedan candados de archivos ya procesados
+        with _candados_lock:
+            entrada[1] -= 1
+            if not entrada[1]:
+                del _candados[nombre]
+
+
+def generar(nombre, tipos=TIPOS):
+    # El candado evita procesar dos veces el mismo archivo (pool y pedido en el momento a la vez)
+    with candado(nombre):
+        faltantes = [t for t in tipos if not os.path.exists(default_storage.path(nombre_derivado(nombre, t)))]
+        if not faltantes:
+            return
+        try:
+            imagen = abrir(default_storage.path(nombre))
+            for tipo in faltantes:
+                guardar(imagen, nombre_derivado(nombre, tipo), MINIATURA if tipo == 'miniatura' else PREVIA, CALIDAD[tipo])
+        except Exception:
+            logger.exception('No se pudieron generar los derivados de %s', nombre)
+
+
+def abrir(ruta):
+    if not ruta.lower().endswith('.pdf'):
+        with Image.open(ruta) as imagen:
+            imagen.draft('RGB', (PREVIA, PREVIA))  # JPEG: decodifica ya reducido
+            return ImageOps.exif_transpose(imagen).copy()
+    if renderizador_pdf() == 'pdfium':
+        documento = pypdfium2.PdfDocument(ruta)
+        try:
+            pagina = documento[0]
+            return pagina.render(scale=PREVIA / max(pagina.get_size())).to_pil()
+        finally:
+            documento.close()
+    with tempfile.TemporaryDirectory() as directorio:
+        salida = os.path.join(directorio, 'pagina')
+        subprocess.run(
+            ['pdftoppm', '-f', '1', '-l', '1', '-singlefile', '-png', '-scale-to', str(PREVIA), ruta, salida],
+            check=True, capture_output=True, timeout=60,
+        )
+        with Image.open(salida + '.png') as imagen:
+            return imagen.copy()
+
+
+def guardar(imagen, nombre, lado, calidad):
+    copia = imagen.copy()
+    copia.thumbnail((lado, lado))
+    if copia.mode != 'RGB':
+        # Transparencias sobre fondo blanco
+        copia = copia.convert('RGBA')
+        fondo = Image.new('RGB', copia.size, 'white')
+        fondo.paste(copia, mask=copia.getchannel('A'))
+        copia = fondo
+    destino = default_storage.path(nombre)
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    fd, temporal = tempfile.mkstemp(dir=os.path.dirname(destino), suffix='.jpg')
+    try:
+        with os.fdopen(fd, 'wb') as archivo:
+            copia.save(archivo, 'JPEG', quality=calidad, optimize=True, progressive=True)
+        os.chmod(temporal, 0o644)
+        os.replace(temporal, destino)
+    finally:
+        if os.path.exists(temporal):
+            os.remove(temporal)
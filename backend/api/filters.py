@@ -0,0 +1,32 @@
+import django_filters
+
+from .models import Cuenta
+
+
+class CuentaFilter(django_filters.FilterSet):
+    """
+    Filtros del historial de cuentas, compartidos por el listado de
+    /api/cuentas/ y la exportación CSV. Todo se resuelve en SQL.
+    """
+    ESTADO_CHOICES = [
+        ('pagada', 'Pagada'),
+        ('parcial', 'Pago parcial'),
+        ('pendiente', 'Pendiente (sin pagar o con pago parcial)'),
+    ]
+
+    fecha_desde = django_filters.DateFilter(field_name='fecha_vencimiento', lookup_expr='gte')
+    fecha_hasta = django_filters.DateFilter(field_name='fecha_vencimiento', lookup_expr='lte')
+    estado = django_filters.ChoiceFilter(choices=ESTADO_CHOICES, method='filtrar_estado')
+
+    class Meta:
+        model = Cuenta
+        fields = ['categoria', 'proveedor', 'creador']
+
+    def filtrar_estado(self, queryset, name, value):
+        # El estado sale de las anotaciones de Cuenta.objects.con_totales()
+        if 'estado_pago' not in queryset.query.annotations:
+            queryset = queryset.con_totales()
+        if value == 'pendiente':
+            # Igual que antes en la exportación: todo lo que no está pagado por completo
+            return queryset.exclude(estado_pago='pagada')
+        return queryset.filter(estado_pago=value)
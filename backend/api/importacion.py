@@ -0,0 +1,281 @@
+"""
+Importación masiva de cuentas y pagos desde CSV (mismo formato que
+escribe ExportarCuentasCSVView) o desde una lista JSON.
+
+La validación recorre las filas por lotes y todas las escrituras usan
+bulk_create, de modo que el costo no depende de consultas por fila.
+"""
+import csv
+import io
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from .models import Cuenta, Pago, Proveedor, PresupuestoMensual, GastoPresupuesto
+from . import busqueda, reportes, saldos, cache, sync
+
+# (encabezado del CSV exportado, clave interna); las columnas sin clave se ignoran al importar
+COLUMNAS_CSV = [
+    ('ID', None),
+    ('Nombre', 'nombre'),
+    ('Monto', 'monto'),
+    ('Proveedor', 'proveedor'),
+    ('Categoría', 'categoria'),
+    ('Fecha Emisión', 'fecha_emision'),
+    ('Fecha Vencimiento', 'fecha_vencimiento'),
+    ('Descripción', 'descripcion'),
+    ('Creador', 'creador'),
+    ('Fecha Creación', None),
+    ('Estado', None),
+    ('Monto Pagado', 'monto_pagado'),
+    ('Fecha Último Pago', 'fecha_ultimo_pago'),
+]
+CLAVES = [clave for _, clave in COLUMNAS_CSV if clave]
+LOTE = 2000
+MAX_ERRORES = 100
+# Mayor monto que cabe en Cuenta.monto / Pago.monto_pagado (DecimalField(max_digits=10, decimal_places=2))
+_campo_monto = Cuenta._meta.get_field('monto')
+MONTO_MAXIMO = Decimal(10) ** (_campo_monto.max_digits - _campo_monto.decimal_places) - Decimal('0.01')
+# Texto que va a un CharField: {clave: max_length}
+LARGOS = {
+    'nombre': Cuenta._meta.get_field('nombre').max_length,
+    'categoria': min(Cuenta._meta.get_field('categoria').max_length, Proveedor._meta.get_field('categoria').max_length),
+    'proveedor': Proveedor._meta.get_field('nombre').max_length,
+}
+
+
+class ErrorImportacion(Exception):
+    def __init__(self, errores):
+        super().__init__(f'{len(errores)} fila(s) con errores')
+        self.errores = errores
+
+
+def filas_csv(archivo):
+    # `archivo` puede ser texto o bytes (p. ej. un UploadedFile)
+    contenido = archivo.read()
+    if isinstance(contenido, bytes):
+        contenido = contenido.decode('utf-8-sig')
+    claves = dict(COLUMNAS_CSV)
+    for fila in csv.DictReader(io.StringIO(contenido)):
+        yield {claves[encabezado]: valor for encabezado, valor in fila.items() if claves.get(encabezado)}
+
+
+def normalizar_clave(clave):
+    # Acepta snake_case, camelCase o los encabezados del CSV
+    encabezados = dict(COLUMNAS_CSV)
+    if clave in encabezados:
+        return encabezados[clave]
+    return ''.join('_' + c.lower() if c.isupper() else c for c in clave)
+
+
+def filas_json(datos):
+    if not isinstance(datos, list):
+        raise ErrorImportacion([{'fila': 0, 'errores': {'detail': 'Se esperaba una lista de cuentas.'}}])
+    for fila in datos:
+        if not isinstance(fila, dict):
+            yield {}
+            continue
+        yield {normalizar_clave(clave): valor for clave, valor in fila.items()}
+
+
+def _decimal(valor, requerido=True):
+    if valor in (None, ''):
+        if requerido:
+            raise ValueError('Este campo es requerido.')
+        return Decimal('0')
+    try:
+        numero = Decimal(str(valor)).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise ValueError('Número inválido.')
+    # Decimal('NaN') pasa quantize() pero no se puede comparar; Infinity no se puede cuantizar
+    if not numero.is_finite():
+        raise ValueError('Número inválido.')
+    if numero < 0:
+        raise ValueError('No puede ser negativo.')
+    if numero > MONTO_MAXIMO:
+        raise ValueError(f'No puede ser mayor a {MONTO_MAXIMO}.')
+    return numero
+
+
+def _fecha(valor, requerido=True):
+    if valor in (None, ''):
+        if requerido:
+            raise ValueError('Este campo es requerido.')
+        return None
+    try:
+        return date.fromisoformat(str(valor)[:10])
+    except ValueError:
+        raise ValueError('Fecha inválida, usa AAAA-MM-DD.')
+
+
+def validar_fila(fila):
+    datos, errores = {}, {}
+    conversiones = {
+        'monto': lambda v: _decimal(v),
+        'monto_pagado': lambda v: _decimal(v, requerido=False),
+        'fecha_emision': lambda v: _fecha(v, requerido=False),
+        'fecha_vencimiento': lambda v: _fecha(v),
+        'fecha_ultimo_pago': lambda v: _fecha(v, requerido=False),
+    }
+    for clave in CLAVES:
+        valor = fila.get(clave)
+        try:
+            datos[clave] = conversiones[clave](valor) if clave in conversiones else (str(valor).strip() if valor is not None else '')
+        except ValueError as e:
+            errores[clave] = str(e)
+            continue
+        if clave in LARGOS and len(datos[clave]) > LARGOS[clave]:
+            errores[clave] = f'No puede tener más de {LARGOS[clave]} caracteres.'
+    if not errores:
+        if not datos['proveedor']:
+            errores['proveedor'] = 'Este campo es requerido.'
+        if not datos['categoria']:
+            errores['categoria'] = 'Este campo es requerido.'
+        if datos['monto_pagado'] > datos['monto']:
+            errores['monto_pagado'] = 'El monto pagado no puede ser mayor al monto de la cuenta.'
+    return datos, errores
+
+
+def validar(filas):
+    validas, errores = [], []
+    lote = []
+    for numero, fila in enumerate(filas, start=1):
+        lote.append((numero, fila))
+        if len(lote) >= LOTE:
+            _validar_lote(lote, validas, errores)
+            lote = []
+    _validar_lote(lote, validas, errores)
+    return validas, errores
+
+
+def _validar_lote(lote, validas, errores):
+    for numero, fila in lote:
+        datos, errores_fila = validar_fila(fila)
+        if errores_fila:
+            if len(errores) < MAX_ERRORES:
+                errores.append({'fila': numero, 'errores': errores_fila})
+        else:
+            validas.append(datos)
+
+
+def resolver_proveedores(filas):
+    # {(nombre, categoria): id} con un SELECT y, si faltan, un INSERT masivo
+    pares = {(f['proveedor'], f['categoria']) for f in filas}
+    nombres = {nombre for nombre, _ in pares}
+
+    def cargar():
+        return {
+            (p.nombre, p.categoria): p.id
+            for p in Proveedor.objects.filter(nombre__in=nombres)
+            if (p.nombre, p.categoria) in pares
+        }
+
+    proveedores = cargar()
+    faltantes = pares - proveedores.keys()
+    if faltantes:
+        Proveedor.objects.bulk_create(
+            [Proveedor(nombre=nombre, categoria=categoria) for nombre, categoria in faltantes],
+            ignore_conflicts=True, batch_size=LOTE,
+        )
+        proveedores = cargar()
+    return proveedores, len(faltantes)
+
+
+def resolver_usuarios(filas, usuario):
+    nombres = {f['creador'] for f in filas if f['creador']}
+    usuarios = {u.username: u.id for u in User.objects.filter(username__in=nombres)}
+    desconocidos = sorted(nombres - usuarios.keys())
+    if desconocidos:
+        raise ErrorImportacion([{'fila': 0, 'errores': {'creador': f'Usuarios desconocidos: {", ".join(desconocidos[:20])}'}}])
+    usuarios[''] = usuario.id
+    return usuarios
+
+
+def presupuestos_por_mes(filas):
+    # Primer presupuesto de cada mes, igual que PagoViewSet.perform_create
+    fechas = [f['fecha_vencimiento'] for f in filas if f['monto_pagado'] > 0]
+    if not fechas:
+        return {}
+    desde, _ = PresupuestoMensual.rango_mes(min(fechas))
+    _, hasta = PresupuestoMensual.rango_mes(max(fechas))
+    por_mes = {}
+    for presupuesto_id, fecha_mes in (
+        PresupuestoMensual.objects.filter(fecha_mes__gte=desde, fecha_mes__lt=hasta)
+        .order_by('id').values_list('id', 'fecha_mes')
+    ):
+        por_mes.setdefault((fecha_mes.year, fecha_mes.month), presupuesto_id)
+    return por_mes
+
+
+@transaction.atomic
+def importar(filas, usuario):
+    """
+    Importa todas las filas o ninguna. Lanza ErrorImportacion con el detalle
+    por fila si alguna no es válida.
+    """
+    validas, errores = validar(filas)
+    if errores:
+        raise ErrorImportacion(errores)
+
+    proveedores, proveedores_creados = resolver_proveedores(validas)
+    usuarios = resolver_usuarios(validas, usuario)
+
+    cuentas = []
+    for f in validas:
+        cuenta = Cuenta(
+            nombre=f['nombre'],
+            monto=f['monto'],
+            proveedor_id=proveedores[(f['proveedor'], f['categoria'])],
+            categoria=f['categoria'],
+            fecha_emision=f['fecha_emision'],
+            fecha_vencimiento=f['fecha_vencimiento'],
+            descripcion=f['descripcion'],
+            creador_id=usuarios[f['creador']],
+        )
+        # bulk_create no pasa por Cuenta.save()
+        if not cuenta.nombre:
+            cuenta.nombre = cuenta.nombre_por_defecto()
+        cuentas.append(cuenta)
+    Cuenta.objects.bulk_create(cuentas, batch_size=LOTE)
+
+    pagos = [
+        Pago(
+            cuenta=cuenta,
+            monto_pagado=f['monto_pagado'],
+            fecha_pago=f['fecha_ultimo_pago'] or f['fecha_vencimiento'],
+            usuario_id=cuenta.creador_id,
+        )
+        for cuenta, f in zip(cuentas, validas) if f['monto_pagado'] > 0
+    ]
+    Pago.objects.bulk_create(pagos, batch_size=LOTE)
+
+    # Mismo efecto que PagoViewSet: el pago descuenta del presupuesto del mes de vencimiento
+    presupuestos = presupuestos_por_mes(validas)
+    gastos = []
+    for pago in pagos:
+        cuenta = pago.cuenta
+        presupuesto_id = presupuestos.get((cuenta.fecha_vencimiento.year, cuenta.fecha_vencimiento.month))
+        if presupuesto_id:
+            gastos.append(GastoPresupuesto(
+                presupuesto_id=presupuesto_id,
+                cuenta=cuenta,
+                monto=pago.monto_pagado,
+                pagado_por_id=pago.usuario_id,
+                comentario=f'Pago automático al registrar pago de cuenta #{cuenta.id}'
+            ))
+    GastoPresupuesto.objects.bulk_create(gastos, batch_size=LOTE)
+    saldos.actualizar(nuevo=saldos.contribucion(*gastos))
+    # bulk_create no dispara señales: totales de reportes, búsqueda, caché de referencia y bitácora de sync a mano
+    reportes.registrar_nuevos({Cuenta: cuentas, Pago: pagos, GastoPresupuesto: gastos})
+    busqueda.indexar(cuentas)
+    cache.invalidar('proveedores', 'categorias')
+    sync.registrar([*cuentas, *pagos, *gastos])
+
+    return {
+        'cuentas': len(cuentas),
+        'pagos': len(pagos),
+        'gastos': len(gastos),
+        'proveedoresCreados': proveedores_creados,
+    }
@@ -0,0 +1,178 @@
+"""
+Ruta de lectura rápida para listados grandes.
+
+El listado normal pasa cada fila por la maquinaria de DRF (instancia del
+modelo, get_attribute y to_representation por campo) y después arma un
+segundo diccionario renombrando las claves a camelCase. Aquí el plan de
+cada serializer (clave camelCase, lookup de values() y conversión) se arma
+una sola vez por clase, y las filas se leen con values_list() directo a
+los diccionarios de salida. El resultado es idéntico al del serializer.
+
+Si el serializer tiene campos que no se pueden leer con values()
+(SerializerMethodField sin entrada en `valores_lectura`, many-to-many,
+serializers anidados que no son una relación inversa), plan_de() devuelve
+None y el listado usa el camino normal.
+"""
+from django.db.models import ManyToOneRel
+from rest_framework import serializers
+from rest_framework.relations import ManyRelatedField, PrimaryKeyRelatedField, RelatedField
+from rest_framework.settings import api_settings
+
+from .serializers import campos_solicitados, to_camel_case
+
+# Campos cuyo to_representation devuelve el mismo valor que entrega la base
+IDENTIDAD = (serializers.ReadOnlyField, serializers.IntegerField, serializers.CharField, serializers.BooleanField)
+LOTE_IDS = 900
+LOTE_CURSOR = 2000
+
+_planes = {}
+
+
+class SinPlan(Exception):
+    pass
+
+
+class Campo:
+    def __init__(self, nombre, ruta, convertir=None, con_request=None):
+        self.nombre = nombre
+        self.clave = to_camel_case(nombre)
+        self.ruta = ruta
+        self.convertir = convertir
+        # Conversiones que dependen del request (URLs absolutas): f(valor, request)
+        self.con_request = con_request
+
+
+class Anidado:
+    def __init__(self, nombre, relacion, plan):
+        self.nombre = nombre
+        self.clave = to_camel_case(nombre)
+        self.relacion = relacion
+        self.plan = plan
+
+
+def plan_de(serializer_class):
+    if serializer_class not in _planes:
+        try:
+            _planes[serializer_class] = armar_plan(serializer_class)
+        except SinPlan:
+            _planes[serializer_class] = None
+    return _planes[serializer_class]
+
+
+def armar_plan(serializer_class):
+    modelo = serializer_class.Meta.model
+    valores = getattr(serializer_class, 'valores_lectura', {})
+    plan = []
+    for nombre, campo in serializer_class(context={}).fields.items():
+        if campo.write_only:
+            continue
+        if nombre in valores:
+            ruta, convertir = valores[nombre] if isinstance(valores[nombre], tuple) else (valores[nombre], None)
+            plan.append(Campo(nombre, ruta, convertir))
+        elif isinstance(campo, serializers.ListSerializer):
+            relacion = modelo._meta.get_field(campo.source)
+            plan_hijo = plan_de(type(campo.child))
+            if not isinstance(relacion, ManyToOneRel) or plan_hijo is None:
+                raise SinPlan(nombre)
+            plan.append(Anidado(nombre, relacion, plan_hijo))
+        elif (campo.source == '*' or isinstance(campo, (serializers.BaseSerializer, ManyRelatedField,
+                                                          serializers.SerializerMethodField))):
+            raise SinPlan(nombre)
+        elif hasattr(campo, 'desde_valor'):
+            # Campos propios que saben convertir el valor crudo (p. ej. DerivadoField)
+            plan.append(Campo(nombre, campo.source, con_request=campo.desde_valor))
+        elif isinstance(campo, RelatedField):
+            # PrimaryKeyRelatedField: el lookup del FK en values() ya es el pk
+            if not isinstance(campo, PrimaryKeyRelatedField):
+                raise SinPlan(nombre)
+            plan.append(Campo(nombre, campo.source.replace('.', '__')))
+        elif isinstance(campo, serializers.FileField):
+            if getattr(campo, 'use_url', api_settings.UPLOADED_FILES_USE_URL):
+                plan.append(Campo(nombre, campo.source, con_request=url_archivo(modelo._meta.get_field(campo.source).storage)))
+            else:
+                plan.append(Campo(nombre, campo.source, lambda nombre: nombre or None))
+        else:
+            convertir = None if isinstance(campo, IDENTIDAD) else campo.to_representation
+            plan.append(Campo(nombre, campo.source.replace('.', '__'), convertir))
+    return plan
+
+
+def url_archivo(storage):
+    def url(nombre, request):
+        if not nombre:
+            return None
+        url = storage.url(nombre)
+        return request.build_absolute_uri(url) if request is not None else url
+    return url
+
+
+def conversion(campo, request):
+    if campo.con_request is None:
+        return campo.convertir
+    con_request = campo.con_request
+    return lambda valor: con_request(valor, request)
+
+
+def leer(plan, queryset, request=None, solicitados=None):
+    """
+    Lista de diccionarios con la misma forma que serializer(queryset, many=True).data.
+
+    `solicitados` filtra los campos igual que ?fields= (snake_case o camelCase).
+    """
+    return [item for _, item in filas_con_clave(plan, queryset, request, solicitados)]
+
+
+def filas_con_clave(plan, queryset, request=None, solicitados=None, clave='pk'):
+    # Devuelve (valor de `clave`, item): los anidados se agrupan por el FK al padre
+    if solicitados:
+        plan = [c for c in plan if c.nombre in solicitados or c.clave in solicitados]
+    planos = [c for c in plan if isinstance(c, Campo)]
+    # iterator(): en PostgreSQL lee por bloques con un cursor del lado del servidor
+    filas = list(
+        queryset.prefetch_related(None).values_list(clave, 'pk', *[c.ruta for c in planos]).iterator(chunk_size=LOTE_CURSOR)
+    )
+    columnas = {id(c): i for i, c in enumerate(planos, start=2)}
+
+    hijos = {}
+    ids = [fila[1] for fila in filas]
+    for c in plan:
+        if isinstance(c, Anidado):
+            hijos[c.clave] = leer_hijos(c, ids, request)
+
+    pasos = [
+        (c.clave, columnas[id(c)], conversion(c, request)) if isinstance(c, Campo) else (c.clave, None, hijos[c.clave])
+        for c in plan
+    ]
+    resultado = []
+    for fila in filas:
+        item = {}
+        for clave_salida, columna, convertir in pasos:
+            if columna is None:
+                item[clave_salida] = convertir.get(fila[1], [])
+            else:
+                valor = fila[columna]
+                item[clave_salida] = valor if valor is None or convertir is None else convertir(valor)
+        resultado.append((fila[0], item))
+    return resultado
+
+
+def leer_hijos(anidado, ids, request):
+    # Una consulta por lote de padres, en orden de pk como el prefetch
+    relacion = anidado.relacion
+    fk = relacion.field
+    agrupados = {}
+    for inicio in range(0, len(ids), LOTE_IDS):
+        queryset = relacion.related_model._default_manager.filter(
+            **{f'{fk.name}__in': ids[inicio:inicio + LOTE_IDS]}
+        ).order_by('pk')
+        for padre, item in filas_con_clave(anidado.plan, queryset, request, clave=fk.attname):
+            agrupados.setdefault(padre, []).append(item)
+    return agrupados
+
+
+def listar(serializer_class, queryset, request):
+    """Listado por la ruta rápida, o None si el serializer no tiene plan."""
+    plan = plan_de(serializer_class)
+    if plan is None:
+        return None
+    return leer(plan, queryset, request, campos_solicitados(request))
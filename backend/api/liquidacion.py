@@ -0,0 +1,145 @@
+"""
+Transferencia del sobrante de un mes y cierre de mes. Se ejecutan como
+tareas de la cola (api/tareas.py), no dentro del request.
+
+La transferencia bloquea el presupuesto, reparte el sobrante en memoria y
+escribe todo por lotes: el número de consultas no depende de cuántas
+deudas pendientes tenga el mes.
+"""
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import PresupuestoMensual, AhorroPresupuesto, DeudaPresupuesto, MovimientoPresupuesto
+from . import busqueda, saldos, sync
+
+LOTE = 500
+
+
+class ErrorLiquidacion(Exception):
+    pass
+
+
+def bloquear_presupuesto(presupuesto_id):
+    """
+    Toma el candado del presupuesto hasta el fin de la transacción, antes de
+    leer el sobrante: dos transferencias concurrentes no reparten el mismo
+    dinero. SQLite no tiene SELECT ... FOR UPDATE; ahí un UPDATE sin cambios
+    toma de entrada el candado de escritura de la base.
+    """
+    presupuestos = PresupuestoMensual.objects.filter(id=presupuesto_id)
+    if connection.features.has_select_for_update:
+        return presupuestos.select_for_update().exists()
+    return presupuestos.update(familia=F('familia')) > 0
+
+
+def asignar(sobrante, deudas):
+    """
+    Reparto en memoria: paga completas las deudas en orden hasta la primera
+    que no alcanza (ninguna deuda posterior se adelanta). Devuelve las deudas
+    a pagar y lo que va a ahorro, que solo existe si no quedan deudas pendientes.
+    """
+    pagadas = []
+    disponible = sobrante
+    for deuda in deudas:
+        if deuda.monto > disponible:
+            return pagadas, Decimal('0')
+        pagadas.append(deuda)
+        disponible -= deuda.monto
+    return pagadas, disponible
+
+
+@transaction.atomic
+def transferir_sobrante(presupuesto_id, usuario, orden=None):
+    """
+    `orden`: ids de deudas en orden de prioridad (un plan de api/plan_pagos.py);
+    las que no figuran van después, por fecha.
+    """
+    if not bloquear_presupuesto(presupuesto_id):
+        raise ErrorLiquidacion('Presupuesto no encontrado.')
+    # Totales y sobrante (aportes - gastos - deudas pagadas - ahorros) en una consulta, ya con el candado
+    presupuesto = PresupuestoMensual.objects.con_totales().get(id=presupuesto_id)
+    sobrante = presupuesto.sobrante
+    if sobrante <= 0:
+        raise ErrorLiquidacion('No hay sobrante para transferir.')
+
+    # Prioridad: pagar deudas no pagadas, luego ahorro
+    deudas = list(presupuesto.deudas.filter(pagado=False).order_by('fecha', 'id').only('id', 'presupuesto_id', 'monto', 'pagado'))
+    if orden:
+        posicion = {deuda_id: i for i, deuda_id in enumerate(orden)}
+        deudas.sort(key=lambda deuda: posicion.get(deuda.id, len(posicion)))
+    pagadas, monto_para_ahorro = asignar(sobrante, deudas)
+
+    anterior = saldos.contribucion(*pagadas)
+    ahora = timezone.now()
+    for deuda in pagadas:
+        deuda.pagado = True
+        deuda.fecha_pago = ahora
+    DeudaPresupuesto.objects.bulk_update(pagadas, ['pagado', 'fecha_pago'], batch_size=LOTE)
+    movimientos = [
+        MovimientoPresupuesto(
+            presupuesto=presupuesto,
+            tipo='deuda',
+            monto=deuda.monto,
+            usuario=usuario,
+            descripcion='Pago automático de deuda al transferir sobrante',
+            referencia_id=deuda.id
+        )
+        for deuda in pagadas
+    ]
+    # Transferir a ahorro si queda
+    ahorro = None
+    if monto_para_ahorro > 0:
+        ahorro = AhorroPresupuesto.objects.create(
+            presupuesto=presupuesto,
+            monto=monto_para_ahorro,
+            motivo='Ahorro automático por sobrante',
+            comentario='Transferencia automática de sobrante a ahorro'
+        )
+        movimientos.append(MovimientoPresupuesto(
+            presupuesto=presupuesto,
+            tipo='ahorro',
+            monto=monto_para_ahorro,
+            usuario=usuario,
+            descripcion='Transferencia automática de sobrante a ahorro',
+            referencia_id=ahorro.id
+        ))
+    MovimientoPresupuesto.objects.bulk_create(movimientos, batch_size=LOTE)
+    # bulk_update/bulk_create no disparan señales (el ahorro, creado con create(), sí)
+    saldos.actualizar(anterior, saldos.contribucion(*pagadas))
+    sync.registrar(pagadas + movimientos)
+    busqueda.indexar(movimientos)
+
+    pagado_en_deudas = sum((deuda.monto for deuda in pagadas), Decimal('0'))
+    return {
+        'sobranteTotal': sobrante,
+        'pagadoEnDeudas': pagado_en_deudas,
+        'ahorrado': monto_para_ahorro,
+        # Lo que no alcanzó para la próxima deuda queda como sobrante del mes
+        'sinAsignar': sobrante - pagado_en_deudas - monto_para_ahorro,
+        'movimientos': [{'deuda_id': deuda.id, 'pagado': deuda.monto} for deuda in pagadas],
+        'ahorroId': ahorro.id if ahorro else None
+    }
+
+
+@transaction.atomic
+def cerrar_mes(presupuesto_id, usuario):
+    if not bloquear_presupuesto(presupuesto_id):
+        raise ErrorLiquidacion('Presupuesto no encontrado.')
+    if PresupuestoMensual.objects.filter(id=presupuesto_id, cerrado=True).exists():
+        raise ErrorLiquidacion('El mes ya está cerrado.')
+    # Como antes: sin sobrante el mes se cierra igual y la transferencia informa el motivo
+    try:
+        transferencia = transferir_sobrante(presupuesto_id, usuario)
+    except ErrorLiquidacion as exc:
+        transferencia = {'detail': str(exc)}
+    fecha_cierre = timezone.now()
+    PresupuestoMensual.objects.filter(id=presupuesto_id).update(cerrado=True, fecha_cierre=fecha_cierre)
+    sync.registrar([PresupuestoMensual(id=presupuesto_id)])
+    return {
+        'mensaje': 'Mes cerrado. Sobrante transferido.',
+        'fechaCierre': fecha_cierre,
+        'transferencia': transferencia
+    }
@@ -0,0 +1,138 @@
+import json
+import multiprocessing
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import OperationalError, connection, connections, transaction
+
+from api import liquidacion
+from api.models import PresupuestoMensual
+
+# Con transacciones diferidas (SQLite por defecto) dos procesos que escriben a la vez
+# se encuentran con `database is locked` sin esperar: la familia se reintenta
+REINTENTOS_BLOQUEO = 8
+
+
+class Command(BaseCommand):
+    help = (
+        'Cierra todos los presupuestos abiertos hasta una fecha, de todas las familias. Las familias se reparten '
+        'entre procesos; dentro de cada una los meses se cierran en orden y en una sola transacción. '
+        'Escribe un informe JSON con los tiempos.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hasta', type=date.fromisoformat,
+                            help='Último mes a cerrar (AAAA-MM-DD). Por defecto, el mes anterior al actual.')
+        parser.add_argument('--familia', action='append', help='Solo estas familias (se puede repetir).')
+        parser.add_argument('--procesos', type=int,
+                            help='Procesos en paralelo. Por defecto, uno por CPU; en SQLite sin el perfil de '
+                                 'producción (transacciones IMMEDIATE), uno solo.')
+        parser.add_argument('--usuario', help='Usuario que figura en los movimientos generados.')
+        parser.add_argument('--informe', help='Archivo donde guardar el informe (por defecto, la salida estándar).')
+
+    def handle(self, *args, **options):
+        hasta = options['hasta'] or mes_anterior(date.today())
+        usuario_id = None
+        if options['usuario']:
+            usuario_id = User.objects.filter(username=options['usuario']).values_list('id', flat=True).first()
+            if usuario_id is None:
+                raise CommandError(f"No existe el usuario {options['usuario']}.")
+
+        abiertos = PresupuestoMensual.objects.filter(cerrado=False, fecha_mes__lte=hasta)
+        if options['familia']:
+            abiertos = abiertos.filter(familia__in=options['familia'])
+        por_familia = {}
+        for presupuesto_id, familia, fecha_mes in abiertos.order_by('familia', 'fecha_mes').values_list('id', 'familia', 'fecha_mes'):
+            por_familia.setdefault(familia, []).append((presupuesto_id, fecha_mes))
+
+        inicio = time.perf_counter()
+        procesos = max(1, min(options['procesos'] or procesos_por_defecto(), len(por_familia)))
+        if procesos == 1:
+            familias = [cerrar_familia(familia, ids, usuario_id) for familia, ids in por_familia.items()]
+        else:
+            # Cada proceso hijo abre su propia conexión
+            connections.close_all()
+            with ProcessPoolExecutor(procesos, mp_context=multiprocessing.get_context('fork')) as pool:
+                familias = list(pool.map(cerrar_familia, por_familia, por_familia.values(), [usuario_id] * len(por_familia)))
+
+        errores = [f for f in familias if f['estado'] == 'error']
+        informe = {
+            'hasta': hasta,
+            'procesos': procesos,
+            'segundos': round(time.perf_counter() - inicio, 3),
+            'familias': familias,
+            'totales': {
+                'familias': len(familias),
+                'mesesCerrados': sum(1 for f in familias if f['estado'] == 'ok' for m in f['meses'] if 'omitido' not in m),
+                'familiasConError': len(errores),
+            },
+        }
+        salida = json.dumps(informe, cls=DjangoJSONEncoder, ensure_ascii=False)
+        if options['informe']:
+            with open(options['informe'], 'w', encoding='utf-8') as archivo:
+                archivo.write(salida)
+        else:
+            self.stdout.write(salida)
+        if errores:
+            raise CommandError(f'{len(errores)} familia(s) no se pudieron cerrar; ver el informe.')
+
+
+def mes_anterior(dia):
+    return date(dia.year - 1, 12, 1) if dia.month == 1 else date(dia.year, dia.month - 1, 1)
+
+
+def procesos_por_defecto():
+    # Sin IMMEDIATE los escritores de SQLite no esperan el lock: en paralelo solo se reintentaría
+    if connection.vendor == 'sqlite' and connection.settings_dict.get('OPTIONS', {}).get('transaction_mode') != 'IMMEDIATE':
+        return 1
+    return multiprocessing.cpu_count()
+
+
+def bloqueada(exc):
+    return isinstance(exc, OperationalError) and 'locked' in str(exc)
+
+
+def cerrar_familia(familia, presupuestos, usuario_id):
+    # Todos los meses de la familia o ninguno: un error deshace la familia completa
+    inicio = time.perf_counter()
+    usuario = User.objects.filter(id=usuario_id).first() if usuario_id else None
+    for intento in range(1, REINTENTOS_BLOQUEO + 1):
+        meses = []
+        try:
+            cerrar_en_transaccion(presupuestos, usuario, meses)
+        except Exception as exc:
+            if bloqueada(exc) and intento < REINTENTOS_BLOQUEO:
+                # La transacción se deshizo entera: se repite la familia tras una espera al azar
+                time.sleep(random.uniform(0, 0.05 * 2 ** intento))
+                continue
+            return {'familia': familia, 'estado': 'error', 'error': f'{type(exc).__name__}: {exc}', 'meses': meses,
+                    'intentos': intento, 'segundos': round(time.perf_counter() - inicio, 3)}
+        return {'familia': familia, 'estado': 'ok', 'meses': meses, 'intentos': intento,
+                'segundos': round(time.perf_counter() - inicio, 3)}
+
+
+def cerrar_en_transaccion(presupuestos, usuario, meses):
+    with transaction.atomic():
+        for presupuesto_id, fecha_mes in presupuestos:
+            inicio_mes = time.perf_counter()
+            try:
+                resultado = liquidacion.cerrar_mes(presupuesto_id, usuario)
+            except liquidacion.ErrorLiquidacion as exc:
+                # Cerrado (o borrado) por otra vía desde que se armó la lista
+                meses.append({'presupuestoId': presupuesto_id, 'fechaMes': fecha_mes, 'omitido': str(exc)})
+                continue
+            transferencia = resultado['transferencia']
+            meses.append({
+                'presupuestoId': presupuesto_id,
+                'fechaMes': fecha_mes,
+                'pagadoEnDeudas': transferencia.get('pagadoEnDeudas'),
+                'ahorrado': transferencia.get('ahorrado'),
+                'sinAsignar': transferencia.get('sinAsignar'),
+                'detalle': transferencia.get('detail'),
+                'milisegundos': round((time.perf_counter() - inicio_mes) * 1000, 1),
+            })
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+
+from api.models import CambioSync
+
+
+class Command(BaseCommand):
+    help = 'Elimina de la bitácora de sync las entradas reemplazadas por una posterior del mismo objeto.'
+
+    def handle(self, *args, **options):
+        # Un cliente con cualquier cursor sigue recibiendo el estado final de cada objeto
+        ultimas = (
+            CambioSync.objects.values('modelo', 'objeto_id')
+            .annotate(ultima=Max('id')).values_list('ultima', flat=True)
+        )
+        eliminadas, _ = CambioSync.objects.exclude(id__in=ultimas).delete()
+        self.stdout.write(self.style.SUCCESS(f'{eliminadas} entrada(s) eliminadas.'))
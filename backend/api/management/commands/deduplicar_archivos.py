@@ -0,0 +1,122 @@
+import hashlib
+import os
+from collections import Counter
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import F
+
+from api.almacenamiento import borrar_al_confirmar, es_blob
+from api.models import ArchivoAlmacenado
+from api.signals import ARCHIVOS
+
+
+def referencias_de(nombre):
+    return sum(modelo.objects.filter(**{campo: nombre}).count() for modelo, campos in ARCHIVOS.items() for campo in campos)
+
+
+@transaction.atomic
+def recontar(pk):
+    """
+    Vuelve a contar las referencias del blob con su fila bloqueada: una subida
+    que suma una referencia espera al candado o lo tiene hasta su commit. Si
+    nadie lo usa lo borra (el archivo, después del commit) y devuelve su tamaño.
+    """
+    blobs = ArchivoAlmacenado.objects.filter(pk=pk)
+    # SQLite no tiene SELECT ... FOR UPDATE: un UPDATE sin cambios toma el candado de escritura, como en api/liquidacion.py
+    if connection.features.has_select_for_update:
+        blob = blobs.select_for_update().first()
+    else:
+        blob = blobs.first() if blobs.update(referencias=F('referencias')) else None
+    if blob is None:
+        return 0
+    referencias = referencias_de(blob.nombre)
+    if referencias:
+        blobs.update(referencias=referencias)
+        return 0
+    blob.delete()
+    borrar_al_confirmar(blob, default_storage)
+    return blob.tamano
+
+
+def sha256_de(ruta):
+    sha256 = hashlib.sha256()
+    with open(ruta, 'rb') as archivo:
+        for chunk in iter(lambda: archivo.read(1024 * 1024), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+class Command(BaseCommand):
+    help = ('Pasa los archivos subidos antes del almacén deduplicado a blobs por contenido, '
+            'recalcula las referencias y borra los blobs sin uso. Informa el espacio recuperado.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--simular', action='store_true', help='Solo informa, sin mover ni borrar archivos.')
+
+    def handle(self, *args, **options):
+        simular = options['simular']
+        migrados, faltantes, recuperado = 0, 0, 0
+        hashes = {}
+        # Ruta anterior -> blob: varias filas pueden apuntar al mismo archivo, que se borra al migrar la primera
+        por_ruta = {}
+        for modelo, campos in ARCHIVOS.items():
+            for campo in campos:
+                filas = (
+                    modelo.objects.exclude(**{campo: ''}).exclude(**{f'{campo}__isnull': True})
+                    .exclude(**{f'{campo}__startswith': 'blobs/'}).values_list('pk', campo)
+                )
+                for pk, nombre in filas.iterator():
+                    if nombre in por_ruta:
+                        migrados += 1
+                        if not simular:
+                            modelo.objects.filter(pk=pk).update(**{campo: por_ruta[nombre]})
+                        continue
+                    ruta = default_storage.path(nombre)
+                    if not os.path.exists(ruta):
+                        faltantes += 1
+                        self.stdout.write(f'{modelo.__name__} #{pk}: no existe {nombre}')
+                        continue
+                    tamano = os.path.getsize(ruta)
+                    sha256 = sha256_de(ruta)
+                    migrados += 1
+                    if sha256 in hashes or ArchivoAlmacenado.objects.filter(sha256=sha256).exists():
+                        recuperado += tamano
+                    hashes[sha256] = True
+                    if simular:
+                        por_ruta[nombre] = None
+                        continue
+                    # referencias=0: el recuento de abajo deja el valor definitivo
+                    with transaction.atomic():
+                        blob = default_storage.guardar_blob(ruta, sha256, os.path.splitext(nombre)[1].lower(), tamano, referencias=0)
+                        modelo.objects.filter(pk=pk).update(**{campo: blob})
+                    por_ruta[nombre] = blob
+                    if os.path.exists(ruta):
+                        os.remove(ruta)
+
+        if simular:
+            self.stdout.write(self.style.SUCCESS(
+                f'{migrados} archivo(s) por migrar, {faltantes} faltante(s); se recuperarían {recuperado / 1024 / 1024:.1f} MB.'
+            ))
+            return
+
+        # Referencias según las filas para elegir qué blobs revisar; como las subidas siguen mientras tanto,
+        # cada uno se vuelve a contar bloqueado antes de corregirlo o borrarlo
+        usos = Counter()
+        for modelo, campos in ARCHIVOS.items():
+            for campo in campos:
+                usos.update(n for n in modelo.objects.values_list(campo, flat=True) if es_blob(n))
+        huerfanos = 0
+        for pk, nombre, referencias in ArchivoAlmacenado.objects.values_list('pk', 'nombre', 'referencias').iterator():
+            if referencias and usos.get(nombre, 0) == referencias:
+                continue
+            tamano = recontar(pk)
+            if tamano:
+                huerfanos += 1
+                recuperado += tamano
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{migrados} archivo(s) migrados, {faltantes} faltante(s), {huerfanos} blob(s) sin uso eliminados; '
+            f'{recuperado / 1024 / 1024:.1f} MB recuperados.'
+        ))
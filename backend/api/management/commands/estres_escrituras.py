@@ -0,0 +1,96 @@
+import json
+import logging
+import multiprocessing
+import time
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, connections
+from rest_framework.test import APIClient
+
+from api.models import Cuenta, Pago, Proveedor, PresupuestoMensual
+
+
+class Command(BaseCommand):
+    help = ('Prueba de estrés: varios procesos (como los workers de gunicorn) registran pagos a la vez por '
+            'la API, cada uno también crea su GastoPresupuesto y actualiza el saldo, mientras leen el listado '
+            'de cuentas e importan cuentas; se cuentan los errores "database is locked". Escribe en la base configurada: '
+            'usar con FAMILION_SQLITE_NAME apuntando a una copia.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--procesos', type=int, default=8)
+        parser.add_argument('--pagos', type=int, default=25, help='Pagos por proceso.')
+
+    def handle(self, *args, **options):
+        procesos, por_proceso = options['procesos'], options['pagos']
+        proveedor = Proveedor.objects.create(nombre='Estrés', categoria='estres')
+        PresupuestoMensual.objects.get_or_create(familia='estres', fecha_mes=date(2000, 1, 1), defaults={'monto_objetivo': 0})
+        usuarios = [User.objects.create_user(f'estres_{time.time_ns()}_{i}') for i in range(procesos)]
+        cuentas = [
+            Cuenta.objects.create(monto=por_proceso * 10, proveedor=proveedor, creador=u, categoria='estres',
+                                  fecha_vencimiento=date(2000, 1, 15))
+            for u in usuarios
+        ]
+        pagos_antes = Pago.objects.filter(cuenta__in=cuentas).count()
+        # Cada proceso hijo abre su propia conexión
+        connections.close_all()
+
+        contexto = multiprocessing.get_context('fork')
+        barrera = contexto.Barrier(procesos)
+        resultados = contexto.Queue()
+        inicio = time.perf_counter()
+        trabajadores = [
+            contexto.Process(target=escribir, args=(usuario.pk, cuenta.pk, por_proceso, barrera, resultados))
+            for usuario, cuenta in zip(usuarios, cuentas)
+        ]
+        for t in trabajadores:
+            t.start()
+        bloqueos, otros = 0, 0
+        for _ in trabajadores:
+            b, o = resultados.get()
+            bloqueos, otros = bloqueos + b, otros + o
+        for t in trabajadores:
+            t.join()
+        duracion = time.perf_counter() - inicio
+
+        self.stdout.write(json.dumps({
+            'perfil': 'produccion' if connection.settings_dict.get('PRAGMAS') else 'por defecto',
+            'procesos': procesos,
+            'intentos': procesos * por_proceso,
+            'pagosGuardados': Pago.objects.filter(cuenta__in=cuentas).count() - pagos_antes,
+            'erroresBloqueo': bloqueos,
+            'otrosErrores': otros,
+            'segundos': round(duracion, 2),
+        }))
+
+
+def escribir(usuario_id, cuenta_id, pagos, barrera, resultados):
+    bloqueos, otros = 0, 0
+    # Los errores se cuentan aquí; sin el traceback de cada uno en la salida
+    logging.getLogger('django.request').setLevel(logging.CRITICAL)
+    cliente = APIClient()
+    cliente.force_authenticate(User.objects.get(pk=usuario_id))
+    barrera.wait()
+    for _ in range(pagos):
+        for pedido in (
+            lambda: cliente.post('/api/pagos/', {
+                'cuenta': cuenta_id, 'monto_pagado': '1', 'fecha_pago': '2000-01-15',
+            }, format='json'),
+            lambda: cliente.get('/api/cuentas/?categoria=estres'),
+            # Importación: transacción que primero lee (proveedores, usuarios) y después escribe
+            lambda: cliente.post('/api/cuentas/importar/', [{
+                'proveedor': 'Estrés', 'categoria': 'estres', 'monto': '10', 'fecha_vencimiento': '2000-01-20',
+                'monto_pagado': '5',
+            }], format='json'),
+        ):
+            try:
+                if pedido().status_code >= 400:
+                    otros += 1
+            except OperationalError as error:
+                if 'locked' in str(error):
+                    bloqueos += 1
+                else:
+                    otros += 1
+    connections.close_all()
+    resultados.put((bloqueos, otros))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from api import derivados
+from api.models import ArchivoAlmacenado
+
+
+class Command(BaseCommand):
+    help = 'Genera las miniaturas y vistas previas que falten para los archivos ya almacenados.'
+
+    def handle(self, *args, **options):
+        nombres = [n for n in ArchivoAlmacenado.objects.values_list('nombre', flat=True) if derivados.soportado(n)]
+        for futuro in [derivados.pool().submit(derivados.generar, nombre) for nombre in nombres]:
+            futuro.result()
+        self.stdout.write(self.style.SUCCESS(f'{len(nombres)} archivo(s) procesados.'))
@@ -0,0 +1,38 @@
+import json
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from api.importacion import ErrorImportacion, filas_csv, filas_json, importar
+
+
+class Command(BaseCommand):
+    help = 'Importa cuentas y pagos desde un CSV (formato de la exportación) o un archivo JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help='Ruta al archivo .csv o .json')
+        parser.add_argument('--usuario', required=True, help='Usuario que figura como creador cuando la fila no trae uno.')
+
+    def handle(self, *args, **options):
+        try:
+            usuario = User.objects.get(username=options['usuario'])
+        except User.DoesNotExist:
+            raise CommandError(f"No existe el usuario {options['usuario']}")
+
+        inicio = time.perf_counter()
+        with open(options['archivo'], encoding='utf-8-sig') as archivo:
+            try:
+                if options['archivo'].lower().endswith('.json'):
+                    resultado = importar(filas_json(json.load(archivo)), usuario)
+                else:
+                    resultado = importar(filas_csv(archivo), usuario)
+            except ErrorImportacion as e:
+                for error in e.errores:
+                    self.stderr.write(f"Fila {error['fila']}: {error['errores']}")
+                raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{resultado['cuentas']} cuentas, {resultado['pagos']} pagos y {resultado['gastos']} gastos importados "
+            f"({resultado['proveedoresCreados']} proveedores nuevos) en {time.perf_counter() - inicio:.1f} s."
+        ))
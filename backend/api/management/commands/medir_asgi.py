@@ -0,0 +1,166 @@
+import asyncio
+import json
+import os
+import shutil
+import socket
+import subprocess
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.models import Aporte, Cuenta, DeudaPresupuesto, GastoPresupuesto, PresupuestoMensual, Proveedor
+
+# (nombre, ruta WSGI/DRF, ruta ASGI); {presupuesto} se completa con el presupuesto de prueba
+RUTAS = [
+    ('historial', '/api/cuentas/?estado=pendiente', '/api/asinc/historial/?estado=pendiente'),
+    ('resumen', '/api/presupuestos/{presupuesto}/resumen/', '/api/asinc/presupuestos/{presupuesto}/resumen/'),
+    ('usuarios', '/api/usuarios/', '/api/asinc/usuarios/'),
+    ('proveedores', '/api/proveedores-por-categoria/?categoria=servicios', '/api/asinc/proveedores-por-categoria/?categoria=servicios'),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara la latencia (p50/p99) de los endpoints de lectura servidos por gunicorn (WSGI, vistas DRF) '
+        'y por uvicorn (ASGI, api/asincrono.py) con muchos clientes concurrentes. Escribe datos de prueba: '
+        'usar sobre una base temporal (FAMILION_SQLITE_NAME).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clientes', type=int, default=50, help='Clientes concurrentes (por defecto 50).')
+        parser.add_argument('--pedidos', type=int, default=40, help='Pedidos por cliente y servidor.')
+        parser.add_argument('--workers', type=int, default=2, help='Procesos de cada servidor.')
+        parser.add_argument('--hilos', type=int, default=8, help='Hilos por worker de gunicorn.')
+        parser.add_argument('--cuentas', type=int, default=300, help='Cuentas de prueba a asegurar.')
+        parser.add_argument('--puerto', type=int, default=8701)
+
+    def handle(self, *args, **options):
+        for programa in ('gunicorn', 'uvicorn'):
+            if shutil.which(programa) is None:
+                raise CommandError(f'{programa} no está instalado.')
+        presupuesto = self.preparar_datos(options['cuentas'])
+        token = str(RefreshToken.for_user(User.objects.get(username='medicion')).access_token)
+        rutas = [(nombre, wsgi.format(presupuesto=presupuesto), asgi.format(presupuesto=presupuesto))
+                 for nombre, wsgi, asgi in RUTAS]
+
+        servidores = {
+            'wsgi': ['gunicorn', 'backend.wsgi:application', '--workers', str(options['workers']),
+                     '--threads', str(options['hilos']), '--bind', f"127.0.0.1:{options['puerto']}"],
+            'asgi': ['uvicorn', 'backend.asgi:application', '--workers', str(options['workers']),
+                     '--port', str(options['puerto'] + 1), '--no-access-log'],
+        }
+        resultado = {'clientes': options['clientes'], 'pedidosPorCliente': options['pedidos'], 'servidores': {}}
+        for indice, (modo, comando) in enumerate(servidores.items()):
+            puerto = options['puerto'] + indice
+            caminos = [wsgi if modo == 'wsgi' else asgi for _, wsgi, asgi in rutas]
+            proceso = subprocess.Popen(comando + ['--log-level', 'warning'], cwd=settings.BASE_DIR, env=os.environ.copy())
+            try:
+                self.esperar_servidor(puerto)
+                asyncio.run(self.cargar(puerto, caminos[:1], token, 5, 2))  # calentamiento
+                latencias, duracion, errores = asyncio.run(
+                    self.cargar(puerto, caminos, token, options['clientes'], options['pedidos'])
+                )
+            finally:
+                proceso.terminate()
+                proceso.wait(timeout=30)
+            resultado['servidores'][modo] = self.resumir(latencias, duracion, errores, [r[0] for r in rutas])
+
+        for modo, datos in resultado['servidores'].items():
+            self.stdout.write(f"{modo}: {datos['pedidosPorSegundo']} pedidos/s, errores {datos['errores']}")
+            for nombre, percentiles in datos['porRuta'].items():
+                self.stdout.write(f"  {nombre:12} p50 {percentiles['p50']:8.1f} ms   p99 {percentiles['p99']:8.1f} ms")
+        self.stdout.write(json.dumps(resultado))
+
+    def preparar_datos(self, cantidad):
+        usuario, _ = User.objects.get_or_create(username='medicion')
+        proveedores = [
+            Proveedor.objects.get_or_create(nombre=f'Medición {i}', defaults={'categoria': categoria})[0]
+            for i, categoria in enumerate(['servicios', 'alimentacion', 'hogar'])
+        ]
+        existentes = Cuenta.objects.filter(creador=usuario).count()
+        Cuenta.objects.bulk_create([
+            Cuenta(
+                proveedor=proveedores[i % 3], categoria=proveedores[i % 3].categoria, creador=usuario,
+                monto=Decimal('100.00') + i, fecha_vencimiento=date(2024, 1, 1) + timedelta(days=i % 700),
+            )
+            for i in range(existentes, cantidad)
+        ])
+        presupuesto, creado = PresupuestoMensual.objects.get_or_create(
+            familia='medicion', fecha_mes=date(2024, 1, 1), defaults={'monto_objetivo': 1000}
+        )
+        if creado:
+            for i in range(50):
+                Aporte.objects.create(presupuesto=presupuesto, usuario=usuario, monto=10 + i)
+                GastoPresupuesto.objects.create(presupuesto=presupuesto, monto=5 + i, pagado_por=usuario)
+                DeudaPresupuesto.objects.create(
+                    presupuesto=presupuesto, monto=3 + i, motivo='medición', categoria=f'cat{i % 5}', pagado=i % 2 == 0
+                )
+        return presupuesto.pk
+
+    def esperar_servidor(self, puerto, limite=30):
+        fin = time.monotonic() + limite
+        while time.monotonic() < fin:
+            try:
+                socket.create_connection(('127.0.0.1', puerto), timeout=1).close()
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError(f'El servidor no respondió en el puerto {puerto}.')
+
+    async def cargar(self, puerto, caminos, token, clientes, pedidos):
+        latencias = {camino: [] for camino in caminos}
+        errores = 0
+
+        async def cliente(numero):
+            nonlocal errores
+            for i in range(pedidos):
+                camino = caminos[(numero + i) % len(caminos)]
+                inicio = time.perf_counter()
+                try:
+                    estado = await self.pedir(puerto, camino, token)
+                except OSError:
+                    estado = None
+                if estado == 200:
+                    latencias[camino].append((time.perf_counter() - inicio) * 1000)
+                else:
+                    errores += 1
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(cliente(n) for n in range(clientes)))
+        return list(latencias.values()), time.perf_counter() - inicio, errores
+
+    async def pedir(self, puerto, camino, token):
+        # HTTP/1.1 mínimo, una conexión por pedido (como un cliente sin keep-alive)
+        lector, escritor = await asyncio.open_connection('127.0.0.1', puerto)
+        escritor.write((
+            f'GET {camino} HTTP/1.1\r\nHost: 127.0.0.1\r\nAuthorization: Bearer {token}\r\n'
+            'Accept: application/json\r\nConnection: close\r\n\r\n'
+        ).encode())
+        await escritor.drain()
+        estado = int((await lector.readline()).split()[1])
+        await lector.read()
+        escritor.close()
+        await escritor.wait_closed()
+        return estado
+
+    def resumir(self, latencias, duracion, errores, nombres):
+        def percentil(valores, p):
+            valores = sorted(valores)
+            return round(valores[min(len(valores) - 1, int(len(valores) * p))], 1) if valores else 0.0
+
+        todas = [valor for lista in latencias for valor in lista]
+        por_ruta = {
+            nombre: {'p50': percentil(lista, 0.50), 'p99': percentil(lista, 0.99), 'pedidos': len(lista)}
+            for nombre, lista in zip(nombres, latencias)
+        }
+        por_ruta['total'] = {'p50': percentil(todas, 0.50), 'p99': percentil(todas, 0.99), 'pedidos': len(todas)}
+        return {
+            'pedidosPorSegundo': round(len(todas) / duracion, 1) if duracion else 0.0,
+            'errores': errores,
+            'porRuta': por_ruta,
+        }
@@ -0,0 +1,87 @@
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api import lectura
+from api.models import Cuenta, Pago, Proveedor, PresupuestoMensual, MovimientoPresupuesto
+from api.renderers import JSONRapidoRenderer
+from api.serializers import CuentaSerializer, MovimientoPresupuestoSerializer
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Microbenchmark del listado de cuentas y movimientos: serializer + JSONRenderer de DRF '
+            'contra la ruta de lectura rápida + JSONRapidoRenderer. Los datos de prueba se descartan al terminar.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filas', type=int, default=5000)
+        parser.add_argument('--repeticiones', type=int, default=3)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.medir(options['filas'], options['repeticiones'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def medir(self, filas, repeticiones):
+        usuario = User.objects.create_user('bench_serializacion')
+        proveedor = Proveedor.objects.create(nombre='Bench', categoria='bench')
+        presupuesto = PresupuestoMensual.objects.create(familia='bench', fecha_mes=date(1999, 1, 1), monto_objetivo=0)
+        cuentas = Cuenta.objects.bulk_create([
+            Cuenta(nombre=f'Cuenta {i}', monto=100 + i, proveedor=proveedor, creador=usuario, categoria='bench',
+                   fecha_vencimiento=date(1999, 1, 1) + timedelta(days=i % 365), descripcion='Cuenta de prueba')
+            for i in range(filas)
+        ])
+        Pago.objects.bulk_create([
+            Pago(cuenta=c, monto_pagado=50, fecha_pago=c.fecha_vencimiento, usuario=usuario) for c in cuentas
+        ])
+        MovimientoPresupuesto.objects.bulk_create([
+            MovimientoPresupuesto(presupuesto=presupuesto, tipo='gasto', monto=10 + i, usuario=usuario, descripcion='Movimiento')
+            for i in range(filas)
+        ])
+
+        request = Request(APIRequestFactory().get('/api/'))
+        casos = [
+            ('cuentas', CuentaSerializer, lambda: (
+                Cuenta.objects.con_totales().select_related('proveedor', 'creador')
+                .prefetch_related('pagos__usuario').filter(creador=usuario)
+            )),
+            ('movimientos', MovimientoPresupuestoSerializer, lambda: (
+                MovimientoPresupuesto.objects.select_related('usuario').filter(presupuesto=presupuesto)
+            )),
+        ]
+        for nombre, serializer_class, queryset in casos:
+            def normal():
+                datos = serializer_class(queryset(), many=True, context={'request': request}).data
+                return JSONRenderer().render(datos)
+
+            def rapido():
+                return JSONRapidoRenderer().render(lectura.listar(serializer_class, queryset(), request))
+
+            t_normal, salida_normal = self.cronometrar(normal, repeticiones)
+            t_rapido, salida_rapida = self.cronometrar(rapido, repeticiones)
+            igual = 'idéntica' if salida_normal == salida_rapida else 'DISTINTA'
+            self.stdout.write(
+                f'{nombre} ({filas} filas): serializer {t_normal * 1000:.0f} ms, '
+                f'lectura rápida {t_rapido * 1000:.0f} ms, x{t_normal / t_rapido:.1f}; salida {igual}'
+            )
+
+    def cronometrar(self, funcion, repeticiones):
+        mejor, salida = None, None
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            salida = funcion()
+            duracion = time.perf_counter() - inicio
+            mejor = duracion if mejor is None else min(mejor, duracion)
+        return mejor, salida
@@ -0,0 +1,41 @@
+import os
+import signal
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api import tareas
+
+
+class Command(BaseCommand):
+    help = (
+        'Worker de la cola de tareas (cerrar mes, transferir sobrante, cuotas de deudas). '
+        'Corre hasta recibir SIGTERM/SIGINT; con --una-vez procesa lo pendiente y termina.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--una-vez', action='store_true', help='Vacía la cola y termina (cron, tests).')
+        parser.add_argument('--intervalo', type=float, default=1.0, help='Segundos de espera cuando no hay tareas.')
+
+    def handle(self, *args, **options):
+        trabajador = f'{socket.gethostname()}:{os.getpid()}'
+        if options['una_vez']:
+            procesadas = tareas.procesar(trabajador=trabajador)
+            self.stdout.write(self.style.SUCCESS(f'{procesadas} tarea(s) procesadas.'))
+            return
+
+        detener = []
+        # Termina la tarea en curso antes de salir
+        for senal in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(senal, lambda *_: detener.append(True))
+        self.stdout.write(f'Worker {trabajador} esperando tareas...')
+        while not detener:
+            close_old_connections()
+            tarea = tareas.reclamar(trabajador)
+            if tarea is None:
+                time.sleep(options['intervalo'])
+                continue
+            tarea = tareas.ejecutar(tarea)
+            self.stdout.write(f'Tarea {tarea.pk} ({tarea.tipo}): {tarea.estado}')
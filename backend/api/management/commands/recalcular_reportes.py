@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api import reportes
+from api.models import ResumenMensual
+
+CAMPOS = [f'{medida}_{tipo}' for tipo in reportes.TIPOS for medida in ('total', 'cantidad')]
+
+
+class Command(BaseCommand):
+    help = (
+        'Reconstruye ResumenMensual (totales de reportes) desde cuentas, pagos y gastos o, con --verificar, '
+        'informa las diferencias sin escribir.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verificar', action='store_true', help='Solo compara los totales guardados con los calculados.')
+
+    def handle(self, *args, **options):
+        if options['verificar']:
+            guardados = {tuple(getattr(r, c) for c in reportes.CLAVE): r for r in ResumenMensual.objects.all()}
+            diferencias = 0
+            for calculado in reportes.calcular():
+                clave = tuple(getattr(calculado, c) for c in reportes.CLAVE)
+                guardado = guardados.pop(clave, None) or ResumenMensual()
+                for campo in CAMPOS:
+                    esperado, actual = getattr(calculado, campo), getattr(guardado, campo)
+                    if esperado != actual:
+                        diferencias += 1
+                        self.stdout.write(f'{formato(clave)}: {campo} = {actual}, esperado {esperado}')
+            # Filas guardadas que ya no corresponden a ningún registro deberían estar en cero
+            for clave, guardado in guardados.items():
+                for campo in CAMPOS:
+                    if getattr(guardado, campo):
+                        diferencias += 1
+                        self.stdout.write(f'{formato(clave)}: {campo} = {getattr(guardado, campo)}, esperado 0')
+            if diferencias:
+                self.stdout.write(self.style.ERROR(f'{diferencias} diferencia(s) encontradas.'))
+            else:
+                self.stdout.write(self.style.SUCCESS('Todos los totales coinciden.'))
+            return
+
+        with transaction.atomic():
+            reconstruidos = reportes.reconstruir()
+        self.stdout.write(self.style.SUCCESS(f'{len(reconstruidos)} fila(s) de resumen reconstruidas.'))
+
+
+def formato(clave):
+    familia, mes, categoria, proveedor, usuario = clave
+    return f'{familia} {mes:%Y-%m} categoría={categoria!r} proveedor={proveedor} usuario={usuario}'
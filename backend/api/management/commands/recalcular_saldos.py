@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api import saldos
+from api.models import SaldoPresupuesto
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye SaldoPresupuesto desde cero o, con --verificar, informa las diferencias sin escribir.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verificar', action='store_true', help='Solo compara los saldos guardados con los calculados.')
+
+    def handle(self, *args, **options):
+        if options['verificar']:
+            guardados = {s.presupuesto_id: s for s in SaldoPresupuesto.objects.all()}
+            diferencias = 0
+            for calculado in saldos.calcular():
+                guardado = guardados.get(calculado.presupuesto_id)
+                if guardado is None:
+                    diferencias += 1
+                    self.stdout.write(f'Presupuesto {calculado.presupuesto_id}: sin saldo guardado')
+                    continue
+                for campo in saldos.CAMPOS:
+                    esperado, actual = getattr(calculado, campo), getattr(guardado, campo)
+                    if esperado != actual:
+                        diferencias += 1
+                        self.stdout.write(f'Presupuesto {calculado.presupuesto_id}: {campo} = {actual}, esperado {esperado}')
+            if diferencias:
+                self.stdout.write(self.style.ERROR(f'{diferencias} diferencia(s) encontradas.'))
+            else:
+                self.stdout.write(self.style.SUCCESS('Todos los saldos coinciden.'))
+            return
+
+        with transaction.atomic():
+            reconstruidos = saldos.reconstruir()
+        self.stdout.write(self.style.SUCCESS(f'{len(reconstruidos)} saldo(s) reconstruidos.'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api import busqueda
+
+
+class Command(BaseCommand):
+    help = 'Rehace los documentos de /api/buscar/ desde cuentas, deudas y movimientos, y el índice de texto.'
+
+    def handle(self, *args, **options):
+        total = busqueda.reconstruir()
+        self.stdout.write(self.style.SUCCESS(f'{total} documento(s) indexados (búsqueda: {busqueda.motor()}).'))
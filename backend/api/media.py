@@ -0,0 +1,144 @@
+"""
+Entrega de archivos subidos (reemplaza a django.conf.urls.static).
+
+- Acceso con el JWT/sesión del usuario o con la firma que agrega
+  AlmacenamientoDeduplicado.url(), para que <img>/<iframe> funcionen sin
+  cabecera Authorization. La firma vence a los
+  FAMILION_MEDIA_FIRMA_VIGENCIA segundos: un enlace filtrado no da acceso
+  para siempre.
+- ETag fuerte (el sha256 en los blobs; tamaño+mtime en archivos antiguos)
+  y 304 con If-None-Match. Los blobs no cambian nunca: se cachean como
+  inmutables.
+- Range de un tramo (206/416), respetando If-Range.
+- Con FAMILION_MEDIA_SENDFILE=x-sendfile|x-accel-redirect la transferencia
+  la hace el servidor de adelante (que también resuelve Range); si no,
+  FileResponse, que el servidor WSGI puede enviar con sendfile().
+- Los derivados (miniaturas, vistas previas) que falten se generan al
+  pedirlos, ver api/derivados.py.
+"""
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils.http import quote_etag
+from django.views.decorators.http import require_safe
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from . import derivados
+from .almacenamiento import es_blob, firma_valida
+
+RANGO = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def acceso_permitido(request, nombre):
+    recibida = request.GET.get('firma')
+    if recibida and firma_valida(nombre, recibida):
+        return True
+    if request.user.is_authenticated:
+        return True
+    try:
+        return JWTAuthentication().authenticate(request) is not None
+    except AuthenticationFailed:
+        return False
+
+
+def etag_de(nombre, stat):
+    if es_blob(nombre):
+        return quote_etag(os.path.splitext(os.path.basename(nombre))[0])
+    return quote_etag(f'{stat.st_size:x}-{stat.st_mtime_ns:x}')
+
+
+def tramo(cabecera, tamano):
+    """(inicio, fin) inclusive del Range pedido, None si no aplica, o False si no se puede satisfacer."""
+    coincidencia = RANGO.match(cabecera.replace(' ', ''))
+    if not coincidencia:
+        return None  # Varios tramos u otra unidad: se responde el archivo completo
+    inicio, fin = coincidencia.groups()
+    if not inicio:
+        if not fin:
+            return None
+        inicio, fin = max(tamano - int(fin), 0), tamano - 1
+    else:
+        inicio, fin = int(inicio), min(int(fin), tamano - 1) if fin else tamano - 1
+    if inicio >= tamano or inicio > fin:
+        return False
+    return inicio, fin
+
+
+class TramoArchivo:
+    # Lectura limitada a un tramo; fileno() deja que el servidor WSGI use sendfile() desde la posición actual
+    def __init__(self, archivo, inicio, longitud):
+        archivo.seek(inicio)
+        self.archivo = archivo
+        self.restante = longitud
+
+    def read(self, size=-1):
+        size = self.restante if size < 0 else min(size, self.restante)
+        datos = self.archivo.read(size)
+        self.restante -= len(datos)
+        return datos
+
+    def fileno(self):
+        return self.archivo.fileno()
+
+    def close(self):
+        self.archivo.close()
+
+
+@require_safe
+def servir_media(request, nombre):
+    if not acceso_permitido(request, nombre):
+        return HttpResponse(status=401)
+    try:
+        ruta = default_storage.path(nombre)
+        if not os.path.exists(ruta) and (original := derivados.original_de(nombre)):
+            # Derivado que el pool todavía no generó
+            derivados.generar(original)
+        stat = os.stat(ruta)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404
+    if not os.path.isfile(ruta):
+        raise Http404
+
+    etag = etag_de(nombre, stat)
+    cabeceras = {
+        'ETag': etag,
+        'Accept-Ranges': 'bytes',
+        'Cache-Control': 'private, max-age=31536000, immutable' if es_blob(nombre) else 'private, no-cache',
+    }
+    if_none_match = request.headers.get('If-None-Match', '')
+    if etag in [e.strip() for e in if_none_match.split(',')] or if_none_match.strip() == '*':
+        return HttpResponse(status=304, headers=cabeceras)
+
+    tipo = mimetypes.guess_type(ruta)[0] or 'application/octet-stream'
+    modo = getattr(settings, 'FAMILION_MEDIA_SENDFILE', '')
+    if modo == 'x-accel-redirect':
+        response = HttpResponse(content_type=tipo, headers=cabeceras)
+        response['X-Accel-Redirect'] = settings.FAMILION_MEDIA_ACCEL_PREFIX + nombre
+        return response
+    if modo == 'x-sendfile':
+        response = HttpResponse(content_type=tipo, headers=cabeceras)
+        response['X-Sendfile'] = ruta
+        return response
+
+    rango = None
+    if 'Range' in request.headers and request.headers.get('If-Range', etag) == etag:
+        rango = tramo(request.headers['Range'], stat.st_size)
+    if rango is False:
+        cabeceras['Content-Range'] = f'bytes */{stat.st_size}'
+        return HttpResponse(status=416, headers=cabeceras)
+    if rango is None:
+        response = FileResponse(open(ruta, 'rb'), content_type=tipo, headers=cabeceras)
+    else:
+        inicio, fin = rango
+        longitud = fin - inicio + 1
+        response = FileResponse(TramoArchivo(open(ruta, 'rb'), inicio, longitud), content_type=tipo,
+                                status=206, headers=cabeceras)
+        response['Content-Range'] = f'bytes {inicio}-{fin}/{stat.st_size}'
+        response['Content-Length'] = longitud
+    return response
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:02
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def unificar_presupuestos_duplicados(apps, schema_editor):
+    # Antes de la restricción única: deja un solo presupuesto por (familia, mes)
+    # y mueve a él los registros de los duplicados
+    PresupuestoMensual = apps.get_model('api', 'PresupuestoMensual')
+    relacionados = ['Aporte', 'GastoPresupuesto', 'DeudaPresupuesto', 'AhorroPresupuesto', 'MovimientoPresupuesto']
+    duplicados = (
+        PresupuestoMensual.objects.values('familia', 'fecha_mes')
+        .annotate(total=Count('id'), conservar=Min('id'))
+        .filter(total__gt=1)
+    )
+    for grupo in duplicados:
+        sobrantes = PresupuestoMensual.objects.filter(
+            familia=grupo['familia'], fecha_mes=grupo['fecha_mes']
+        ).exclude(id=grupo['conservar'])
+        for nombre in relacionados:
+            apps.get_model('api', nombre).objects.filter(presupuesto__in=sobrantes).update(presupuesto_id=grupo['conservar'])
+        sobrantes.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_deudapresupuesto_categoria_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cuenta',
+            index=models.Index(fields=['fecha_vencimiento', 'id'], name='cuenta_venc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cuenta',
+            index=models.Index(fields=['categoria', 'fecha_vencimiento'], name='cuenta_cat_venc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deudapresupuesto',
+            index=models.Index(condition=models.Q(('pagado', False)), fields=['presupuesto', 'fecha'], name='deuda_pendiente_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movimientopresupuesto',
+            index=models.Index(fields=['presupuesto', 'tipo', 'fecha'], name='movimiento_pres_tipo_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pago',
+            index=models.Index(fields=['fecha_pago'], name='pago_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pago',
+            index=models.Index(fields=['cuenta', 'fecha_pago'], name='pago_cuenta_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='presupuestomensual',
+            index=models.Index(fields=['fecha_mes'], name='presupuesto_mes_idx'),
+        ),
+        migrations.RunPython(unificar_presupuestos_duplicados, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='presupuestomensual',
+            constraint=models.UniqueConstraint(fields=('familia', 'fecha_mes'), name='presupuesto_familia_mes_uniq'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def calcular_saldos(apps, schema_editor):
+    # Saldo inicial de los presupuestos existentes: una consulta agregada por tipo
+    PresupuestoMensual = apps.get_model('api', 'PresupuestoMensual')
+    SaldoPresupuesto = apps.get_model('api', 'SaldoPresupuesto')
+    fuentes = [
+        ('total_aportes', apps.get_model('api', 'Aporte'), {}),
+        ('total_gastos', apps.get_model('api', 'GastoPresupuesto'), {}),
+        ('total_ahorros', apps.get_model('api', 'AhorroPresupuesto'), {}),
+        ('total_deudas_pagadas', apps.get_model('api', 'DeudaPresupuesto'), {'pagado': True}),
+        ('total_deudas_no_pagadas', apps.get_model('api', 'DeudaPresupuesto'), {'pagado': False}),
+    ]
+    saldos = {pk: SaldoPresupuesto(presupuesto_id=pk) for pk in PresupuestoMensual.objects.values_list('id', flat=True)}
+    for campo, modelo, filtros in fuentes:
+        totales = modelo.objects.filter(**filtros).values('presupuesto').annotate(total=Sum('monto'))
+        for fila in totales:
+            setattr(saldos[fila['presupuesto']], campo, fila['total'])
+    SaldoPresupuesto.objects.bulk_create(saldos.values())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_indices_y_presupuesto_unico'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SaldoPresupuesto',
+            fields=[
+                ('presupuesto', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='saldo', serialize=False, to='api.presupuestomensual')),
+                ('total_aportes', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('total_gastos', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('total_ahorros', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('total_deudas_pagadas', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('total_deudas_no_pagadas', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(calcular_saldos, migrations.RunPython.noop),
+    ]
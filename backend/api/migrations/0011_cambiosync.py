@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:11
+
+from django.db import migrations, models
+
+MODELOS_SYNC = {
+    'cuentas': 'Cuenta',
+    'pagos': 'Pago',
+    'presupuestos': 'PresupuestoMensual',
+    'aportes': 'Aporte',
+    'gastos': 'GastoPresupuesto',
+    'deudas': 'DeudaPresupuesto',
+    'ahorros': 'AhorroPresupuesto',
+    'movimientos': 'MovimientoPresupuesto',
+    'pagosDeuda': 'PagoDeudaPresupuesto',
+}
+
+
+def registrar_existentes(apps, schema_editor):
+    # Los datos existentes entran a la bitácora como altas: un cliente con cursor 0 los recibe todos
+    CambioSync = apps.get_model('api', 'CambioSync')
+    for clave, nombre in MODELOS_SYNC.items():
+        ids = apps.get_model('api', nombre).objects.order_by('pk').values_list('pk', flat=True)
+        CambioSync.objects.bulk_create(
+            [CambioSync(modelo=clave, objeto_id=pk, operacion='upsert') for pk in ids.iterator()],
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_saldopresupuesto'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CambioSync',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modelo', models.CharField(max_length=30)),
+                ('objeto_id', models.BigIntegerField()),
+                ('operacion', models.CharField(choices=[('upsert', 'Creado o modificado'), ('delete', 'Eliminado')], max_length=10)),
+                ('fecha', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['modelo', 'objeto_id'], name='cambiosync_objeto_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_tarea'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='presupuestomensual',
+            name='cerrado',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='presupuestomensual',
+            name='fecha_cierre',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
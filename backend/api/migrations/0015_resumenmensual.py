@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_presupuesto_cierre'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenMensual',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('familia', models.CharField(max_length=100)),
+                ('mes', models.DateField()),
+                ('categoria', models.CharField(max_length=100)),
+                ('proveedor', models.BigIntegerField(default=0)),
+                ('usuario', models.BigIntegerField(default=0)),
+                ('total_cuentas', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('cantidad_cuentas', models.IntegerField(default=0)),
+                ('total_pagos', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('cantidad_pagos', models.IntegerField(default=0)),
+                ('total_gastos', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('cantidad_gastos', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('familia', 'mes', 'categoria', 'proveedor', 'usuario'), name='resumen_mensual_clave')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_resumenmensual'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deudapresupuesto',
+            name='tasa_interes',
+            field=models.DecimalField(decimal_places=2, default=0, help_text='Tasa de interés anual (%)', max_digits=5),
+        ),
+    ]
@@ -0,0 +1,108 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:56
+
+from django.db import migrations, models
+
+# Índice externo de api_documentobusqueda: FTS5 + triggers en SQLite, GIN en PostgreSQL (ver api/busqueda.py)
+SQLITE = [
+    """CREATE VIRTUAL TABLE api_documentobusqueda_fts USING fts5(
+        titulo, texto, content='api_documentobusqueda', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3')""",
+    """CREATE TRIGGER api_documentobusqueda_ai AFTER INSERT ON api_documentobusqueda BEGIN
+        INSERT INTO api_documentobusqueda_fts(rowid, titulo, texto) VALUES (new.id, new.titulo, new.texto);
+    END""",
+    """CREATE TRIGGER api_documentobusqueda_ad AFTER DELETE ON api_documentobusqueda BEGIN
+        INSERT INTO api_documentobusqueda_fts(api_documentobusqueda_fts, rowid, titulo, texto)
+        VALUES ('delete', old.id, old.titulo, old.texto);
+    END""",
+    """CREATE TRIGGER api_documentobusqueda_au AFTER UPDATE ON api_documentobusqueda BEGIN
+        INSERT INTO api_documentobusqueda_fts(api_documentobusqueda_fts, rowid, titulo, texto)
+        VALUES ('delete', old.id, old.titulo, old.texto);
+        INSERT INTO api_documentobusqueda_fts(rowid, titulo, texto) VALUES (new.id, new.titulo, new.texto);
+    END""",
+]
+SQLITE_REVERSA = [
+    'DROP TRIGGER IF EXISTS api_documentobusqueda_ai',
+    'DROP TRIGGER IF EXISTS api_documentobusqueda_ad',
+    'DROP TRIGGER IF EXISTS api_documentobusqueda_au',
+    'DROP TABLE IF EXISTS api_documentobusqueda_fts',
+]
+POSTGRESQL = [
+    """CREATE INDEX documento_busqueda_gin ON api_documentobusqueda USING GIN ((
+        setweight(to_tsvector('simple', titulo), 'A') || setweight(to_tsvector('simple', texto), 'B')))""",
+]
+POSTGRESQL_REVERSA = ['DROP INDEX IF EXISTS documento_busqueda_gin']
+
+
+def ejecutar(schema_editor, sentencias):
+    for sentencia in sentencias:
+        schema_editor.execute(sentencia)
+
+
+def crear_indice(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute('PRAGMA compile_options')
+            if 'ENABLE_FTS5' not in {fila[0] for fila in cursor.fetchall()}:
+                return  # Sin FTS5 la búsqueda usa LIKE
+        ejecutar(schema_editor, SQLITE)
+    elif vendor == 'postgresql':
+        ejecutar(schema_editor, POSTGRESQL)
+
+
+def borrar_indice(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        ejecutar(schema_editor, SQLITE_REVERSA)
+    elif vendor == 'postgresql':
+        ejecutar(schema_editor, POSTGRESQL_REVERSA)
+
+
+def indexar_existentes(apps, schema_editor):
+    # Documentos de los registros existentes (los triggers llenan el índice FTS5)
+    DocumentoBusqueda = apps.get_model('api', 'DocumentoBusqueda')
+    Cuenta = apps.get_model('api', 'Cuenta')
+    DeudaPresupuesto = apps.get_model('api', 'DeudaPresupuesto')
+    MovimientoPresupuesto = apps.get_model('api', 'MovimientoPresupuesto')
+    documentos = [
+        DocumentoBusqueda(tipo='cuenta', objeto_id=c.id, titulo=c.nombre or '', fecha=c.fecha_vencimiento,
+                          texto=' '.join(filter(None, [c.descripcion, c.categoria, c.proveedor.nombre])))
+        for c in Cuenta.objects.select_related('proveedor').iterator()
+    ]
+    documentos += [
+        DocumentoBusqueda(tipo='deuda', objeto_id=d.id, titulo=d.motivo, fecha=d.fecha.date() if d.fecha else None,
+                          texto=' '.join(filter(None, [d.comentario, d.categoria])))
+        for d in DeudaPresupuesto.objects.iterator()
+    ]
+    documentos += [
+        DocumentoBusqueda(tipo='movimiento', objeto_id=m.id, titulo=m.descripcion, fecha=m.fecha.date() if m.fecha else None,
+                          texto=m.get_tipo_display())
+        for m in MovimientoPresupuesto.objects.iterator()
+    ]
+    DocumentoBusqueda.objects.bulk_create(documentos, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_deuda_tasa_interes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentoBusqueda',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(max_length=20)),
+                ('objeto_id', models.BigIntegerField()),
+                ('titulo', models.TextField(blank=True)),
+                ('texto', models.TextField(blank=True)),
+                ('fecha', models.DateField(blank=True, null=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('tipo', 'objeto_id'), name='documento_busqueda_unico')],
+            },
+        ),
+        migrations.RunPython(crear_indice, borrar_indice),
+        migrations.RunPython(indexar_existentes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+from django.db import migrations
+
+# PostgreSQL: el índice GIN de la búsqueda, ahora sin acentos como FTS5 (ver api/busqueda.py)
+SIN_ACENTOS = "translate(lower({}), 'áàâäãéèêëíìîïóòôöõúùûüñç', 'aaaaaeeeeiiiiooooouuuunc')"
+CON_ACENTOS = """CREATE INDEX documento_busqueda_gin ON api_documentobusqueda USING GIN ((
+    setweight(to_tsvector('simple', titulo), 'A') || setweight(to_tsvector('simple', texto), 'B')))"""
+SIN_ACENTOS_INDICE = f"""CREATE INDEX documento_busqueda_gin ON api_documentobusqueda USING GIN ((
+    setweight(to_tsvector('simple', {SIN_ACENTOS.format('titulo')}), 'A')
+    || setweight(to_tsvector('simple', {SIN_ACENTOS.format('texto')}), 'B')))"""
+
+
+def recrear(sentencia):
+    def aplicar(apps, schema_editor):
+        if schema_editor.connection.vendor == 'postgresql':
+            schema_editor.execute('DROP INDEX IF EXISTS documento_busqueda_gin')
+            schema_editor.execute(sentencia)
+    return aplicar
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_documentobusqueda'),
+    ]
+
+    operations = [
+        migrations.RunPython(recrear(SIN_ACENTOS_INDICE), recrear(CON_ACENTOS)),
+    ]
@@ -1,7 +1,21 @@
-from django.db import models
+from django.db import models, router, transaction
+from django.db.models import Sum, Max, Value, F, Case, When
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
 import uuid
+from calendar import monthrange
 from datetime import datetime
+from decimal import Decimal
+
+class ArchivosAtomicosMixin:
+    # Al guardar, cada FileField suma su referencia en ArchivoAlmacenado (api/almacenamiento.py)
+    # antes del INSERT/UPDATE de la fila: en una transacción, si la fila no se guarda la
+    # referencia se deshace con ella
+    def save(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using') or router.db_for_write(type(self), instance=self)):
+            super().save(*args, **kwargs)
 
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
@@ -11,7 +25,30 @@ class Profile(models.Model):
     def __str__(self):
         return f"Perfil de {self.user.username} (Grupo: {self.group_id})"
 
-class Cuenta(models.Model):
+class CuentaQuerySet(models.QuerySet):
+    def con_totales(self):
+        # Monto pagado y fecha del último pago calculados en la misma consulta (sin N+1)
+        return self.annotate(
+            total_pagado=Coalesce(
+                Sum('pagos__monto_pagado'), Value(Decimal('0')),
+                output_field=models.DecimalField(max_digits=12, decimal_places=2)
+            ),
+            ultimo_pago=Max('pagos__fecha_pago'),
+        ).annotate(
+            estado_pago=Case(
+                When(total_pagado__gte=F('monto'), then=Value('pagada')),
+                When(total_pagado__gt=0, then=Value('parcial')),
+                default=Value('pendiente'),
+                output_field=models.CharField(),
+            ),
+            saldo_pendiente=Case(
+                When(total_pagado__gte=F('monto'), then=Value(Decimal('0'))),
+                default=F('monto') - F('total_pagado'),
+                output_field=models.DecimalField(max_digits=12, decimal_places=2),
+            ),
+        )
+
+class Cuenta(ArchivosAtomicosMixin, models.Model):
     monto = models.DecimalField(max_digits=10, decimal_places=2)
     proveedor = models.ForeignKey('Proveedor', on_delete=models.CASCADE, related_name='cuentas')
     fecha_emision = models.DateField(null=True, blank=True)  # Nuevo campo
@@ -24,20 +61,32 @@ class Cuenta(models.Model):
     fecha_actualizacion = models.DateTimeField(auto_now=True)
     nombre = models.CharField(max_length=100, blank=True)  # Nuevo campo
 
+    objects = CuentaQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Filtros por rango de vencimiento (historial, exportación) y orden del cursor
+            models.Index(fields=['fecha_vencimiento', 'id'], name='cuenta_venc_idx'),
+            models.Index(fields=['categoria', 'fecha_vencimiento'], name='cuenta_cat_venc_idx'),
+        ]
+
     def save(self, *args, **kwargs):
         # Si no se proporciona un nombre, lo genera automáticamente
         if not self.nombre:
-            # Usar fecha de vencimiento si existe, si no, fecha de emisión, si no, hoy
-            fecha = self.fecha_vencimiento or self.fecha_emision or datetime.today().date()
-            mes = fecha.strftime('%B').capitalize()  # Ej: 'Abril'
-            año = fecha.year
-            self.nombre = f"{self.categoria} / {mes} {año}"
+            self.nombre = self.nombre_por_defecto()
         super().save(*args, **kwargs)
 
+    def nombre_por_defecto(self):
+        # Usar fecha de vencimiento si existe, si no, fecha de emisión, si no, hoy
+        fecha = self.fecha_vencimiento or self.fecha_emision or datetime.today().date()
+        mes = fecha.strftime('%B').capitalize()  # Ej: 'Abril'
+        año = fecha.year
+        return f"{self.categoria} / {mes} {año}"
+
     def __str__(self):
         return self.nombre or f"Cuenta {self.pk}"
 
-class Pago(models.Model):
+class Pago(ArchivosAtomicosMixin, models.Model):
     cuenta = models.ForeignKey(Cuenta, on_delete=models.CASCADE, related_name='pagos')
     monto_pagado = models.DecimalField(max_digits=10, decimal_places=2)
     fecha_pago = models.DateField()
@@ -45,6 +94,13 @@ class Pago(models.Model):
     usuario = models.ForeignKey(User, on_delete=models.CASCADE)
     aporte = models.ForeignKey('Aporte', on_delete=models.SET_NULL, null=True, blank=True, related_name='pagos')  # Nuevo campo
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['fecha_pago'], name='pago_fecha_idx'),
+            # Último pago por cuenta (Max) sin tocar la tabla
+            models.Index(fields=['cuenta', 'fecha_pago'], name='pago_cuenta_fecha_idx'),
+        ]
+
     def __str__(self):
         nombre_cuenta = self.cuenta.nombre if self.cuenta and self.cuenta.nombre else f"Cuenta {self.cuenta_id}"
         fecha = self.fecha_pago.strftime('%d/%m/%Y') if self.fecha_pago else ''
@@ -60,16 +116,130 @@ class Proveedor(models.Model):
     def __str__(self):
         return f"{self.nombre} ({self.categoria})"
 
+def suma_por_presupuesto(modelo, **filtros):
+    # Subconsulta escalar: suma de `monto` de un modelo hijo para cada presupuesto
+    subconsulta = (
+        modelo.objects.filter(presupuesto=models.OuterRef('pk'), **filtros)
+        .order_by().values('presupuesto').annotate(total=Sum('monto')).values('total')
+    )
+    return Coalesce(
+        models.Subquery(subconsulta), Value(Decimal('0')),
+        output_field=models.DecimalField(max_digits=12, decimal_places=2)
+    )
+
+class PresupuestoMensualQuerySet(models.QuerySet):
+    def con_totales(self):
+        # Totales del mes en una sola consulta (una subconsulta agregada por tipo)
+        return self.annotate(
+            total_aportes=suma_por_presupuesto(Aporte),
+            total_gastos=suma_por_presupuesto(GastoPresupuesto),
+            total_ahorros=suma_por_presupuesto(AhorroPresupuesto),
+            total_deudas_pagadas=suma_por_presupuesto(DeudaPresupuesto, pagado=True),
+            total_deudas_no_pagadas=suma_por_presupuesto(DeudaPresupuesto, pagado=False),
+        ).annotate(
+            # Sobrante: aportes - gastos - ahorros - deudas pagadas
+            sobrante=F('total_aportes') - F('total_gastos') - F('total_ahorros') - F('total_deudas_pagadas'),
+        )
+
+    def con_saldo(self):
+        # Igual que con_totales(), pero leyendo la fila de SaldoPresupuesto (O(1) por mes);
+        # COALESCE solo evalúa la subconsulta si el presupuesto aún no tiene saldo
+        def total(campo, modelo, **filtros):
+            return Coalesce(
+                F(f'saldo__{campo}'), suma_por_presupuesto(modelo, **filtros),
+                output_field=models.DecimalField(max_digits=12, decimal_places=2)
+            )
+        return self.annotate(
+            total_aportes=total('total_aportes', Aporte),
+            total_gastos=total('total_gastos', GastoPresupuesto),
+            total_ahorros=total('total_ahorros', AhorroPresupuesto),
+            total_deudas_pagadas=total('total_deudas_pagadas', DeudaPresupuesto, pagado=True),
+            total_deudas_no_pagadas=total('total_deudas_no_pagadas', DeudaPresupuesto, pagado=False),
+        ).annotate(
+            sobrante=F('total_aportes') - F('total_gastos') - F('total_ahorros') - F('total_deudas_pagadas'),
+        )
+
+# Familia que PresupuestoMensualViewSet asigna a todos los presupuestos; cuentas y pagos
+# todavía no tienen familia propia y se agrupan bajo esta en los reportes
+FAMILIA_POR_DEFECTO = 'familia_camnr'
+
 class PresupuestoMensual(models.Model):
     familia = models.CharField(max_length=100)  # Puede ser group_id o similar
     fecha_mes = models.DateField()  # Selector de fecha para el mes del presupuesto
     monto_objetivo = models.DecimalField(max_digits=12, decimal_places=2)
     creado_por = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
+    # Lo marca el cierre de mes (CerrarMesView o manage.py cerrar_meses)
+    cerrado = models.BooleanField(default=False)
+    fecha_cierre = models.DateTimeField(null=True, blank=True)
+
+    objects = PresupuestoMensualQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # Un presupuesto por familia y mes: get_or_create queda libre de carreras
+            models.UniqueConstraint(fields=['familia', 'fecha_mes'], name='presupuesto_familia_mes_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['fecha_mes'], name='presupuesto_mes_idx'),
+        ]
+
+    @staticmethod
+    def rango_mes(fecha):
+        # [primer día del mes, primer día del mes siguiente): comparable por índice
+        inicio = fecha.replace(day=1)
+        if inicio.month == 12:
+            return inicio, inicio.replace(year=inicio.year + 1, month=1)
+        return inicio, inicio.replace(month=inicio.month + 1)
+
+    def desglose_por_categoria(self):
+        # Gastos y deudas por categoría en una sola consulta (UNION de dos GROUP BY)
+        gastos = (
+            GastoPresupuesto.objects.filter(presupuesto=self).order_by()
+            .annotate(tipo=Value('gastos'), cat=Coalesce('cuenta__categoria', Value('')))
+            .values('tipo', 'cat').annotate(total=Sum('monto'))
+            .values_list('tipo', 'cat', 'total')
+        )
+        deudas = (
+            DeudaPresupuesto.objects.filter(presupuesto=self).order_by()
+            .annotate(
+                tipo=Case(When(pagado=True, then=Value('deudas_pagadas')), default=Value('deudas_pendientes')),
+                cat=F('categoria'),
+            )
+            .values('tipo', 'cat').annotate(total=Sum('monto'))
+            .values_list('tipo', 'cat', 'total')
+        )
+        desglose = {}
+        for tipo, categoria, total in gastos.union(deudas, all=True):
+            fila = desglose.setdefault(categoria, {
+                'categoria': categoria,
+                'gastos': Decimal('0'),
+                'deudas_pagadas': Decimal('0'),
+                'deudas_pendientes': Decimal('0'),
+            })
+            fila[tipo] += Decimal(total)
+        return sorted(desglose.values(), key=lambda fila: fila['categoria'])
 
     def __str__(self):
         return f"Presupuesto {self.familia} - {self.fecha_mes.strftime('%Y-%m')}"
 
+class SaldoPresupuesto(models.Model):
+    # Totales acumulados por tipo de movimiento, mantenidos de forma incremental (ver api/saldos.py)
+    presupuesto = models.OneToOneField(PresupuestoMensual, on_delete=models.CASCADE, primary_key=True, related_name='saldo')
+    total_aportes = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    total_gastos = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    total_ahorros = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    total_deudas_pagadas = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    total_deudas_no_pagadas = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+
+    @property
+    def sobrante(self):
+        return self.total_aportes - self.total_gastos - self.total_ahorros - self.total_deudas_pagadas
+
+    def __str__(self):
+        return f"Saldo de {self.presupuesto}"
+
 class Aporte(models.Model):
     presupuesto = models.ForeignKey(PresupuestoMensual, on_delete=models.CASCADE, related_name='aportes')
     usuario = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
@@ -94,7 +264,7 @@ class GastoPresupuesto(models.Model):
     def __str__(self):
         return f"Gasto {self.monto} ({self.cuenta})"
 
-class DeudaPresupuesto(models.Model):
+class DeudaPresupuesto(ArchivosAtomicosMixin, models.Model):
     presupuesto = models.ForeignKey(PresupuestoMensual, on_delete=models.CASCADE, related_name='deudas')
     monto = models.DecimalField(max_digits=10, decimal_places=2)
     motivo = models.CharField(max_length=200)
@@ -111,6 +281,14 @@ class DeudaPresupuesto(models.Model):
     fecha_fin_estimado = models.DateField(null=True, blank=True)
     documento = models.FileField(upload_to='documentos_deuda/', null=True, blank=True)
     categoria = models.CharField(max_length=100, blank=True)
+    tasa_interes = models.DecimalField(max_digits=5, decimal_places=2, default=0, help_text="Tasa de interés anual (%)")
+
+    class Meta:
+        indexes = [
+            # Índice parcial: deudas pendientes de un presupuesto en orden de fecha
+            # (SQLite compila `pagado=False` como `NOT pagado`, que un índice compuesto no aprovecha)
+            models.Index(fields=['presupuesto', 'fecha'], condition=models.Q(pagado=False), name='deuda_pendiente_idx'),
+        ]
 
     def calcular_fecha_fin(self):
         # Calcula la fecha estimada de término según cuotas y frecuencia
@@ -118,8 +296,10 @@ class DeudaPresupuesto(models.Model):
         if not self.fecha_inicio or not self.cuotas_totales:
             return None
         if self.frecuencia == 'mensual':
-            meses = self.cuotas_totales - 1
-            return self.fecha_inicio.replace(month=self.fecha_inicio.month + meses)
+            # Puede pasar de diciembre: se suma en meses absolutos y se recorta el día al largo del mes
+            meses = self.fecha_inicio.month - 1 + self.cuotas_totales - 1
+            year, month = self.fecha_inicio.year + meses // 12, meses % 12 + 1
+            return self.fecha_inicio.replace(year=year, month=month, day=min(self.fecha_inicio.day, monthrange(year, month)[1]))
         elif self.frecuencia == 'quincenal':
             dias = (self.cuotas_totales - 1) * 15
             return self.fecha_inicio + timedelta(days=dias)
@@ -131,7 +311,7 @@ class DeudaPresupuesto(models.Model):
     def __str__(self):
         return f"Deuda {self.monto} - {self.motivo} ({self.cuotas_pagadas}/{self.cuotas_totales} cuotas)"
 
-class PagoDeudaPresupuesto(models.Model):
+class PagoDeudaPresupuesto(ArchivosAtomicosMixin, models.Model):
     deuda = models.ForeignKey(DeudaPresupuesto, on_delete=models.CASCADE, related_name='pagos')
     fecha_pago = models.DateField(auto_now_add=True)
     monto_pagado = models.DecimalField(max_digits=10, decimal_places=2)
@@ -170,5 +350,123 @@ class MovimientoPresupuesto(models.Model):
     referencia_id = models.PositiveIntegerField(null=True, blank=True)  # ID del objeto relacionado
     cuenta = models.ForeignKey('Cuenta', on_delete=models.SET_NULL, null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['presupuesto', 'tipo', 'fecha'], name='movimiento_pres_tipo_fecha_idx'),
+        ]
+
     def __str__(self):
         return f"Movimiento {self.tipo} - {self.monto}"
+
+
+class CambioSync(models.Model):
+    # Bitácora de cambios para /api/sync/: el id autoincremental es el cursor monotónico
+    OPERACION_CHOICES = [
+        ('upsert', 'Creado o modificado'),
+        ('delete', 'Eliminado'),
+    ]
+    modelo = models.CharField(max_length=30)
+    objeto_id = models.BigIntegerField()
+    operacion = models.CharField(max_length=10, choices=OPERACION_CHOICES)
+    fecha = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['modelo', 'objeto_id'], name='cambiosync_objeto_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.operacion} {self.modelo}#{self.objeto_id}"
+
+
+class ArchivoAlmacenado(models.Model):
+    # Un blob por contenido distinto; `referencias` cuenta los FileField que lo usan (ver api/almacenamiento.py)
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    nombre = models.CharField(max_length=255, unique=True)
+    tamano = models.BigIntegerField()
+    referencias = models.PositiveIntegerField(default=0)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.nombre} ({self.referencias} ref.)"
+
+
+class Tarea(models.Model):
+    # Cola de trabajos en la base (ver api/tareas.py): operaciones pesadas fuera del request
+    PENDIENTE, EN_CURSO, COMPLETADA, FALLIDA = 'pendiente', 'en_curso', 'completada', 'fallida'
+    ESTADO_CHOICES = [
+        (PENDIENTE, 'Pendiente'),
+        (EN_CURSO, 'En curso'),
+        (COMPLETADA, 'Completada'),
+        (FALLIDA, 'Fallida'),
+    ]
+    tipo = models.CharField(max_length=50)
+    parametros = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default=PENDIENTE)
+    resultado = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    error = models.TextField(blank=True)
+    intentos = models.PositiveIntegerField(default=0)
+    max_intentos = models.PositiveIntegerField(default=3)
+    usuario = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    # Header Idempotency-Key: repetir el POST con la misma clave devuelve la misma tarea
+    clave_idempotencia = models.CharField(max_length=255, null=True, blank=True)
+    disponible_desde = models.DateTimeField(default=timezone.now)
+    # Mientras el worker la procesa; vencido este plazo otra ejecución puede retomarla
+    bloqueada_hasta = models.DateTimeField(null=True, blank=True)
+    trabajador = models.CharField(max_length=100, blank=True)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_inicio = models.DateTimeField(null=True, blank=True)
+    fecha_fin = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['usuario', 'clave_idempotencia'], name='tarea_idempotencia_unica'),
+        ]
+        indexes = [
+            models.Index(fields=['estado', 'disponible_desde'], name='tarea_cola_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.tipo} #{self.pk} ({self.estado})"
+
+
+class ResumenMensual(models.Model):
+    # Totales precalculados por (familia, mes, categoría, proveedor, usuario), ver api/reportes.py.
+    # proveedor/usuario son ids sin FK (0 = sin proveedor/usuario) para que la clave sea única también sin ellos
+    familia = models.CharField(max_length=100)
+    mes = models.DateField()
+    categoria = models.CharField(max_length=100)
+    proveedor = models.BigIntegerField(default=0)
+    usuario = models.BigIntegerField(default=0)
+    total_cuentas = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    cantidad_cuentas = models.IntegerField(default=0)
+    total_pagos = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    cantidad_pagos = models.IntegerField(default=0)
+    total_gastos = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    cantidad_gastos = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['familia', 'mes', 'categoria', 'proveedor', 'usuario'], name='resumen_mensual_clave'),
+        ]
+
+    def __str__(self):
+        return f"{self.familia} {self.mes:%Y-%m} {self.categoria}"
+
+
+class DocumentoBusqueda(models.Model):
+    # Texto de cuentas, deudas y movimientos para /api/buscar/ (ver api/busqueda.py). En SQLite lo indexa
+    # una tabla FTS5 mantenida por triggers; en PostgreSQL, un índice GIN sobre su tsvector
+    tipo = models.CharField(max_length=20)
+    objeto_id = models.BigIntegerField()
+    titulo = models.TextField(blank=True)
+    texto = models.TextField(blank=True)
+    fecha = models.DateField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['tipo', 'objeto_id'], name='documento_busqueda_unico'),
+        ]
+
+    def __str__(self):
+        return f"{self.tipo} #{self.objeto_id}: {self.titulo}"
@@ -0,0 +1,25 @@
+from rest_framework.pagination import CursorPagination
+
+
+class CursorFechaPagination(CursorPagination):
+    """
+    Paginación por cursor ordenada por fecha, estable en tablas grandes:
+    cada página filtra por posición en lugar de usar OFFSET.
+
+    Se activa solo si la petición trae `cursor` o `page_size`, así los
+    clientes que esperan la lista completa siguen funcionando igual.
+    Cada ViewSet indica su orden con `cursor_ordering`.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    ordering = ('-id',)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if (self.cursor_query_param not in request.query_params and
+                self.page_size_query_param not in request.query_params):
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_ordering(self, request, queryset, view):
+        return getattr(view, 'cursor_ordering', self.ordering)
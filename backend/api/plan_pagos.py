@@ -0,0 +1,203 @@
+"""
+Plan de pago de deudas con el sobrante mensual.
+
+Cada estrategia es un orden de prioridad de las deudas pendientes de la
+familia, desde el mes del presupuesto en adelante. La simulación reproduce
+el reparto de transferir_sobrante (api/liquidacion.py) mes a mes: con lo
+disponible paga completas las deudas ya vencidas en orden de prioridad
+hasta la primera que no alcanza; lo que sobra queda para el mes siguiente.
+Cada deuda suma su interés mensual (tasa_interes / 12) mientras está
+vencida y sin pagar.
+
+Todas las estrategias se simulan a la vez: el estado es una matriz
+(estrategias x deudas) con las deudas de cada fila ya ordenadas según su
+prioridad, así cada mes es un puñado de operaciones de NumPy sin importar
+cuántas estrategias se comparen.
+
+Aplicar un plan (POST transferir-sobrante con `estrategia`) es pagar las
+deudas del mes en el orden de esa estrategia: el primer mes del plan es
+exactamente lo que hace la transferencia.
+"""
+from .models import DeudaPresupuesto, PresupuestoMensual
+from .proyeccion import centavos, cuentas_recurrentes, fecha_de, ingreso_promedio, mes_absoluto, texto
+
+try:
+    import numpy as np
+except ImportError:  # NumPy es opcional: sin él el plan responde 503
+    np = None
+
+BASICAS = ('fecha', 'avalanche', 'snowball')
+# Mezclas de avalanche y snowball: mixta-30 pesa 30% la tasa y 70% el monto
+MIXTAS = tuple(f'mixta-{peso}' for peso in range(5, 100, 5))
+ESTRATEGIAS = BASICAS + MIXTAS
+OBJETIVOS = ('meses', 'total')
+
+
+class ErrorPlan(Exception):
+    pass
+
+
+def disponible():
+    return np is not None
+
+
+def deudas_pendientes(presupuesto):
+    # Deudas sin pagar de la familia en el mes del presupuesto y los siguientes, en el orden de la transferencia
+    return list(
+        DeudaPresupuesto.objects.filter(
+            presupuesto__familia=presupuesto.familia, presupuesto__fecha_mes__gte=presupuesto.fecha_mes, pagado=False
+        ).order_by('presupuesto__fecha_mes', 'fecha', 'id')
+        .values('id', 'motivo', 'monto', 'tasa_interes', 'presupuesto__fecha_mes')
+    )
+
+
+def _rango(valores):
+    # Posición de cada valor al ordenarlos (empates por orden de llegada)
+    rango = np.empty(len(valores), dtype=np.int64)
+    rango[np.argsort(valores, kind='stable')] = np.arange(len(valores))
+    return rango
+
+
+def ordenes(deudas, estrategias, orden=None):
+    """Matriz (estrategias x deudas) con los índices de las deudas en orden de prioridad."""
+    n = len(deudas)
+    tasa = np.array([float(d['tasa_interes']) for d in deudas])
+    monto = np.array([float(d['monto']) for d in deudas])
+    por_tasa, por_monto = _rango(-tasa), _rango(monto)
+    filas = []
+    for estrategia in estrategias:
+        if estrategia == 'fecha':
+            puntaje = np.arange(n)
+        elif estrategia == 'avalanche':
+            puntaje = por_tasa
+        elif estrategia == 'snowball':
+            puntaje = por_monto
+        elif estrategia == 'personalizada':
+            posicion = {deuda_id: i for i, deuda_id in enumerate(orden or [])}
+            # Las deudas que no están en `orden` van después, por fecha
+            puntaje = np.array([posicion.get(d['id'], len(posicion) + i) for i, d in enumerate(deudas)])
+        else:
+            peso = int(estrategia.split('-')[1]) / 100
+            puntaje = peso * por_tasa + (1 - peso) * por_monto
+        filas.append(np.lexsort((np.arange(n), puntaje)))
+    return np.array(filas, dtype=np.int64).reshape(len(estrategias), n)
+
+
+def simular(deudas, prioridad, sobrantes, mes_inicio):
+    """
+    Simula todas las estrategias (filas de `prioridad`) a la vez durante
+    len(sobrantes) meses. Devuelve el mes de pago de cada deuda (-1 si no
+    se paga en el horizonte), en el orden de prioridad de cada estrategia,
+    el total pagado y el saldo que queda, en centavos.
+    """
+    saldo = np.array([centavos(d['monto']) for d in deudas], dtype=np.float64)[prioridad]
+    tasa = (np.array([float(d['tasa_interes']) for d in deudas]) / 100 / 12)[prioridad]
+    vence = np.maximum(np.array([mes_absoluto(d['presupuesto__fecha_mes']) - mes_inicio for d in deudas]), 0)[prioridad]
+    estrategias = prioridad.shape[0]
+    caja = np.zeros(estrategias)
+    pagado = np.zeros(estrategias)
+    mes_pago = np.full(prioridad.shape, -1, dtype=np.int64)
+    for mes, sobrante in enumerate(sobrantes):
+        # Interés de las deudas vencidas en meses anteriores que siguen sin pagar
+        atrasada = (vence < mes) & (mes_pago < 0)
+        saldo = np.where(atrasada, np.round(saldo * (1 + tasa)), saldo)
+        caja += sobrante
+        pendiente = np.where((vence <= mes) & (mes_pago < 0), saldo, 0)
+        # Completas y en orden hasta la primera que no alcanza: la suma acumulada solo crece
+        pagar = (pendiente > 0) & (np.cumsum(pendiente, axis=1) <= caja[:, None])
+        pago = (pendiente * pagar).sum(axis=1)
+        caja -= pago
+        pagado += pago
+        mes_pago[pagar] = mes
+    restante = np.where(mes_pago < 0, saldo, 0).sum(axis=1)
+    return mes_pago, pagado, restante
+
+
+def sobrantes_esperados(presupuesto, meses, sobrante_mensual=None):
+    """
+    Sobrante de cada mes: el actual del presupuesto y después `sobrante_mensual`
+    o, si no se indica, el ingreso promedio menos las cuentas recurrentes
+    proyectadas (ver api/proyeccion.py).
+    """
+    actual = PresupuestoMensual.objects.con_totales().get(pk=presupuesto.pk).sobrante
+    if sobrante_mensual is not None:
+        siguientes = np.full(meses, centavos(sobrante_mensual), dtype=np.int64)
+    else:
+        cuentas, _ = cuentas_recurrentes(presupuesto.familia, presupuesto.fecha_mes, meses)
+        siguientes = ingreso_promedio(presupuesto.familia, presupuesto.fecha_mes) - cuentas
+    sobrantes = np.maximum(siguientes, 0)
+    sobrantes[0] = max(centavos(actual), 0)
+    return sobrantes
+
+
+def comparar(presupuesto, meses=60, objetivo='meses', orden=None, sobrante_mensual=None):
+    """
+    Simula las estrategias y las devuelve ordenadas de mejor a peor según
+    `objetivo` ('meses' hasta saldar todo o 'total' pagado con intereses),
+    con el calendario de pagos de la mejor.
+    """
+    if objetivo not in OBJETIVOS:
+        raise ErrorPlan(f"objetivo debe ser uno de: {', '.join(OBJETIVOS)}.")
+    deudas = deudas_pendientes(presupuesto)
+    estrategias = ESTRATEGIAS + (('personalizada',) if orden else ())
+    inicio = mes_absoluto(presupuesto.fecha_mes)
+    if not deudas:
+        return {'deudas': 0, 'mejor': None, 'estrategias': [], 'calendario': []}
+
+    prioridad = ordenes(deudas, estrategias, orden)
+    mes_pago, pagado, restante = simular(deudas, prioridad, sobrantes_esperados(presupuesto, meses, sobrante_mensual), inicio)
+    saldadas = (mes_pago >= 0).all(axis=1)
+    meses_hasta = np.where(saldadas, mes_pago.max(axis=1) + 1, meses + 1)
+    costo = pagado + restante
+    principal = sum(centavos(d['monto']) for d in deudas)
+    # lexsort: la última clave manda; empates por el orden de ESTRATEGIAS. Si ninguna
+    # salda todo en el horizonte, por meses gana la que deja menos saldo pendiente
+    claves = (costo, restante, meses_hasta) if objetivo == 'meses' else (meses_hasta, costo)
+    ranking = np.lexsort((np.arange(len(estrategias)), *claves))
+
+    mejor = int(ranking[0])
+    calendario = {}
+    for posicion, mes in enumerate(mes_pago[mejor]):
+        if mes >= 0:
+            calendario.setdefault(int(mes), []).append(deudas[prioridad[mejor, posicion]])
+    return {
+        'deudas': len(deudas),
+        'objetivo': objetivo,
+        'mejor': estrategias[mejor],
+        'estrategias': [
+            {
+                'nombre': estrategias[k],
+                'meses': int(meses_hasta[k]) if saldadas[k] else None,
+                'totalPagado': texto(round(pagado[k])),
+                'intereses': texto(round(costo[k]) - principal),
+                'saldoRestante': texto(round(restante[k])),
+                'orden': [deudas[i]['id'] for i in prioridad[k]],
+            }
+            for k in map(int, ranking)
+        ],
+        'calendario': [
+            {
+                'mes': f'{fecha_de(inicio + mes):%Y-%m}',
+                'deudas': [{'id': d['id'], 'motivo': d['motivo'], 'monto': texto(centavos(d['monto']))} for d in pagadas],
+            }
+            for mes, pagadas in sorted(calendario.items())
+        ],
+    }
+
+
+def orden_de(presupuesto, estrategia, objetivo='meses', orden=None, meses=60, sobrante_mensual=None):
+    """
+    Ids de deudas en el orden de `estrategia`, para transferir_sobrante. 'mejor'
+    elige según `objetivo` con el mismo `meses` y `sobrante_mensual` del plan.
+    """
+    if estrategia == 'personalizada':
+        return list(orden or [])
+    if estrategia == 'mejor':
+        plan = comparar(presupuesto, meses, objetivo, orden, sobrante_mensual)
+        return plan['estrategias'][0]['orden'] if plan['estrategias'] else []
+    if estrategia not in ESTRATEGIAS:
+        raise ErrorPlan(f'Estrategia desconocida: {estrategia}.')
+    deudas = deudas_pendientes(presupuesto)
+    if not deudas:
+        return []
+    return [deudas[i]['id'] for i in ordenes(deudas, (estrategia,))[0]]
@@ -0,0 +1,218 @@
+"""
+Proyección mes a mes de obligaciones y saldo esperado.
+
+Se expanden en arreglos de NumPy, de una vez y sin recorrer cuota por
+cuota:
+
+- Las cuotas que faltan de cada deuda en cuotas abierta (cuotas_totales > 1),
+  según su frecuencia, desde `fecha_inicio` (o el mes de su presupuesto).
+  Las cuotas de meses anteriores al inicio de la proyección no se cuentan:
+  lo atrasado está en las deudas remanentes de esos meses.
+- Las deudas de una cuota no pagadas, en el mes de su presupuesto; las
+  vencidas se suman al primer mes. Si generar_cuotas ya creó la deuda
+  remanente de una cuota (mismo mes, motivo y monto), esa cuota se cuenta
+  una sola vez.
+- Las cuentas recurrentes: cada (categoría, proveedor) facturado en al
+  menos MINIMO_MESES de los últimos 12 meses (ResumenMensual) se repite con
+  el monto del mismo mes del año anterior, así se conserva la estacionalidad
+  y las cuentas bimestrales.
+
+Los montos se llevan en centavos (int64), así los totales son exactos.
+"""
+from datetime import date
+from decimal import Decimal
+
+from django.db.models import Q, Sum
+
+from .models import Aporte, DeudaPresupuesto, ResumenMensual, Proveedor
+from .serializers import monto_str
+
+try:
+    import numpy as np
+except ImportError:  # NumPy es opcional: sin él la proyección responde 503
+    np = None
+
+VENTANA = 12
+MINIMO_MESES = 3
+DIAS_POR_CUOTA = {'quincenal': 15, 'semanal': 7}
+
+
+def disponible():
+    return np is not None
+
+
+def mes_absoluto(fecha):
+    # Meses desde 1970-01, el mismo origen que datetime64[M]
+    return (fecha.year - 1970) * 12 + fecha.month - 1
+
+
+def fecha_de(mes):
+    return date(1970 + mes // 12, mes % 12 + 1, 1)
+
+
+def centavos(monto):
+    return int((Decimal(monto) * 100).to_integral_value())
+
+
+# El mayor monto de los DecimalField(max_digits=12): en centavos entra holgado en int64
+MONTO_MAXIMO = Decimal('9999999999.99')
+
+
+def monto_parametro(valor):
+    """Decimal de un parámetro de la URL; ValueError si no es finito (NaN, Infinity) o pasa MONTO_MAXIMO."""
+    monto = Decimal(valor)
+    if not monto.is_finite() or abs(monto) > MONTO_MAXIMO:
+        raise ValueError(valor)
+    return monto
+
+
+def _expandir_cuotas(deudas, desde, meses):
+    """(mes relativo, centavos, motivo) de cada cuota pendiente dentro del horizonte."""
+    if not deudas:
+        return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.int64)
+    inicio = np.array([d['inicio'] for d in deudas], dtype='datetime64[D]')
+    totales = np.array([d['cuotas_totales'] for d in deudas], dtype=np.int64)
+    pagadas = np.minimum(np.array([d['cuotas_pagadas'] for d in deudas], dtype=np.int64), totales)
+    cuota = np.array([d['cuota'] for d in deudas], dtype=np.int64)
+    motivo = np.array([d['motivo'] for d in deudas], dtype=np.int64)
+    dias = np.array([DIAS_POR_CUOTA.get(d['frecuencia'], 0) for d in deudas], dtype=np.int64)
+    mensual = np.array([d['frecuencia'] == 'mensual' for d in deudas])
+
+    # Una fila por cuota pendiente: índice de la deuda y número de cuota
+    pendientes = totales - pagadas
+    deuda = np.repeat(np.arange(len(deudas)), pendientes)
+    numero = np.arange(pendientes.sum()) - np.repeat(np.cumsum(pendientes) - pendientes, pendientes) + pagadas[deuda]
+
+    mes_inicio = inicio.astype('datetime64[M]').astype(np.int64)
+    por_dias = (inicio[deuda] + (numero * dias[deuda]).astype('timedelta64[D]')).astype('datetime64[M]').astype(np.int64)
+    mes = np.where(mensual[deuda], mes_inicio[deuda] + numero, por_dias) - desde
+    dentro = (mes >= 0) & (mes < meses)
+    return mes[dentro], cuota[deuda][dentro], motivo[deuda][dentro]
+
+
+def _repetidas(filas, en):
+    """Si cada fila (mes, motivo, monto) de `filas` figura en `en`, comparando filas completas."""
+    # np.unique por filas da un índice por combinación distinta, sin empaquetar columnas en un entero
+    _, indices = np.unique(np.concatenate([filas, en]), axis=0, return_inverse=True)
+    indices = indices.reshape(-1)
+    return np.isin(indices[:len(filas)], indices[len(filas):])
+
+
+def obligaciones_deudas(familia, desde, meses):
+    """Centavos por mes (arreglo de `meses`) de las deudas de la familia."""
+    inicio = mes_absoluto(desde)
+    filas = (
+        DeudaPresupuesto.objects.filter(presupuesto__familia=familia)
+        .filter(Q(pagado=False) | Q(cuotas_totales__lte=1, presupuesto__fecha_mes__gte=desde))
+        .values_list('monto', 'motivo', 'cuotas_totales', 'cuotas_pagadas', 'frecuencia', 'fecha_inicio', 'pagado',
+                     'presupuesto__fecha_mes')
+    )
+    codigos = {}
+    en_cuotas, sueltas = [], []
+    for monto, motivo, totales, pagadas, frecuencia, fecha_inicio, pagado, fecha_mes in filas:
+        codigo = codigos.setdefault(motivo, len(codigos))
+        if totales > 1:
+            if not pagado:
+                en_cuotas.append({
+                    'inicio': fecha_inicio or fecha_mes, 'cuotas_totales': totales, 'cuotas_pagadas': pagadas,
+                    # Mismo redondeo que generar_cuotas
+                    'cuota': centavos(Decimal(monto / totales).quantize(Decimal('0.01'))),
+                    'motivo': codigo, 'frecuencia': frecuencia or 'mensual',
+                })
+        else:
+            sueltas.append((mes_absoluto(fecha_mes) - inicio, centavos(monto), codigo, pagado))
+
+    mes_cuota, monto_cuota, motivo_cuota = _expandir_cuotas(en_cuotas, inicio, meses)
+    sueltas = np.array(sueltas, dtype=np.int64).reshape(-1, 4)
+    mes_suelta, monto_suelta, motivo_suelta, pagada = sueltas.T
+
+    # Cuotas que ya tienen su deuda remanente (pagada o no) en ese mes; solo importan las del horizonte
+    generadas = (mes_suelta >= 0) & (mes_suelta < meses)
+    repetida = _repetidas(
+        np.stack([mes_cuota, motivo_cuota, monto_cuota], axis=1),
+        np.stack([mes_suelta[generadas], motivo_suelta[generadas], monto_suelta[generadas]], axis=1),
+    )
+    # Vencidas y no pagadas: al primer mes
+    pendiente = (pagada == 0) & (mes_suelta < meses)
+    # float64 explícito: sin cuotas bincount devuelve int64 y la suma no se puede asignar
+    resultado = np.bincount(mes_cuota[~repetida], weights=monto_cuota[~repetida], minlength=meses).astype(np.float64)
+    resultado += np.bincount(np.maximum(mes_suelta[pendiente], 0), weights=monto_suelta[pendiente], minlength=meses)
+    return resultado[:meses].round().astype(np.int64)
+
+
+def cuentas_recurrentes(familia, desde, meses):
+    """
+    Centavos por mes de las cuentas recurrentes y el detalle de cada una
+    (categoría, proveedor y monto mensual promedio de los últimos 12 meses).
+    """
+    inicio = mes_absoluto(desde)
+    ventana_desde = fecha_de(inicio - VENTANA)
+    filas = (
+        ResumenMensual.objects.filter(familia=familia, mes__gte=ventana_desde, mes__lt=desde)
+        .values_list('categoria', 'proveedor', 'mes').annotate(total=Sum('total_cuentas')).order_by()
+    )
+    series = {}
+    indices, columnas, montos = [], [], []
+    for categoria, proveedor, mes, total in filas:
+        indices.append(series.setdefault((categoria, proveedor), len(series)))
+        columnas.append(mes_absoluto(mes) - inicio + VENTANA)
+        montos.append(centavos(total))
+    historial = np.zeros((len(series), VENTANA), dtype=np.int64)
+    np.add.at(historial, (np.array(indices, dtype=np.int64), np.array(columnas, dtype=np.int64)), np.array(montos, dtype=np.int64))
+
+    recurrente = (historial > 0).sum(axis=1) >= MINIMO_MESES
+    # El mes i de la proyección repite el mismo mes del año anterior
+    por_mes = np.resize(historial[recurrente].sum(axis=0), meses)
+
+    claves = [clave for clave, indice in sorted(series.items(), key=lambda item: item[1]) if recurrente[indice]]
+    promedios = historial[recurrente].sum(axis=1) // VENTANA
+    nombres = dict(Proveedor.objects.filter(pk__in={proveedor for _, proveedor in claves}).values_list('pk', 'nombre'))
+    detalle = [
+        {'categoria': categoria, 'proveedor': proveedor, 'nombre': nombres.get(proveedor, ''), 'montoMensual': texto(promedio)}
+        for (categoria, proveedor), promedio in zip(claves, promedios)
+    ]
+    return por_mes, sorted(detalle, key=lambda d: -Decimal(d['montoMensual']))
+
+
+def ingreso_promedio(familia, desde):
+    # Promedio de aportes por mes con presupuesto en los últimos 12 meses
+    por_mes = (
+        Aporte.objects.filter(presupuesto__familia=familia, presupuesto__fecha_mes__gte=fecha_de(mes_absoluto(desde) - VENTANA),
+                              presupuesto__fecha_mes__lt=desde)
+        .values('presupuesto__fecha_mes').annotate(total=Sum('monto')).values_list('total', flat=True).order_by()
+    )
+    totales = [centavos(total) for total in por_mes]
+    return sum(totales) // len(totales) if totales else 0
+
+
+def texto(centavos_):
+    return monto_str(Decimal(int(centavos_)).scaleb(-2))
+
+
+def proyectar(familia, desde, meses, saldo_inicial=Decimal('0'), ingreso=None):
+    """
+    Obligaciones, ingreso esperado y saldo acumulado para `meses` meses desde
+    `desde` (primero de mes). Sin `ingreso`, se usa el promedio de aportes
+    de los últimos 12 meses.
+    """
+    deudas = obligaciones_deudas(familia, desde, meses)
+    cuentas, recurrentes = cuentas_recurrentes(familia, desde, meses)
+    ingreso_mensual = ingreso_promedio(familia, desde) if ingreso is None else centavos(ingreso)
+    obligaciones = deudas + cuentas
+    flujo = ingreso_mensual - obligaciones
+    saldo = centavos(saldo_inicial) + np.cumsum(flujo)
+    inicio = mes_absoluto(desde)
+    return {
+        'familia': familia,
+        'meses': [f'{fecha_de(inicio + i):%Y-%m}' for i in range(meses)],
+        'saldoInicial': texto(centavos(saldo_inicial)),
+        'ingresoMensual': texto(ingreso_mensual),
+        'deudas': [texto(c) for c in deudas],
+        'cuentasRecurrentes': [texto(c) for c in cuentas],
+        'obligaciones': [texto(c) for c in obligaciones],
+        'flujo': [texto(c) for c in flujo],
+        'saldo': [texto(c) for c in saldo],
+        # Primer mes en que el saldo esperado queda negativo, si lo hay
+        'primerDeficit': next((f'{fecha_de(inicio + int(i)):%Y-%m}' for i in np.flatnonzero(saldo < 0)[:1]), None),
+        'recurrentes': recurrentes,
+    }
@@ -0,0 +1,32 @@
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional: sin él se usa el JSONRenderer de DRF
+    orjson = None
+
+
+class JSONRapidoRenderer(JSONRenderer):
+    """
+    JSONRenderer que serializa con orjson si está instalado.
+
+    Produce los mismos bytes que el renderer de DRF en modo compacto: las
+    fechas, Decimal, etc. pasan por el mismo JSONEncoder de DRF y se escapan
+    U+2028/U+2029 igual. Con indentación (?indent / Accept: ...; indent=N),
+    sin orjson o ante un valor que orjson no acepta, delega en DRF.
+    """
+    opciones = (orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS) if orjson else 0
+
+    def __init__(self):
+        self.codificar = JSONEncoder().default
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None or data is None or not self.compact or self.ensure_ascii or
+                self.get_indent(accepted_media_type, renderer_context or {}) is not None):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.codificar, option=self.opciones)
+        except (orjson.JSONEncodeError, TypeError, ValueError):
+            return super().render(data, accepted_media_type, renderer_context)
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
@@ -0,0 +1,294 @@
+"""
+Totales mensuales precalculados para reportes (ResumenMensual).
+
+Cada Cuenta, Pago y GastoPresupuesto suma su monto (y cuenta 1) en la fila
+de su clave (familia, mes, categoría, proveedor, usuario):
+
+- Cuenta: mes de vencimiento, su categoría y proveedor, el creador.
+- Pago: mes del pago, categoría y proveedor de su cuenta, quien pagó.
+- GastoPresupuesto: mes y familia del presupuesto, categoría y proveedor
+  de la cuenta asociada (si hay), quien pagó.
+
+Las señales (api/signals.py) leen las claves de las filas afectadas antes y
+después de cada escritura y aplican la diferencia en la misma transacción;
+las rutas que usan bulk_create llaman a `registrar_nuevos()`. Las claves se
+definen una sola vez en FUENTES, que usan tanto el cálculo incremental como
+la reconstrucción (`manage.py recalcular_reportes`).
+"""
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, IntegerField, Sum, Value
+from django.db.models.functions import Coalesce, TruncMonth
+
+from .models import FAMILIA_POR_DEFECTO, Cuenta, Pago, GastoPresupuesto, PresupuestoMensual, Proveedor, ResumenMensual
+from .serializers import monto_str
+
+CLAVE = ('familia', 'mes', 'categoria', 'proveedor', 'usuario')
+TIPOS = ('cuentas', 'pagos', 'gastos')
+LOTE = 1000
+
+
+def sin_id(campo):
+    return Coalesce(campo, Value(0), output_field=IntegerField())
+
+
+# modelo -> (tipo, expresiones de la clave, campo del monto)
+FUENTES = {
+    Cuenta: ('cuentas', {
+        'familia': Value(FAMILIA_POR_DEFECTO),
+        'mes': TruncMonth('fecha_vencimiento'),
+        'categoria': F('categoria'),
+        'proveedor': sin_id('proveedor_id'),
+        'usuario': sin_id('creador_id'),
+    }, 'monto'),
+    Pago: ('pagos', {
+        'familia': Value(FAMILIA_POR_DEFECTO),
+        'mes': TruncMonth('fecha_pago'),
+        'categoria': F('cuenta__categoria'),
+        'proveedor': sin_id('cuenta__proveedor_id'),
+        'usuario': sin_id('usuario_id'),
+    }, 'monto_pagado'),
+    GastoPresupuesto: ('gastos', {
+        'familia': F('presupuesto__familia'),
+        'mes': TruncMonth('presupuesto__fecha_mes'),
+        'categoria': Coalesce('cuenta__categoria', Value('')),
+        'proveedor': sin_id('cuenta__proveedor_id'),
+        'usuario': sin_id('pagado_por_id'),
+    }, 'monto'),
+}
+
+# Filas cuya clave depende de otro modelo: al editarlo (o al borrarlo, por los SET_NULL,
+# que Django aplica sin señales) cambian de clave. Las que se borran en cascada tienen sus propias señales.
+DEPENDIENTES = {
+    Cuenta: {Pago: 'cuenta', GastoPresupuesto: 'cuenta'},
+    PresupuestoMensual: {GastoPresupuesto: 'presupuesto'},
+    User: {GastoPresupuesto: 'pagado_por'},
+}
+
+
+def _con_clave(modelo, queryset):
+    _, claves, _ = FUENTES[modelo]
+    return queryset.order_by().annotate(**{f'r_{c}': expresion for c, expresion in claves.items()})
+
+
+def _clave(fila):
+    return tuple(fila[f'r_{c}'] for c in CLAVE)
+
+
+def filas(modelo, **filtro):
+    """{pk: (clave, monto)} de las filas de `modelo` que cumplen `filtro`, tal como están en la base."""
+    _, _, monto = FUENTES[modelo]
+    consulta = _con_clave(modelo, modelo.objects.filter(**filtro)).values('pk', *[f'r_{c}' for c in CLAVE], monto)
+    return {fila['pk']: (_clave(fila), Decimal(fila[monto])) for fila in consulta}
+
+
+def _agrupado(modelo, queryset):
+    # (clave, total, cantidad) agrupado en la base
+    _, _, monto = FUENTES[modelo]
+    consulta = (
+        _con_clave(modelo, queryset).values(*[f'r_{c}' for c in CLAVE])
+        .annotate(r_total=Sum(monto), r_cantidad=Count('pk'))
+    )
+    for fila in consulta:
+        yield _clave(fila), Decimal(fila['r_total']), fila['r_cantidad']
+
+
+def contribucion(modelo, ids):
+    """{clave: {campo: valor}} de las filas `ids` de `modelo`, agrupadas en la base."""
+    tipo = FUENTES[modelo][0]
+    resultado = defaultdict(lambda: defaultdict(Decimal))
+    ids = list(ids)
+    for inicio in range(0, len(ids), LOTE):
+        for clave, total, cantidad in _agrupado(modelo, modelo.objects.filter(pk__in=ids[inicio:inicio + LOTE])):
+            resultado[clave][f'total_{tipo}'] += total
+            resultado[clave][f'cantidad_{tipo}'] += cantidad
+    return resultado
+
+
+def _sumar(resultado, tipo, clave, monto, signo=1):
+    resultado[clave][f'total_{tipo}'] += signo * monto
+    resultado[clave][f'cantidad_{tipo}'] += signo
+
+
+def actualizar(anterior=None, nuevo=None):
+    # Aplica nuevo - anterior; ambos con la forma de contribucion()
+    deltas = defaultdict(lambda: defaultdict(Decimal))
+    for signo, contribuciones in ((-1, anterior or {}), (1, nuevo or {})):
+        for clave, campos in contribuciones.items():
+            for campo, valor in campos.items():
+                deltas[clave][campo] += signo * valor
+    aplicar(deltas)
+
+
+def aplicar(deltas):
+    """Suma `deltas` ({clave: {campo: valor}}) a ResumenMensual; crea las filas que falten."""
+    for clave, campos in deltas.items():
+        campos = {campo: valor for campo, valor in campos.items() if valor}
+        if not campos:
+            continue
+        filtro = dict(zip(CLAVE, clave))
+        cambios = {campo: F(campo) + valor for campo, valor in campos.items()}
+        if ResumenMensual.objects.filter(**filtro).update(**cambios):
+            continue
+        try:
+            with transaction.atomic():
+                ResumenMensual.objects.create(**filtro, **campos)
+        except IntegrityError:
+            # Otra transacción creó la fila entretanto
+            ResumenMensual.objects.filter(**filtro).update(**cambios)
+
+
+def capturar(modelo, instancia):
+    """Claves actuales de la fila `instancia` (si es una fuente) y de sus dependientes, antes de escribir."""
+    captura = {}
+    if instancia.pk is None:
+        return captura
+    if modelo in FUENTES:
+        captura[modelo] = filas(modelo, pk=instancia.pk)
+    for dependiente, campo in DEPENDIENTES.get(modelo, {}).items():
+        captura.setdefault(dependiente, {}).update(filas(dependiente, **{campo: instancia.pk}))
+    return captura
+
+
+def completar(modelo, instancia, captura, borrada=False):
+    """
+    Aplica la diferencia entre `captura` y las claves después de escribir.
+    Una dependiente que ya no existe se borró en cascada y la descuentan sus
+    propias señales; aquí solo se descuenta la fila de `instancia`.
+    """
+    pk = instancia.pk
+    anterior = defaultdict(lambda: defaultdict(Decimal))
+    nuevo = defaultdict(lambda: defaultdict(Decimal))
+    if modelo in FUENTES and not borrada:
+        captura.setdefault(modelo, {})
+    for fuente, previas in captura.items():
+        tipo = FUENTES[fuente][0]
+        propia = fuente is modelo
+        ids = set(previas) | ({pk} if propia and not borrada else set())
+        actuales = filas(fuente, pk__in=ids) if ids else {}
+        for fila_pk, (clave, monto) in previas.items():
+            if fila_pk in actuales or (propia and fila_pk == pk):
+                _sumar(anterior, tipo, clave, monto)
+        for clave, monto in actuales.values():
+            _sumar(nuevo, tipo, clave, monto)
+    actualizar(anterior, nuevo)
+
+
+def registrar_nuevos(por_modelo):
+    # Para rutas que escriben con bulk_create y no disparan señales: {modelo: objetos creados}
+    nuevo = defaultdict(lambda: defaultdict(Decimal))
+    for modelo, objs in por_modelo.items():
+        for clave, campos in contribucion(modelo, [obj.pk for obj in objs]).items():
+            nuevo[clave].update(campos)
+    actualizar(nuevo=nuevo)
+
+
+def calcular():
+    """Filas de ResumenMensual calculadas desde cero (sin guardar)."""
+    resultado = {}
+    for modelo, (tipo, _, _) in FUENTES.items():
+        for clave, total, cantidad in _agrupado(modelo, modelo.objects.all()):
+            fila = resultado.get(clave)
+            if fila is None:
+                fila = resultado[clave] = ResumenMensual(**dict(zip(CLAVE, clave)))
+            setattr(fila, f'total_{tipo}', total)
+            setattr(fila, f'cantidad_{tipo}', cantidad)
+    return list(resultado.values())
+
+
+def reconstruir():
+    filas_calculadas = calcular()
+    ResumenMensual.objects.all().delete()
+    ResumenMensual.objects.bulk_create(filas_calculadas, batch_size=LOTE)
+    return filas_calculadas
+
+
+def meses_entre(desde, hasta):
+    meses = []
+    mes = desde
+    while mes <= hasta:
+        meses.append(mes)
+        mes = date(mes.year + 1, 1, 1) if mes.month == 12 else date(mes.year, mes.month + 1, 1)
+    return meses
+
+
+def nombres(agrupar, claves):
+    if agrupar == 'proveedor':
+        encontrados = dict(Proveedor.objects.filter(pk__in=claves).values_list('pk', 'nombre'))
+        return {clave: encontrados.get(clave, 'Sin proveedor') for clave in claves}
+    if agrupar == 'usuario':
+        encontrados = dict(User.objects.filter(pk__in=claves).values_list('pk', 'username'))
+        return {clave: encontrados.get(clave, 'Sin usuario') for clave in claves}
+    if agrupar == 'categoria':
+        return {clave: clave or 'Sin categoría' for clave in claves}
+    return {clave: 'Total' for clave in claves}
+
+
+def variacion(actual, anterior):
+    # Porcentaje respecto del año anterior; None si no hay base de comparación
+    if not anterior:
+        return None
+    return round(float((actual - anterior) / anterior * 100), 1)
+
+
+def anual(por_mes, meses):
+    # Totales por año y variación contra el año anterior, a partir de las series mensuales
+    por_anio = {}
+    for indice, mes in enumerate(meses):
+        totales = por_anio.setdefault(mes.year, {tipo: Decimal('0') for tipo in TIPOS})
+        for tipo in TIPOS:
+            totales[tipo] += por_mes[tipo][indice]
+    resultado = []
+    for anio, totales in sorted(por_anio.items()):
+        previo = por_anio.get(anio - 1)
+        resultado.append({
+            'anio': anio,
+            **{tipo: monto_str(totales[tipo]) for tipo in TIPOS},
+            'variacion': {tipo: variacion(totales[tipo], previo[tipo]) if previo else None for tipo in TIPOS},
+        })
+    return resultado
+
+
+def tendencias(familia, desde, hasta, agrupar='categoria'):
+    """
+    Series mensuales de cuentas, pagos y gastos entre `desde` y `hasta`
+    (primeros de mes), por categoría, proveedor, usuario o total, con
+    totales anuales e interanuales. Lee solo ResumenMensual.
+    """
+    meses = meses_entre(desde, hasta)
+    posicion = {mes: indice for indice, mes in enumerate(meses)}
+    grupo = [] if agrupar == 'total' else [agrupar]
+    consulta = (
+        ResumenMensual.objects.filter(familia=familia, mes__gte=desde, mes__lte=hasta)
+        .values('mes', *grupo)
+        .annotate(**{tipo: Sum(f'total_{tipo}') for tipo in TIPOS})
+        .order_by()
+    )
+    series = {}
+    for fila in consulta:
+        clave = fila[agrupar] if grupo else ''
+        por_mes = series.setdefault(clave, {tipo: [Decimal('0')] * len(meses) for tipo in TIPOS})
+        for tipo in TIPOS:
+            por_mes[tipo][posicion[fila['mes']]] += fila[tipo]
+
+    total_por_mes = {tipo: [sum((s[tipo][i] for s in series.values()), Decimal('0')) for i in range(len(meses))] for tipo in TIPOS}
+    nombre_de = nombres(agrupar, list(series))
+    return {
+        'familia': familia,
+        'agrupar': agrupar,
+        'meses': [f'{mes:%Y-%m}' for mes in meses],
+        'series': [
+            {
+                'clave': clave,
+                'nombre': nombre_de[clave],
+                **{tipo: [monto_str(monto) for monto in por_mes[tipo]] for tipo in TIPOS},
+                'anual': anual(por_mes, meses),
+            }
+            for clave, por_mes in sorted(series.items(), key=lambda item: -sum(item[1]['cuentas']))
+        ],
+        'anual': anual(total_por_mes, meses),
+    }
@@ -0,0 +1,120 @@
+"""
+Mantenimiento incremental de SaldoPresupuesto.
+
+Cada Aporte, GastoPresupuesto, AhorroPresupuesto y DeudaPresupuesto
+aporta su monto a uno de los totales de su presupuesto. Las señales
+(api/signals.py) toman la contribución de la fila antes de guardarla o
+borrarla y aplican la diferencia después, así cualquier escritura por el
+ORM (API, admin, shell) mantiene el saldo. Las rutas con bulk_create,
+bulk_update o update() no disparan señales y llaman a `actualizar()`.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import Case, DecimalField, F, Value, When
+from django.utils import timezone
+
+from .models import (
+    PresupuestoMensual, SaldoPresupuesto, Aporte, GastoPresupuesto, AhorroPresupuesto, DeudaPresupuesto
+)
+
+CENTAVO = Decimal('0.01')
+CAMPOS = ('total_aportes', 'total_gastos', 'total_ahorros', 'total_deudas_pagadas', 'total_deudas_no_pagadas')
+
+
+MODELOS = (Aporte, GastoPresupuesto, AhorroPresupuesto, DeudaPresupuesto)
+
+
+def campo_de(obj):
+    if isinstance(obj, Aporte):
+        return 'total_aportes'
+    if isinstance(obj, GastoPresupuesto):
+        return 'total_gastos'
+    if isinstance(obj, AhorroPresupuesto):
+        return 'total_ahorros'
+    if isinstance(obj, DeudaPresupuesto):
+        return 'total_deudas_pagadas' if obj.pagado else 'total_deudas_no_pagadas'
+    raise TypeError(f'{type(obj).__name__} no afecta el saldo del presupuesto')
+
+
+def contribucion(*objs):
+    # {(presupuesto_id, campo): monto} de uno o varios registros
+    resultado = defaultdict(Decimal)
+    for obj in objs:
+        if obj is not None and obj.presupuesto_id:
+            resultado[(obj.presupuesto_id, campo_de(obj))] += Decimal(obj.monto)
+    return resultado
+
+
+def capturar(modelo, instancia):
+    # Contribución de la fila tal como está en la base, antes de escribirla o borrarla
+    if instancia.pk is None:
+        return {}
+    campos = ('presupuesto_id', 'monto', 'pagado') if modelo is DeudaPresupuesto else ('presupuesto_id', 'monto')
+    return contribucion(modelo.objects.filter(pk=instancia.pk).only(*campos).first())
+
+
+def actualizar(anterior=None, nuevo=None):
+    # Aplica nuevo - anterior; ambos son resultados de contribucion()
+    deltas = defaultdict(Decimal)
+    for clave, monto in (anterior or {}).items():
+        deltas[clave] -= monto
+    for clave, monto in (nuevo or {}).items():
+        deltas[clave] += monto
+    aplicar(deltas)
+
+
+def aplicar(deltas):
+    """
+    Suma `deltas` ({(presupuesto_id, campo): monto}) a los saldos con un solo
+    UPDATE. Debe llamarse después de escribir los registros y dentro de la
+    misma transacción: los presupuestos sin fila de saldo se calculan desde
+    cero, lo que ya incluye el cambio.
+    """
+    deltas = {clave: monto for clave, monto in deltas.items() if monto}
+    if not deltas:
+        return
+    ids = {presupuesto_id for presupuesto_id, _ in deltas}
+    existentes = set(
+        SaldoPresupuesto.objects.filter(presupuesto_id__in=ids).values_list('presupuesto_id', flat=True)
+    )
+    faltantes = ids - existentes
+    if faltantes:
+        reconstruir(PresupuestoMensual.objects.filter(id__in=faltantes))
+
+    por_campo = defaultdict(dict)
+    for (presupuesto_id, campo), monto in deltas.items():
+        if presupuesto_id in existentes:
+            por_campo[campo][presupuesto_id] = monto
+    if not por_campo:
+        return
+    cambios = {
+        campo: F(campo) + Case(
+            *[When(presupuesto_id=presupuesto_id, then=Value(monto)) for presupuesto_id, monto in montos.items()],
+            default=Value(Decimal('0')),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        )
+        for campo, montos in por_campo.items()
+    }
+    ids_afectados = set().union(*(montos.keys() for montos in por_campo.values()))
+    SaldoPresupuesto.objects.filter(presupuesto_id__in=ids_afectados).update(
+        fecha_actualizacion=timezone.now(), **cambios
+    )
+
+
+def calcular(presupuestos=None):
+    # Saldos calculados desde cero con los agregados de con_totales()
+    presupuestos = PresupuestoMensual.objects.all() if presupuestos is None else presupuestos
+    return [
+        SaldoPresupuesto(presupuesto_id=p['id'], **{campo: Decimal(p[campo]).quantize(CENTAVO) for campo in CAMPOS})
+        for p in presupuestos.con_totales().values('id', *CAMPOS)
+    ]
+
+
+def reconstruir(presupuestos=None):
+    saldos = calcular(presupuestos)
+    SaldoPresupuesto.objects.bulk_create(
+        saldos, update_conflicts=True, unique_fields=['presupuesto'],
+        update_fields=[*CAMPOS, 'fecha_actualizacion'],
+    )
+    return saldos
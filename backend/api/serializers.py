@@ -1,12 +1,63 @@
 from rest_framework import serializers
+from decimal import Decimal
+from functools import lru_cache
 from django.contrib.auth.models import User  # Import User model
-from .models import Cuenta, Pago, Profile, Proveedor, PresupuestoMensual, Aporte, GastoPresupuesto, DeudaPresupuesto, AhorroPresupuesto, MovimientoPresupuesto, PagoDeudaPresupuesto
+from django.core.files.storage import default_storage
+from . import derivados
+from .models import Cuenta, Pago, Profile, Proveedor, PresupuestoMensual, Aporte, GastoPresupuesto, DeudaPresupuesto, AhorroPresupuesto, MovimientoPresupuesto, PagoDeudaPresupuesto, Tarea
 
+# Memoizada: los nombres de campo son un conjunto fijo, cada clave se convierte una sola vez
+@lru_cache(maxsize=None)
 def to_camel_case(s):
     parts = s.split('_')
     return parts[0] + ''.join(word.capitalize() for word in parts[1:])
 
+def campos_solicitados(request):
+    # `?fields=id,nombre,monto` (snake_case o camelCase); None si no se pidió
+    if request is None or request.method != 'GET':
+        return None
+    fields = request.query_params.get('fields')
+    if not fields:
+        return None
+    return {campo.strip() for campo in fields.split(',') if campo.strip()}
+
+def monto_str(valor):
+    return str(valor.quantize(Decimal('0.01')))
+
+class DerivadoField(serializers.Field):
+    """URL de un derivado (miniatura/previa) del archivo en `source`, o None si no aplica."""
+    def __init__(self, tipo, **kwargs):
+        self.tipo = tipo
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return self.desde_valor(value.name, self.context.get('request'))
+
+    def desde_valor(self, nombre, request):
+        # También lo usa la ruta de lectura rápida (api/lectura.py) con el valor de values()
+        if not nombre or not derivados.soportado(nombre):
+            return None
+        url = default_storage.url(derivados.nombre_derivado(nombre, self.tipo))
+        return request.build_absolute_uri(url) if request is not None else url
+
 class CamelCaseModelSerializer(serializers.ModelSerializer):
+    # Campos calculados que la ruta de lectura rápida (api/lectura.py) puede leer con values():
+    # nombre del campo -> lookup o (lookup, conversión)
+    valores_lectura = {}
+
+    def get_fields(self):
+        fields = super().get_fields()
+        # Sparse fieldsets: solo aplica al serializer raíz, no a los anidados
+        padre = self.parent.parent if isinstance(self.parent, serializers.ListSerializer) else self.parent
+        solicitados = campos_solicitados(self.context.get('request')) if padre is None else None
+        if solicitados:
+            fields = {
+                nombre: campo for nombre, campo in fields.items()
+                if nombre in solicitados or to_camel_case(nombre) in solicitados
+            }
+        return fields
+
     def to_representation(self, instance):
         ret = super().to_representation(instance)
         return {to_camel_case(key): value for key, value in ret.items()}
@@ -15,6 +66,8 @@ class PagoSerializer(CamelCaseModelSerializer):
     pagadoPorUsername = serializers.ReadOnlyField(source='usuario.username')
     usuario = serializers.HiddenField(default=serializers.CurrentUserDefault())
     aporte = serializers.PrimaryKeyRelatedField(queryset=Aporte.objects.all(), required=False, allow_null=True)
+    comprobante_miniatura = DerivadoField('miniatura', source='comprobante')
+    comprobante_previa = DerivadoField('previa', source='comprobante')
 
     class Meta:
         model = Pago
@@ -24,11 +77,46 @@ class CuentaSerializer(CamelCaseModelSerializer):
     pagos = PagoSerializer(many=True, read_only=True)
     proveedorNombre = serializers.ReadOnlyField(source='proveedor.nombre')
     creadorUsername = serializers.ReadOnlyField(source='creador.username')
+    total_pagado = serializers.SerializerMethodField()
+    saldo_pendiente = serializers.SerializerMethodField()
+    estado = serializers.SerializerMethodField()
+    factura_miniatura = DerivadoField('miniatura', source='factura')
+    factura_previa = DerivadoField('previa', source='factura')
+    # Anotaciones de Cuenta.objects.con_totales()
+    valores_lectura = {
+        'total_pagado': ('total_pagado', monto_str),
+        'saldo_pendiente': ('saldo_pendiente', monto_str),
+        'estado': 'estado_pago',
+    }
 
     class Meta:
         model = Cuenta
         fields = '__all__'
 
+    def calcular_total_pagado(self, obj):
+        # Usa la anotación de Cuenta.objects.con_totales() si está disponible
+        total = getattr(obj, 'total_pagado', None)
+        if total is None:
+            total = sum((p.monto_pagado for p in obj.pagos.all()), Decimal('0'))
+        return total
+    def get_total_pagado(self, obj):
+        return monto_str(self.calcular_total_pagado(obj))
+    def get_saldo_pendiente(self, obj):
+        saldo = getattr(obj, 'saldo_pendiente', None)
+        if saldo is None:
+            saldo = max(obj.monto - self.calcular_total_pagado(obj), Decimal('0'))
+        return monto_str(saldo)
+    def get_estado(self, obj):
+        estado = getattr(obj, 'estado_pago', None)
+        if estado is not None:
+            return estado
+        total = self.calcular_total_pagado(obj)
+        if total >= obj.monto:
+            return 'pagada'
+        if total > 0:
+            return 'parcial'
+        return 'pendiente'
+
 class ProfileSerializer(serializers.ModelSerializer):
     user_id = serializers.ReadOnlyField(source='user.id')
     username = serializers.ReadOnlyField(source='user.username')
@@ -48,9 +136,33 @@ class PresupuestoMensualSerializer(CamelCaseModelSerializer):
     class Meta:
         model = PresupuestoMensual
         fields = '__all__'
+        read_only_fields = ['cerrado', 'fecha_cierre']
+
+class CategoriaResumenSerializer(serializers.Serializer):
+    categoria = serializers.CharField()
+    gastos = serializers.DecimalField(max_digits=12, decimal_places=2)
+    deudasPagadas = serializers.DecimalField(max_digits=12, decimal_places=2, source='deudas_pagadas')
+    deudasPendientes = serializers.DecimalField(max_digits=12, decimal_places=2, source='deudas_pendientes')
+
+class SaldoPresupuestoSerializer(serializers.Serializer):
+    # Espera un presupuesto anotado con con_totales() o con_saldo()
+    presupuestoId = serializers.IntegerField(source='id')
+    familia = serializers.CharField()
+    fechaMes = serializers.DateField(source='fecha_mes')
+    montoObjetivo = serializers.DecimalField(max_digits=12, decimal_places=2, source='monto_objetivo')
+    totalAportes = serializers.DecimalField(max_digits=12, decimal_places=2, source='total_aportes')
+    totalGastos = serializers.DecimalField(max_digits=12, decimal_places=2, source='total_gastos')
+    totalAhorros = serializers.DecimalField(max_digits=12, decimal_places=2, source='total_ahorros')
+    totalDeudasPagadas = serializers.DecimalField(max_digits=12, decimal_places=2, source='total_deudas_pagadas')
+    totalDeudasNoPagadas = serializers.DecimalField(max_digits=12, decimal_places=2, source='total_deudas_no_pagadas')
+    sobrante = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+class ResumenPresupuestoSerializer(SaldoPresupuestoSerializer):
+    porCategoria = CategoriaResumenSerializer(many=True, source='desglose_por_categoria')
 
 class AporteSerializer(CamelCaseModelSerializer):
     usuario_username = serializers.SerializerMethodField()
+    valores_lectura = {'usuario_username': 'usuario__username'}
     class Meta:
         model = Aporte
         fields = '__all__'
@@ -103,8 +215,15 @@ class AhorroPresupuestoSerializer(CamelCaseModelSerializer):
 
 class MovimientoPresupuestoSerializer(CamelCaseModelSerializer):
     usuario_username = serializers.SerializerMethodField()
+    valores_lectura = {'usuario_username': 'usuario__username'}
     class Meta:
         model = MovimientoPresupuesto
         fields = '__all__'
     def get_usuario_username(self, obj):
-        return obj.usuario.username if obj.usuario else None
\ No newline at end of file
+        return obj.usuario.username if obj.usuario else None
+
+class TareaSerializer(CamelCaseModelSerializer):
+    class Meta:
+        model = Tarea
+        fields = ['id', 'tipo', 'estado', 'resultado', 'error', 'intentos', 'max_intentos', 'fecha_creacion', 'fecha_inicio', 'fecha_fin']
+        read_only_fields = fields
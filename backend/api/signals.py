@@ -1,9 +1,163 @@
-from django.db.models.signals import post_save
+from django.db.backends.signals import connection_created
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import Profile
+from .models import (
+    Profile, PresupuestoMensual, SaldoPresupuesto, Proveedor, Cuenta, Pago, DeudaPresupuesto, PagoDeudaPresupuesto,
+    CambioSync
+)
+from . import almacenamiento, busqueda, cache, derivados, reportes, saldos, sqlite, sync
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
-        Profile.objects.create(user=instance, group_id="DEFAULT_GROUP")
\ No newline at end of file
+        Profile.objects.create(user=instance, group_id="DEFAULT_GROUP")
+
+@receiver(post_save, sender=PresupuestoMensual)
+def crear_saldo_presupuesto(sender, instance, created, raw=False, **kwargs):
+    # Cada presupuesto nace con su fila de saldo en cero (ver api/saldos.py)
+    if created and not raw:
+        SaldoPresupuesto.objects.get_or_create(presupuesto=instance)
+
+
+# Invalidación de la caché de datos de referencia (ver api/cache.py)
+@receiver(post_save, sender=Proveedor)
+@receiver(post_delete, sender=Proveedor)
+def invalidar_proveedores(sender, **kwargs):
+    cache.invalidar('proveedores')
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidar_usuarios(sender, **kwargs):
+    cache.invalidar('usuarios')
+
+@receiver(post_save, sender=Cuenta)
+@receiver(post_delete, sender=Cuenta)
+def invalidar_categorias(sender, **kwargs):
+    cache.invalidar('categorias')
+
+
+# Bitácora de cambios para /api/sync/ (ver api/sync.py)
+def registrar_cambio_sync(sender, instance, **kwargs):
+    sync.anotar([CambioSync(modelo=sync.CLAVE_POR_MODELO[sender], objeto_id=instance.pk, operacion='upsert')])
+
+def registrar_baja_sync(sender, instance, **kwargs):
+    sync.anotar([CambioSync(modelo=sync.CLAVE_POR_MODELO[sender], objeto_id=instance.pk, operacion='delete')])
+
+for modelo_sync in sync.CLAVE_POR_MODELO:
+    post_save.connect(registrar_cambio_sync, sender=modelo_sync, dispatch_uid=f'sync_upsert_{modelo_sync.__name__}')
+    post_delete.connect(registrar_baja_sync, sender=modelo_sync, dispatch_uid=f'sync_delete_{modelo_sync.__name__}')
+
+
+# Referencias a blobs del almacén deduplicado (ver api/almacenamiento.py): un archivo
+# reemplazado o de una fila borrada libera su referencia
+ARCHIVOS = {
+    Cuenta: ('factura',),
+    Pago: ('comprobante',),
+    DeudaPresupuesto: ('documento',),
+    PagoDeudaPresupuesto: ('comprobante',),
+}
+
+def recordar_archivos(sender, instance, raw=False, update_fields=None, **kwargs):
+    campos = ARCHIVOS[sender]
+    if raw or instance.pk is None or (update_fields is not None and not set(campos) & set(update_fields)):
+        instance._archivos_anteriores = {}
+        return
+    instance._archivos_anteriores = sender.objects.filter(pk=instance.pk).values(*campos).first() or {}
+
+def liberar_reemplazados(sender, instance, created=False, **kwargs):
+    anteriores = getattr(instance, '_archivos_anteriores', {})
+    for campo in ARCHIVOS[sender]:
+        archivo = getattr(instance, campo)
+        if campo not in anteriores and not created:
+            continue
+        anterior = anteriores.get(campo)
+        if anterior and anterior != archivo.name:
+            almacenamiento.liberar(anterior, archivo.storage)
+        if archivo and archivo.name != anterior:
+            # Miniatura y vista previa en segundo plano (ver api/derivados.py)
+            derivados.programar(archivo.name)
+    instance._archivos_anteriores = {}
+
+def liberar_archivos(sender, instance, **kwargs):
+    for campo in ARCHIVOS[sender]:
+        archivo = getattr(instance, campo)
+        if archivo:
+            almacenamiento.liberar(archivo.name, archivo.storage)
+
+for modelo_archivos in ARCHIVOS:
+    pre_save.connect(recordar_archivos, sender=modelo_archivos, dispatch_uid=f'archivos_pre_{modelo_archivos.__name__}')
+    post_save.connect(liberar_reemplazados, sender=modelo_archivos, dispatch_uid=f'archivos_post_{modelo_archivos.__name__}')
+    post_delete.connect(liberar_archivos, sender=modelo_archivos, dispatch_uid=f'archivos_delete_{modelo_archivos.__name__}')
+
+
+# SaldoPresupuesto (ver api/saldos.py): contribución antes de escribir, diferencia después
+def borra_presupuesto(origin):
+    # Borrado en cascada desde el presupuesto: su saldo se borra con él
+    return isinstance(origin, PresupuestoMensual) or getattr(origin, 'model', None) is PresupuestoMensual
+
+def capturar_saldo(sender, instance, raw=False, origin=None, **kwargs):
+    instance._saldo_anterior = {} if raw or borra_presupuesto(origin) else saldos.capturar(sender, instance)
+
+def completar_saldo(sender, instance, raw=False, **kwargs):
+    if not raw:
+        saldos.actualizar(getattr(instance, '_saldo_anterior', {}), saldos.contribucion(instance))
+    instance._saldo_anterior = {}
+
+def completar_baja_saldo(sender, instance, **kwargs):
+    saldos.actualizar(anterior=getattr(instance, '_saldo_anterior', {}))
+    instance._saldo_anterior = {}
+
+for modelo_saldo in saldos.MODELOS:
+    nombre = modelo_saldo.__name__
+    pre_save.connect(capturar_saldo, sender=modelo_saldo, dispatch_uid=f'saldo_pre_{nombre}')
+    post_save.connect(completar_saldo, sender=modelo_saldo, dispatch_uid=f'saldo_post_{nombre}')
+    pre_delete.connect(capturar_saldo, sender=modelo_saldo, dispatch_uid=f'saldo_pre_delete_{nombre}')
+    post_delete.connect(completar_baja_saldo, sender=modelo_saldo, dispatch_uid=f'saldo_delete_{nombre}')
+
+
+# Totales mensuales para reportes (ver api/reportes.py): claves antes de escribir, diferencia después
+def capturar_resumen(sender, instance, raw=False, **kwargs):
+    instance._resumen_anterior = {} if raw else reportes.capturar(sender, instance)
+
+def completar_resumen(sender, instance, raw=False, **kwargs):
+    if not raw:
+        reportes.completar(sender, instance, getattr(instance, '_resumen_anterior', {}))
+    instance._resumen_anterior = {}
+
+def completar_baja_resumen(sender, instance, **kwargs):
+    reportes.completar(sender, instance, getattr(instance, '_resumen_anterior', {}), borrada=True)
+    instance._resumen_anterior = {}
+
+for modelo_resumen in {**reportes.FUENTES, **reportes.DEPENDIENTES}:
+    nombre = modelo_resumen.__name__
+    if modelo_resumen in reportes.FUENTES or modelo_resumen is PresupuestoMensual:
+        # Solo las fuentes y el presupuesto (mes, familia) cambian claves al guardarse
+        pre_save.connect(capturar_resumen, sender=modelo_resumen, dispatch_uid=f'resumen_pre_{nombre}')
+        post_save.connect(completar_resumen, sender=modelo_resumen, dispatch_uid=f'resumen_post_{nombre}')
+    pre_delete.connect(capturar_resumen, sender=modelo_resumen, dispatch_uid=f'resumen_pre_delete_{nombre}')
+    post_delete.connect(completar_baja_resumen, sender=modelo_resumen, dispatch_uid=f'resumen_delete_{nombre}')
+
+
+# Documentos de /api/buscar/ (ver api/busqueda.py)
+def indexar_busqueda(sender, instance, raw=False, **kwargs):
+    if not raw:
+        busqueda.indexar([instance])
+
+def desindexar_busqueda(sender, instance, **kwargs):
+    busqueda.desindexar(sender, [instance.pk])
+
+for modelo_busqueda in busqueda.TIPO_DE:
+    post_save.connect(indexar_busqueda, sender=modelo_busqueda, dispatch_uid=f'busqueda_{modelo_busqueda.__name__}')
+    post_delete.connect(desindexar_busqueda, sender=modelo_busqueda, dispatch_uid=f'busqueda_delete_{modelo_busqueda.__name__}')
+
+@receiver(post_save, sender=Proveedor)
+def reindexar_proveedor(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        busqueda.reindexar_proveedor(instance)
+
+
+# PRAGMA del perfil de producción de SQLite en cada conexión nueva
+connection_created.connect(sqlite.aplicar_pragmas, dispatch_uid='sqlite_pragmas')
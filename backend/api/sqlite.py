@@ -0,0 +1,39 @@
+"""
+Perfil de SQLite para producción (FAMILION_SQLITE_PERFIL=produccion).
+
+Con varios usuarios guardando a la vez, la configuración por defecto
+(journal en modo DELETE, transacciones diferidas, sin reutilizar
+conexiones) termina en `database is locked`: una transacción que empezó
+leyendo no puede pasar a escribir mientras otra escribe, y los lectores
+esperan a los escritores. El perfil:
+
+- journal_mode=WAL: los lectores no se bloquean con las escrituras.
+- synchronous=NORMAL: en WAL sigue siendo seguro ante caídas del proceso,
+  solo se sincroniza al disco en los checkpoints.
+- busy_timeout: esperar el lock en vez de fallar al instante.
+- cache_size / mmap_size / temp_store: menos lecturas al disco.
+- transacciones IMMEDIATE (OPTIONS de Django): toman el lock de escritura
+  al empezar, así el busy_timeout se respeta y no hay interbloqueos al
+  pasar de lectura a escritura.
+- CONN_MAX_AGE: conexiones persistentes, los PRAGMA se aplican una vez
+  por conexión.
+"""
+
+PRAGMAS_PRODUCCION = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 20000,
+    'cache_size': -32000,       # en KiB (negativo): ~32 MB por conexión
+    'mmap_size': 268435456,     # 256 MB
+    'temp_store': 'MEMORY',
+}
+
+
+def aplicar_pragmas(sender, connection, **kwargs):
+    # Receptor de connection_created; los PRAGMA se configuran en DATABASES[...]['PRAGMAS']
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = connection.settings_dict.get('PRAGMAS') or {}
+    with connection.cursor() as cursor:
+        for nombre, valor in pragmas.items():
+            cursor.execute(f'PRAGMA {nombre} = {valor}')
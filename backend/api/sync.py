@@ -0,0 +1,109 @@
+"""
+Feed de sincronización incremental para el cliente offline.
+
+Cada alta, modificación o baja de los modelos sincronizados deja una fila
+en CambioSync (señales post_save/post_delete, o `registrar()` en las rutas
+que usan bulk_create). El cliente guarda el último cursor recibido y pide
+solo lo posterior: los objetos vigentes se devuelven serializados y los
+borrados como tombstones (solo el id).
+
+El cursor solo es seguro si los ids se confirman en orden. Con SQLite las
+escrituras ya están serializadas. En PostgreSQL dos transacciones pueden
+confirmar sus ids al revés (la de id 5 después que la de id 6) y un
+cliente que ya pasó el 6 no vería nunca el 5; por eso `bloquear_bitacora()`
+toma un advisory lock de transacción antes de cada inserción: las
+transacciones que escriben en la bitácora se confirman de a una, en el
+orden de sus ids.
+"""
+from django.db import connection, transaction
+from django.db.models import Prefetch
+
+from .models import (
+    CambioSync, Cuenta, Pago, PresupuestoMensual, Aporte, GastoPresupuesto, DeudaPresupuesto,
+    AhorroPresupuesto, MovimientoPresupuesto, PagoDeudaPresupuesto
+)
+from .serializers import (
+    CuentaSerializer, PagoSerializer, PresupuestoMensualSerializer, AporteSerializer, GastoPresupuestoSerializer,
+    DeudaPresupuestoSerializer, AhorroPresupuestoSerializer, MovimientoPresupuestoSerializer,
+    PagoDeudaPresupuestoSerializer
+)
+
+# clave en el feed: (modelo, serializer, queryset de lectura)
+MODELOS = {
+    'cuentas': (Cuenta, CuentaSerializer, lambda: (
+        Cuenta.objects.con_totales().select_related('proveedor', 'creador')
+        .prefetch_related(Prefetch('pagos', queryset=Pago.objects.select_related('usuario')))
+    )),
+    'pagos': (Pago, PagoSerializer, lambda: Pago.objects.select_related('usuario')),
+    'presupuestos': (PresupuestoMensual, PresupuestoMensualSerializer, lambda: PresupuestoMensual.objects.all()),
+    'aportes': (Aporte, AporteSerializer, lambda: Aporte.objects.select_related('usuario')),
+    'gastos': (GastoPresupuesto, GastoPresupuestoSerializer, lambda: GastoPresupuesto.objects.select_related('pagado_por', 'cuenta')),
+    'deudas': (DeudaPresupuesto, DeudaPresupuestoSerializer, lambda: DeudaPresupuesto.objects.select_related('cuenta_origen').prefetch_related('pagos')),
+    'ahorros': (AhorroPresupuesto, AhorroPresupuestoSerializer, lambda: AhorroPresupuesto.objects.select_related('cuenta_destino')),
+    'movimientos': (MovimientoPresupuesto, MovimientoPresupuestoSerializer, lambda: MovimientoPresupuesto.objects.select_related('usuario')),
+    'pagosDeuda': (PagoDeudaPresupuesto, PagoDeudaPresupuestoSerializer, lambda: PagoDeudaPresupuesto.objects.all()),
+}
+CLAVE_POR_MODELO = {modelo: clave for clave, (modelo, _, _) in MODELOS.items()}
+
+LIMITE = 1000
+LIMITE_MAXIMO = 5000
+CLAVE_BLOQUEO = 0x53594e43  # 'SYNC'
+
+
+def bloquear_bitacora():
+    # PostgreSQL: hasta el fin de la transacción nadie más inserta en la bitácora (ver arriba)
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [CLAVE_BLOQUEO])
+
+
+def anotar(cambios):
+    # En una transacción (sin savepoint si ya hay una): en autocommit el lock se soltaría antes de insertar
+    with transaction.atomic(savepoint=False):
+        bloquear_bitacora()
+        CambioSync.objects.bulk_create(cambios, batch_size=1000)
+
+
+def registrar(objs, operacion='upsert'):
+    # Para rutas que escriben con bulk_create/bulk_update y no disparan señales
+    cambios = [
+        CambioSync(modelo=CLAVE_POR_MODELO[type(obj)], objeto_id=obj.pk, operacion=operacion)
+        for obj in objs if type(obj) in CLAVE_POR_MODELO
+    ]
+    if cambios:
+        anotar(cambios)
+
+
+def cambios_desde(cursor, limite=LIMITE, request=None):
+    filas = list(
+        CambioSync.objects.filter(id__gt=cursor).order_by('id')
+        .values_list('id', 'modelo', 'objeto_id', 'operacion')[:limite + 1]
+    )
+    hay_mas = len(filas) > limite
+    filas = filas[:limite]
+
+    # Solo cuenta la última operación de cada objeto dentro de la ventana
+    ultima = {}
+    for _, modelo, objeto_id, operacion in filas:
+        ultima[(modelo, objeto_id)] = operacion
+
+    cambios, eliminados = {}, {}
+    for clave, (_, serializer_class, queryset) in MODELOS.items():
+        vigentes = [objeto_id for (modelo, objeto_id), op in ultima.items() if modelo == clave and op == 'upsert']
+        borrados = [objeto_id for (modelo, objeto_id), op in ultima.items() if modelo == clave and op == 'delete']
+        if vigentes:
+            # Acotado por el límite de la página (hasta LIMITE_MAXIMO cambios)
+            objetos = list(queryset().filter(pk__in=vigentes).order_by('pk'))
+            cambios[clave] = serializer_class(objetos, many=True, context={'request': request}).data
+            # Borrado después de su último upsert pero fuera de la ventana: se informa como tombstone
+            encontrados = {obj.pk for obj in objetos}
+            borrados += [objeto_id for objeto_id in vigentes if objeto_id not in encontrados]
+        if borrados:
+            eliminados[clave] = sorted(borrados)
+
+    return {
+        'cursor': filas[-1][0] if filas else cursor,
+        'hayMas': hay_mas,
+        'cambios': cambios,
+        'eliminados': eliminados,
+    }
@@ -0,0 +1,216 @@
+"""
+Cola de tareas en la base de datos, sin broker.
+
+Las operaciones pesadas de presupuesto (cerrar mes, transferir sobrante,
+generar las cuotas de una deuda) se encolan como filas de Tarea y el
+request responde 202 con el id; `manage.py procesar_tareas` las ejecuta y
+GET /api/tareas/<id>/ informa el estado y el resultado.
+
+- Reclamo: un UPDATE condicionado al estado, así dos workers nunca toman
+  la misma tarea (SQLite y PostgreSQL). Una tarea en curso cuyo plazo
+  (`bloqueada_hasta`) venció se considera abandonada y se retoma; el
+  resultado solo se guarda si la tarea sigue siendo de ese worker y ese
+  intento, si no la ejecución duplicada se deshace.
+- Ejecución: la operación y el cambio a `completada` van en la misma
+  transacción; si el worker muere a mitad de camino no queda nada a medias.
+- Reintentos: los errores inesperados (p. ej. base bloqueada) se reintentan
+  con espera exponencial hasta `max_intentos`; ErrorTarea falla sin reintentar.
+- Idempotencia: con el header Idempotency-Key, repetir el POST devuelve la
+  tarea ya creada en lugar de encolar otra.
+"""
+import logging
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .cuotas import generar_cuotas
+from .models import DeudaPresupuesto, PresupuestoMensual, Tarea
+from .serializers import PresupuestoMensualSerializer
+from . import liquidacion, plan_pagos
+
+logger = logging.getLogger(__name__)
+
+TIPOS = {}
+REINTENTAR_EN = 1  # segundos, Retry-After de las tareas sin terminar
+
+
+class ErrorTarea(Exception):
+    """Fallo definitivo: la tarea queda `fallida` sin reintentos."""
+
+
+class ClaveReutilizada(Exception):
+    pass
+
+
+class PlazoVencido(Exception):
+    """El plazo del worker venció y otro retomó la tarea: su ejecución se descarta."""
+
+
+def tipo_de_tarea(tipo):
+    # Registra la función que ejecuta las tareas de `tipo`: f(parametros, usuario) -> resultado (JSON)
+    def registrar(funcion):
+        TIPOS[tipo] = funcion
+        return funcion
+    return registrar
+
+
+def plazo_bloqueo():
+    return timedelta(seconds=getattr(settings, 'FAMILION_TAREAS_BLOQUEO', 300))
+
+
+def espera_reintento(intentos):
+    return timedelta(seconds=getattr(settings, 'FAMILION_TAREAS_ESPERA', 5) * 2 ** (intentos - 1))
+
+
+def encolar(tipo, parametros, usuario=None, clave=None):
+    """
+    Crea la tarea (al confirmar la transacción en curso queda visible para el
+    worker). Con `clave` devuelve la tarea existente del mismo usuario y clave;
+    si esa clave se usó para otra operación lanza ClaveReutilizada.
+    """
+    if tipo not in TIPOS:
+        raise ValueError(f'Tipo de tarea desconocido: {tipo}')
+    if clave:
+        existente = Tarea.objects.filter(usuario=usuario, clave_idempotencia=clave).first()
+        if existente is None:
+            try:
+                with transaction.atomic():
+                    return Tarea.objects.create(tipo=tipo, parametros=parametros, usuario=usuario, clave_idempotencia=clave)
+            except IntegrityError:
+                # Otro request con la misma clave la creó entretanto
+                existente = Tarea.objects.get(usuario=usuario, clave_idempotencia=clave)
+        if existente.tipo != tipo or existente.parametros != parametros:
+            raise ClaveReutilizada(clave)
+        return existente
+    return Tarea.objects.create(tipo=tipo, parametros=parametros, usuario=usuario)
+
+
+def disponibles(ahora):
+    return Q(estado=Tarea.PENDIENTE, disponible_desde__lte=ahora) | Q(estado=Tarea.EN_CURSO, bloqueada_hasta__lt=ahora)
+
+
+def reclamar(trabajador=''):
+    """Toma la próxima tarea disponible, o None si no hay."""
+    ahora = timezone.now()
+    candidatas = Tarea.objects.filter(disponibles(ahora)).order_by('disponible_desde', 'id').values_list('id', flat=True)
+    for tarea_id in candidatas[:10]:
+        tomada = Tarea.objects.filter(disponibles(ahora), pk=tarea_id).update(
+            estado=Tarea.EN_CURSO, intentos=F('intentos') + 1, bloqueada_hasta=ahora + plazo_bloqueo(),
+            fecha_inicio=ahora, trabajador=trabajador,
+        )
+        if tomada:
+            return Tarea.objects.select_related('usuario').get(pk=tarea_id)
+    return None
+
+
+def propia(tarea):
+    # La tarea sigue reclamada por este worker en este intento (nadie la retomó)
+    return Tarea.objects.filter(pk=tarea.pk, estado=Tarea.EN_CURSO, trabajador=tarea.trabajador, intentos=tarea.intentos)
+
+
+def ejecutar(tarea):
+    try:
+        with transaction.atomic():
+            resultado = TIPOS[tarea.tipo](tarea.parametros, tarea.usuario)
+            completada = propia(tarea).update(
+                estado=Tarea.COMPLETADA, resultado=resultado, error='', bloqueada_hasta=None, fecha_fin=timezone.now()
+            )
+            if not completada:
+                # Deshace lo que hizo esta ejecución duplicada
+                raise PlazoVencido(tarea.pk)
+    except PlazoVencido:
+        logger.warning('Tarea %s: el plazo del intento %s venció y otro worker la retomó', tarea.pk, tarea.intentos)
+    except ErrorTarea as exc:
+        fallar(tarea, str(exc), reintentar=False)
+    except Exception as exc:
+        logger.exception('Tarea %s falló (intento %s de %s)', tarea.pk, tarea.intentos, tarea.max_intentos)
+        fallar(tarea, f'{type(exc).__name__}: {exc}', reintentar=tarea.intentos < tarea.max_intentos)
+    tarea.refresh_from_db()
+    return tarea
+
+
+def fallar(tarea, error, reintentar):
+    ahora = timezone.now()
+    if reintentar:
+        cambios = {'estado': Tarea.PENDIENTE, 'disponible_desde': ahora + espera_reintento(tarea.intentos)}
+    else:
+        cambios = {'estado': Tarea.FALLIDA, 'fecha_fin': ahora}
+    propia(tarea).update(error=error, bloqueada_hasta=None, **cambios)
+
+
+def procesar(limite=None, trabajador=''):
+    """Ejecuta tareas disponibles hasta vaciar la cola (o `limite`); devuelve cuántas procesó."""
+    procesadas = 0
+    while limite is None or procesadas < limite:
+        tarea = reclamar(trabajador)
+        if tarea is None:
+            break
+        ejecutar(tarea)
+        procesadas += 1
+    return procesadas
+
+
+def cabeceras_espera(tarea):
+    # Retry-After mientras la tarea no termina: cada cuánto consultar su estado
+    return {} if tarea.estado in (Tarea.COMPLETADA, Tarea.FALLIDA) else {'Retry-After': str(REINTENTAR_EN)}
+
+
+def respuesta_aceptada(request, tarea):
+    # 202 con el id y la URL de estado de la tarea
+    url = request.build_absolute_uri(reverse('tarea-detail', args=[tarea.pk]))
+    return Response(
+        {'tareaId': tarea.pk, 'estado': tarea.estado, 'url': url},
+        status=status.HTTP_202_ACCEPTED, headers={'Location': url, **cabeceras_espera(tarea)},
+    )
+
+
+@tipo_de_tarea('transferir_sobrante')
+def tarea_transferir_sobrante(parametros, usuario):
+    orden = None
+    if parametros.get('estrategia'):
+        # El orden se calcula al ejecutar, con las deudas de ese momento
+        presupuesto = PresupuestoMensual.objects.filter(pk=parametros['presupuesto_id']).first()
+        if presupuesto is None:
+            raise ErrorTarea('Presupuesto no encontrado.')
+        if not plan_pagos.disponible():
+            raise ErrorTarea('El plan de pagos requiere NumPy.')
+        try:
+            sobrante = parametros.get('sobrante_mensual')
+            orden = plan_pagos.orden_de(
+                presupuesto, parametros['estrategia'], parametros.get('objetivo', 'meses'), parametros.get('orden'),
+                parametros.get('meses') or 60, Decimal(sobrante) if sobrante is not None else None,
+            )
+        except plan_pagos.ErrorPlan as exc:
+            raise ErrorTarea(str(exc))
+    try:
+        resultado = liquidacion.transferir_sobrante(parametros['presupuesto_id'], usuario, orden)
+    except liquidacion.ErrorLiquidacion as exc:
+        raise ErrorTarea(str(exc))
+    if parametros.get('estrategia'):
+        resultado['estrategia'] = parametros['estrategia']
+    return resultado
+
+
+@tipo_de_tarea('cerrar_mes')
+def tarea_cerrar_mes(parametros, usuario):
+    try:
+        return liquidacion.cerrar_mes(parametros['presupuesto_id'], usuario)
+    except liquidacion.ErrorLiquidacion as exc:
+        raise ErrorTarea(str(exc))
+
+
+@tipo_de_tarea('generar_cuotas')
+def tarea_generar_cuotas(parametros, usuario):
+    try:
+        deuda = DeudaPresupuesto.objects.select_related('presupuesto').get(pk=parametros['deuda_id'])
+    except DeudaPresupuesto.DoesNotExist:
+        raise ErrorTarea('La deuda ya no existe.')
+    presupuestos = generar_cuotas(deuda, usuario)
+    return {'presupuestosAfectados': PresupuestoMensualSerializer(presupuestos, many=True).data}
@@ -1,3 +1,1376 @@
-from django.test import TestCase
+from datetime import date, timedelta
+from decimal import Decimal
 
-# Create your tests here.
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from io import BytesIO, StringIO
+from collections import Counter
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import busqueda, derivados, liquidacion, plan_pagos, proyeccion, reportes, saldos, sync, tareas
+from .management.commands import deduplicar_archivos
+from .management.commands.cerrar_meses import procesos_por_defecto
+from .renderers import JSONRapidoRenderer
+from .serializers import CuentaSerializer, MovimientoPresupuestoSerializer
+
+from .models import (
+    Cuenta, Pago, Proveedor, PresupuestoMensual, Aporte, GastoPresupuesto, DeudaPresupuesto, AhorroPresupuesto,
+    MovimientoPresupuesto, SaldoPresupuesto, ArchivoAlmacenado, Profile, Tarea, ResumenMensual,
+    DocumentoBusqueda, CambioSync
+)
+
+
+def crear_cuenta(usuario, proveedor, monto=100, pagos=(), **kwargs):
+    kwargs.setdefault('fecha_vencimiento', date(2025, 1, 10))
+    kwargs.setdefault('categoria', proveedor.categoria)
+    cuenta = Cuenta.objects.create(monto=monto, proveedor=proveedor, creador=usuario, **kwargs)
+    for monto_pagado in pagos:
+        Pago.objects.create(cuenta=cuenta, monto_pagado=monto_pagado, fecha_pago=cuenta.fecha_vencimiento, usuario=usuario)
+    return cuenta
+
+
+class CuentaViewSetTests(APITestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_user('ana', password='x')
+        self.proveedor = Proveedor.objects.create(nombre='Luz', categoria='servicios')
+        self.client.force_authenticate(self.usuario)
+
+    def contar_consultas_listado(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/cuentas/')
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_listado_con_numero_fijo_de_consultas(self):
+        for _ in range(2):
+            crear_cuenta(self.usuario, self.proveedor, pagos=[30, 20])
+        consultas_pocas = self.contar_consultas_listado()
+
+        otro = User.objects.create_user('beto', password='x')
+        for i in range(10):
+            crear_cuenta(otro if i % 2 else self.usuario, self.proveedor, pagos=[10, 10, 10])
+        self.assertEqual(self.contar_consultas_listado(), consultas_pocas)
+
+    def test_totales_calculados_en_servidor(self):
+        pagada = crear_cuenta(self.usuario, self.proveedor, monto=100, pagos=[60, 40])
+        parcial = crear_cuenta(self.usuario, self.proveedor, monto=100, pagos=[25])
+        pendiente = crear_cuenta(self.usuario, self.proveedor, monto=80)
+
+        datos = {c['id']: c for c in self.client.get('/api/cuentas/').data}
+        self.assertEqual(datos[pagada.id]['estado'], 'pagada')
+        self.assertEqual(datos[pagada.id]['totalPagado'], '100.00')
+        self.assertEqual(datos[parcial.id]['estado'], 'parcial')
+        self.assertEqual(datos[parcial.id]['saldoPendiente'], '75.00')
+        self.assertEqual(datos[pendiente.id]['estado'], 'pendiente')
+        self.assertEqual(Decimal(datos[pendiente.id]['saldoPendiente']), Decimal('80'))
+
+        detalle = self.client.get(f'/api/cuentas/{parcial.id}/').data
+        self.assertEqual(detalle['totalPagado'], '25.00')
+        self.assertEqual(detalle['proveedorNombre'], 'Luz')
+
+    def test_paginacion_por_cursor(self):
+        for dia in range(1, 6):
+            crear_cuenta(self.usuario, self.proveedor, fecha_vencimiento=date(2025, 1, dia))
+        primera = self.client.get('/api/cuentas/?page_size=2').data
+        self.assertEqual([c['fechaVencimiento'] for c in primera['results']], ['2025-01-05', '2025-01-04'])
+        siguiente = self.client.get(primera['next']).data
+        self.assertEqual([c['fechaVencimiento'] for c in siguiente['results']], ['2025-01-03', '2025-01-02'])
+        # Sin parámetros de paginación se mantiene la lista completa
+        self.assertEqual(len(self.client.get('/api/cuentas/').data), 5)
+
+    def test_campos_solicitados(self):
+        crear_cuenta(self.usuario, self.proveedor, pagos=[10])
+        with CaptureQueriesContext(connection) as ctx:
+            datos = self.client.get('/api/cuentas/?fields=id,monto,totalPagado').data
+        self.assertEqual(set(datos[0]), {'id', 'monto', 'totalPagado'})
+        # Sin `pagos` no se hace el prefetch
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+    def test_filtros_del_historial(self):
+        pagada = crear_cuenta(self.usuario, self.proveedor, monto=100, pagos=[100], fecha_vencimiento=date(2025, 1, 5))
+        parcial = crear_cuenta(self.usuario, self.proveedor, monto=100, pagos=[30], fecha_vencimiento=date(2025, 2, 5))
+        pendiente = crear_cuenta(self.usuario, self.proveedor, monto=100, fecha_vencimiento=date(2025, 3, 5))
+        otra = crear_cuenta(self.usuario, Proveedor.objects.create(nombre='Agua', categoria='agua'))
+
+        def ids(query):
+            return {c['id'] for c in self.client.get(f'/api/cuentas/?{query}').data}
+
+        self.assertEqual(ids('estado=pagada'), {pagada.id})
+        self.assertEqual(ids('estado=parcial'), {parcial.id})
+        self.assertEqual(ids('estado=pendiente&categoria=servicios'), {parcial.id, pendiente.id})
+        self.assertEqual(ids('fecha_desde=2025-02-01&fecha_hasta=2025-02-28'), {parcial.id})
+        self.assertEqual(ids(f'proveedor={otra.proveedor_id}'), {otra.id})
+        self.assertEqual(self.client.get('/api/cuentas/?estado=otro').status_code, 400)
+
+    def test_exportacion_usa_los_mismos_filtros(self):
+        crear_cuenta(self.usuario, self.proveedor, monto=100, pagos=[60, 40])
+        parcial = crear_cuenta(self.usuario, self.proveedor, monto=100, pagos=[30])
+        response = self.client.get('/api/cuentas/exportar/?estado=pendiente')
+        filas = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(filas), 2)
+        self.assertTrue(filas[1].startswith(f'{parcial.id},'))
+        self.assertIn(',Pago Parcial,30.00,2025-01-10', filas[1])
+
+
+
+class PresupuestoResumenTests(APITestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_user('ana', password='x')
+        self.client.force_authenticate(self.usuario)
+        self.presupuesto = PresupuestoMensual.objects.create(
+            familia='familia_camnr', fecha_mes=date(2025, 5, 1), monto_objetivo=1000
+        )
+
+    def crear(self, ruta, **datos):
+        response = self.client.post(f'/api/{ruta}/', {'presupuesto': self.presupuesto.id, **datos}, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data
+
+    def test_resumen_agregado(self):
+        proveedor = Proveedor.objects.create(nombre='Luz', categoria='servicios')
+        cuenta = crear_cuenta(self.usuario, proveedor)
+        self.crear('aportes', monto=500)
+        self.crear('aportes', monto=300)
+        self.crear('gastos-presupuesto', cuenta=cuenta.id, monto=100)
+        self.crear('ahorros-presupuesto', monto=30)
+        self.crear('deudas-presupuesto', monto=50, motivo='a', categoria='banco', pagado=True)
+        self.crear('deudas-presupuesto', monto=20, motivo='b', categoria='banco')
+
+        with CaptureQueriesContext(connection) as ctx:
+            datos = self.client.get(f'/api/presupuestos/{self.presupuesto.id}/resumen/').data
+        self.assertLessEqual(len(ctx.captured_queries), 2)
+        self.assertEqual(datos['totalAportes'], '800.00')
+        self.assertEqual(datos['totalGastos'], '100.00')
+        self.assertEqual(datos['totalAhorros'], '30.00')
+        self.assertEqual(datos['totalDeudasPagadas'], '50.00')
+        self.assertEqual(datos['totalDeudasNoPagadas'], '20.00')
+        self.assertEqual(datos['sobrante'], '620.00')
+        self.assertEqual(
+            [(c['categoria'], c['gastos'], c['deudasPagadas'], c['deudasPendientes']) for c in datos['porCategoria']],
+            [('banco', '0.00', '50.00', '20.00'), ('servicios', '100.00', '0.00', '0.00')]
+        )
+
+    def test_saldo_incremental(self):
+        aporte = self.crear('aportes', monto=500)
+        deuda = self.crear('deudas-presupuesto', monto=80, motivo='préstamo')
+        self.client.patch(f"/api/aportes/{aporte['id']}/", {'monto': 450}, format='json')
+        self.client.post('/api/pagos-deuda/', {'deuda': deuda['id'], 'monto_pagado': 80}, format='json')
+        self.client.delete(f"/api/aportes/{self.crear('aportes', monto=99)['id']}/")
+
+        saldo = SaldoPresupuesto.objects.get(presupuesto=self.presupuesto)
+        self.assertEqual(saldo.total_aportes, Decimal('450'))
+        self.assertEqual(saldo.total_deudas_pagadas, Decimal('80'))
+        self.assertEqual(saldo.total_deudas_no_pagadas, Decimal('0'))
+        self.assertEqual(saldo.sobrante, Decimal('370'))
+
+        salida = StringIO()
+        call_command('recalcular_saldos', '--verificar', stdout=salida)
+        self.assertIn('Todos los saldos coinciden', salida.getvalue())
+
+        # Escrituras por el ORM fuera de la API (admin, shell) también lo mantienen
+        extra = Aporte.objects.create(presupuesto=self.presupuesto, monto=50)
+        deuda_orm = DeudaPresupuesto.objects.create(presupuesto=self.presupuesto, monto=20, motivo='orm')
+        deuda_orm.pagado = True
+        deuda_orm.save()
+        GastoPresupuesto.objects.create(presupuesto=self.presupuesto, monto=15).delete()
+        saldo = SaldoPresupuesto.objects.get(presupuesto=self.presupuesto)
+        self.assertEqual((saldo.total_aportes, saldo.total_deudas_pagadas, saldo.total_gastos), (Decimal('500'), Decimal('100'), Decimal('0')))
+        salida = StringIO()
+        call_command('recalcular_saldos', '--verificar', stdout=salida)
+        self.assertIn('Todos los saldos coinciden', salida.getvalue())
+        # Borrar el presupuesto entero no deja saldos huérfanos
+        otro = PresupuestoMensual.objects.create(familia='familia_camnr', fecha_mes=date(2025, 12, 1), monto_objetivo=0)
+        Aporte.objects.create(presupuesto=otro, monto=5)
+        otro.delete()
+        self.assertFalse(SaldoPresupuesto.objects.filter(presupuesto_id=otro.pk).exists())
+
+        # update() no dispara señales: se corrige reconstruyendo
+        Aporte.objects.filter(pk=extra.pk).update(monto=60)
+        call_command('recalcular_saldos', '--verificar', stdout=salida)
+        self.assertIn('total_aportes = 500.00, esperado 510.00', salida.getvalue())
+        call_command('recalcular_saldos', stdout=StringIO())
+        self.assertEqual(SaldoPresupuesto.objects.get(presupuesto=self.presupuesto).total_aportes, Decimal('510'))
+
+    def test_resumen_vacio(self):
+        datos = self.client.get(f'/api/presupuestos/{self.presupuesto.id}/resumen/').data
+        self.assertEqual(datos['sobrante'], '0.00')
+        self.assertEqual(datos['porCategoria'], [])
+
+
+
+class DeudaCuotasTests(APITestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_user('ana', password='x')
+        self.client.force_authenticate(self.usuario)
+        self.presupuesto = PresupuestoMensual.objects.create(
+            familia='familia_camnr', fecha_mes=date(2025, 11, 1), monto_objetivo=1000
+        )
+
+    def crear_deuda(self, cuotas, motivo):
+        response = self.client.post('/api/deudas-presupuesto/', {
+            'presupuesto': self.presupuesto.id, 'monto': 360, 'motivo': motivo,
+            'cuotas_totales': cuotas, 'fecha_inicio': '2025-11-01',
+        }, format='json')
+        self.assertEqual(response.status_code, 202, response.data)
+        # Las cuotas se generan en la cola: las consultas de la tarea no dependen de las cuotas
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(tareas.procesar(), 1)
+        self.assertEqual(Tarea.objects.get(pk=response.data['tarea']['tareaId']).estado, Tarea.COMPLETADA)
+        return len(ctx.captured_queries)
+
+    def test_cuotas_en_lote(self):
+        consultas_3 = self.crear_deuda(3, 'tv')
+        consultas_36 = self.crear_deuda(36, 'auto')
+        self.assertEqual(consultas_36, consultas_3)
+
+        cuotas = DeudaPresupuesto.objects.filter(motivo='auto', cuotas_totales=1).select_related('presupuesto')
+        self.assertEqual(cuotas.count(), 35)
+        self.assertEqual({c.monto for c in cuotas}, {Decimal('10.00')})
+        self.assertEqual(max(c.presupuesto.fecha_mes for c in cuotas), date(2028, 10, 1))
+        self.assertEqual(PresupuestoMensual.objects.count(), 36)
+        # Los meses nuevos también tienen su saldo
+        self.assertEqual(SaldoPresupuesto.objects.get(presupuesto__fecha_mes=date(2026, 1, 1)).total_deudas_no_pagadas, Decimal('130.00'))
+
+    def test_no_duplica_cuotas(self):
+        self.crear_deuda(3, 'tv')
+        self.crear_deuda(3, 'tv')
+        self.assertEqual(DeudaPresupuesto.objects.filter(motivo='tv', cuotas_totales=1).count(), 2)
+
+
+
+class TareasTests(APITestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_user('ana', password='x')
+        self.client.force_authenticate(self.usuario)
+        self.presupuesto = PresupuestoMensual.objects.create(familia='familia_camnr', fecha_mes=date(2025, 11, 1), monto_objetivo=100)
+        Aporte.objects.create(presupuesto=self.presupuesto, usuario=self.usuario, monto=100)
+        GastoPresupuesto.objects.create(presupuesto=self.presupuesto, monto=30)
+
+    def url(self, operacion):
+        return f'/api/presupuesto/{self.presupuesto.id}/{operacion}/'
+
+    def test_transferir_sobrante_en_cola(self):
+        response = self.client.post(self.url('transferir-sobrante'))
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual((response['Location'], response['Retry-After']), (response.data['url'], '1'))
+        self.assertFalse(AhorroPresupuesto.objects.exists())
+        pendiente = self.client.get(response['Location'])
+        self.assertEqual((pendiente.data['estado'], pendiente['Retry-After']), ('pendiente', '1'))
+
+        self.assertEqual(tareas.procesar(), 1)
+        terminada = self.client.get(response['Location'])
+        self.assertNotIn('Retry-After', terminada)
+        estado = terminada.data
+        self.assertEqual((estado['estado'], estado['intentos']), ('completada', 1))
+        self.assertEqual(Decimal(estado['resultado']['ahorrado']), Decimal('70'))
+        self.assertEqual(AhorroPresupuesto.objects.get().monto, Decimal('70.00'))
+        # Sin sobrante ya no se encola
+        self.assertEqual(self.client.post(self.url('transferir-sobrante')).status_code, 400)
+
+        cierre = self.client.post(self.url('cerrar-mes'))
+        tareas.procesar()
+        resultado = self.client.get(cierre['Location']).data['resultado']
+        self.assertEqual(resultado['transferencia'], {'detail': 'No hay sobrante para transferir.'})
+        self.assertEqual(self.client.post('/api/presupuesto/999/cerrar-mes/').status_code, 404)
+
+        otro = User.objects.create_user('beto', password='x')
+        self.client.force_authenticate(otro)
+        self.assertEqual(self.client.get(response['Location']).status_code, 404)
+
+    def test_idempotency_key(self):
+        primera = self.client.post(self.url('transferir-sobrante'), HTTP_IDEMPOTENCY_KEY='k1')
+        segunda = self.client.post(self.url('transferir-sobrante'), HTTP_IDEMPOTENCY_KEY='k1')
+        self.assertEqual(primera.data['tareaId'], segunda.data['tareaId'])
+        self.assertEqual(Tarea.objects.count(), 1)
+        self.assertEqual(self.client.post(self.url('cerrar-mes'), HTTP_IDEMPOTENCY_KEY='k1').status_code, 422)
+        # Reintento después de ejecutada: la misma tarea, no "No hay sobrante"
+        tareas.procesar()
+        tercera = self.client.post(self.url('transferir-sobrante'), HTTP_IDEMPOTENCY_KEY='k1')
+        self.assertEqual((tercera.status_code, tercera.data['tareaId'], tercera.data['estado']), (202, primera.data['tareaId'], 'completada'))
+        self.assertEqual(self.client.post(self.url('transferir-sobrante')).status_code, 400)
+
+        datos = {'presupuesto': self.presupuesto.id, 'monto': 300, 'motivo': 'tv', 'cuotas_totales': 3}
+        deuda = self.client.post('/api/deudas-presupuesto/', datos, format='json', HTTP_IDEMPOTENCY_KEY='k2')
+        repetida = self.client.post('/api/deudas-presupuesto/', datos, format='json', HTTP_IDEMPOTENCY_KEY='k2')
+        self.assertEqual((deuda.status_code, repetida.status_code), (202, 202))
+        self.assertEqual(deuda.data['id'], repetida.data['id'])
+        self.assertEqual(deuda.data['tarea']['tareaId'], repetida.data['tarea']['tareaId'])
+        self.assertEqual(DeudaPresupuesto.objects.count(), 1)
+        # Sin cuotas no hay tarea: 201 como antes
+        datos['cuotas_totales'] = 1
+        self.assertEqual(self.client.post('/api/deudas-presupuesto/', datos, format='json').status_code, 201)
+
+    @override_settings(FAMILION_TAREAS_ESPERA=0)
+    def test_reintentos(self):
+        fallos = []
+
+        def inestable(parametros, usuario):
+            if len(fallos) < parametros['fallos']:
+                fallos.append(1)
+                raise OperationalError('database is locked')
+            return {'ok': True}
+
+        def invalida(parametros, usuario):
+            raise tareas.ErrorTarea('Datos inválidos.')
+
+        self.addCleanup(tareas.TIPOS.pop, 'inestable')
+        self.addCleanup(tareas.TIPOS.pop, 'invalida')
+        tareas.tipo_de_tarea('inestable')(inestable)
+        tareas.tipo_de_tarea('invalida')(invalida)
+
+        recuperada = tareas.encolar('inestable', {'fallos': 2})
+        tareas.procesar()
+        recuperada.refresh_from_db()
+        self.assertEqual((recuperada.estado, recuperada.intentos, recuperada.resultado), ('completada', 3, {'ok': True}))
+
+        fallos.clear()
+        agotada = tareas.encolar('inestable', {'fallos': 5})
+        definitiva = tareas.encolar('invalida', {})
+        tareas.procesar()
+        agotada.refresh_from_db()
+        definitiva.refresh_from_db()
+        self.assertEqual((agotada.estado, agotada.intentos), ('fallida', 3))
+        self.assertIn('database is locked', agotada.error)
+        self.assertEqual((definitiva.estado, definitiva.intentos, definitiva.error), ('fallida', 1, 'Datos inválidos.'))
+
+    def test_tarea_abandonada_se_retoma(self):
+        tarea = tareas.encolar('transferir_sobrante', {'presupuesto_id': self.presupuesto.id}, self.usuario)
+        self.assertEqual(tareas.reclamar('w1').pk, tarea.pk)
+        # En curso y con el plazo vigente nadie más la toma
+        self.assertIsNone(tareas.reclamar('w2'))
+        Tarea.objects.filter(pk=tarea.pk).update(bloqueada_hasta=timezone.now() - timedelta(seconds=1))
+        retomada = tareas.reclamar('w2')
+        self.assertEqual((retomada.pk, retomada.intentos, retomada.trabajador), (tarea.pk, 2, 'w2'))
+
+    def test_worker_con_plazo_vencido_no_pisa_el_resultado(self):
+        tarea = tareas.encolar('transferir_sobrante', {'presupuesto_id': self.presupuesto.id}, self.usuario)
+        lento = tareas.reclamar('w1')
+        Tarea.objects.filter(pk=tarea.pk).update(bloqueada_hasta=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(tareas.ejecutar(tareas.reclamar('w2')).estado, 'completada')
+        # El worker lento termina después: sin sobrante falla, pero no la marca fallida
+        self.assertEqual(tareas.ejecutar(lento).estado, 'completada')
+        self.assertEqual(AhorroPresupuesto.objects.count(), 1)
+
+        # Si su ejecución sí escribe, se deshace
+        AhorroPresupuesto.objects.all().delete()
+        saldos.reconstruir()
+        tarea = tareas.encolar('transferir_sobrante', {'presupuesto_id': self.presupuesto.id}, self.usuario)
+        lento = tareas.reclamar('w1')
+        Tarea.objects.filter(pk=tarea.pk).update(estado=Tarea.COMPLETADA)
+        self.assertEqual(tareas.ejecutar(lento).estado, 'completada')
+        self.assertFalse(AhorroPresupuesto.objects.exists())
+
+
+class LiquidacionTests(APITestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_user('ana', password='x')
+        self.presupuesto = PresupuestoMensual.objects.create(familia='familia_camnr', fecha_mes=date(2025, 11, 1), monto_objetivo=100)
+        Aporte.objects.create(presupuesto=self.presupuesto, usuario=self.usuario, monto=100)
+        GastoPresupuesto.objects.create(presupuesto=self.presupuesto, monto=30)
+
+    def deudas(self, *montos):
+        deudas = [DeudaPresupuesto.objects.create(presupuesto=self.presupuesto, monto=m, motivo=f'd{i}') for i, m in enumerate(montos)]
+        saldos.reconstruir()
+        return deudas
+
+    def assertSaldosConsistentes(self):
+        guardado = SaldoPresupuesto.objects.get(presupuesto=self.presupuesto)
+        calculado, = saldos.calcular(PresupuestoMensual.objects.filter(pk=self.presupuesto.pk))
+        for campo in saldos.CAMPOS:
+            self.assertEqual(getattr(guardado, campo), getattr(calculado, campo), campo)
+
+    def test_paga_en_orden_sin_adelantar_deudas(self):
+        primera, segunda, tercera, cuarta = self.deudas(20, 30, 40, 5)
+        resultado = liquidacion.transferir_sobrante(self.presupuesto.id, self.usuario)
+        self.assertEqual(
+            (resultado['pagadoEnDeudas'], resultado['ahorrado'], resultado['sinAsignar']),
+            (Decimal('50'), Decimal('0'), Decimal('20'))
+        )
+        pagadas = set(DeudaPresupuesto.objects.filter(pagado=True, fecha_pago__isnull=False).values_list('id', flat=True))
+        self.assertEqual(pagadas, {primera.id, segunda.id})
+        self.assertEqual(MovimientoPresupuesto.objects.filter(tipo='deuda').count(), 2)
+        self.assertFalse(AhorroPresupuesto.objects.exists())
+        self.assertSaldosConsistentes()
+
+    def test_sobrante_que_cubre_todo_va_a_ahorro(self):
+        self.deudas(20, 30)
+        resultado = liquidacion.transferir_sobrante(self.presupuesto.id, self.usuario)
+        self.assertEqual((resultado['pagadoEnDeudas'], resultado['ahorrado']), (Decimal('50'), Decimal('20')))
+        self.assertEqual(AhorroPresupuesto.objects.get().id, resultado['ahorroId'])
+        self.assertSaldosConsistentes()
+        # Ya no queda sobrante
+        with self.assertRaises(liquidacion.ErrorLiquidacion):
+            liquidacion.transferir_sobrante(self.presupuesto.id, self.usuario)
+
+    def test_consultas_no_dependen_de_las_deudas(self):
+        def consultas(cantidad):
+            DeudaPresupuesto.objects.all().delete()
+            AhorroPresupuesto.objects.all().delete()
+            self.deudas(*[Decimal('0.10')] * cantidad)
+            with CaptureQueriesContext(connection) as ctx:
+                resultado = liquidacion.transferir_sobrante(self.presupuesto.id, self.usuario)
+            self.assertEqual(len(resultado['movimientos']), cantidad)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(consultas(3), consultas(100))
+        # Más allá, solo los lotes que impone el límite de parámetros de la base
+        self.assertLess(consultas(300), 30)
+        self.assertSaldosConsistentes()
+
+
+class CerrarMesesTests(APITestCase):
+    def test_cierra_meses_abiertos_de_todas_las_familias(self):
+        usuario = User.objects.create_user('ana', password='x')
+        for familia in ('a', 'b'):
+            for mes in (1, 2, 3):
+                presupuesto = PresupuestoMensual.objects.create(familia=familia, fecha_mes=date(2025, mes, 1), monto_objetivo=0)
+                Aporte.objects.create(presupuesto=presupuesto, usuario=usuario, monto=10 * mes)
+        PresupuestoMensual.objects.filter(familia='b', fecha_mes=date(2025, 1, 1)).update(cerrado=True)
+
+        salida = StringIO()
+        call_command('cerrar_meses', '--hasta', '2025-02-01', '--procesos', '1', '--usuario', 'ana', stdout=salida)
+        informe = json.loads(salida.getvalue())
+        self.assertEqual(informe['totales'], {'familias': 2, 'mesesCerrados': 3, 'familiasConError': 0})
+        por_familia = {f['familia']: f for f in informe['familias']}
+        self.assertEqual([m['fechaMes'] for m in por_familia['a']['meses']], ['2025-01-01', '2025-02-01'])
+        self.assertEqual(Decimal(por_familia['a']['meses'][1]['ahorrado']), Decimal('20'))
+        self.assertEqual(
+            set(PresupuestoMensual.objects.filter(cerrado=False).values_list('familia', 'fecha_mes')),
+            {('a', date(2025, 3, 1)), ('b', date(2025, 3, 1))}
+        )
+        self.assertFalse(PresupuestoMensual.objects.filter(cerrado=True, fecha_cierre__isnull=True).exclude(familia='b', fecha_mes=date(2025, 1, 1)).exists())
+        self.assertEqual(MovimientoPresupuesto.objects.filter(tipo='ahorro', usuario=usuario).count(), 3)
+
+        # Nada más que cerrar; y por la API, un mes cerrado no se vuelve a encolar
+        salida = StringIO()
+        call_command('cerrar_meses', '--hasta', '2025-02-01', '--procesos', '1', stdout=salida)
+        self.assertEqual(json.loads(salida.getvalue())['totales']['familias'], 0)
+        self.client.force_authenticate(usuario)
+        cerrado = PresupuestoMensual.objects.get(familia='a', fecha_mes=date(2025, 1, 1))
+        self.assertEqual(self.client.post(f'/api/presupuesto/{cerrado.id}/cerrar-mes/').status_code, 400)
+
+        # Reintento con la clave después de ejecutada: la tarea original
+        abierto = PresupuestoMensual.objects.get(familia='a', fecha_mes=date(2025, 3, 1))
+        primera = self.client.post(f'/api/presupuesto/{abierto.id}/cerrar-mes/', HTTP_IDEMPOTENCY_KEY='c1')
+        tareas.procesar()
+        reintento = self.client.post(f'/api/presupuesto/{abierto.id}/cerrar-mes/', HTTP_IDEMPOTENCY_KEY='c1')
+        self.assertEqual((reintento.status_code, reintento.data['tareaId'], reintento.data['estado']), (202, primera.data['tareaId'], 'completada'))
+        self.assertEqual(self.client.post(f'/api/presupuesto/{cerrado.id}/cerrar-mes/', HTTP_IDEMPOTENCY_KEY='c1').status_code, 422)
+
+    @skipUnless(connection.vendor == 'sqlite', 'Bloqueos propios de SQLite')
+    def test_varios_procesos_con_sqlite_por_defecto(self):
+        # En otro proceso y sobre un archivo: los procesos del pool no ven la base en memoria de los tests
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio)
+        entorno = dict(os.environ, FAMILION_SQLITE_NAME=os.path.join(directorio, 'cierre.sqlite3'))
+        entorno.pop('FAMILION_SQLITE_PERFIL', None)
+        manage = os.path.join(settings.BASE_DIR, 'manage.py')
+        subprocess.run([sys.executable, manage, 'migrate', '-v0'], env=entorno, check=True)
+        subprocess.run([sys.executable, manage, 'shell', '-c', (
+            'from datetime import date\n'
+            'from api.models import PresupuestoMensual, GastoPresupuesto, DeudaPresupuesto\n'
+            'for familia in range(8):\n'
+            '    for mes in range(1, 7):\n'
+            '        p = PresupuestoMensual.objects.create(familia=f"f{familia}", fecha_mes=date(2025, mes, 1), monto_objetivo=0)\n'
+            '        GastoPresupuesto.objects.create(presupuesto=p, monto=10)\n'
+            '        DeudaPresupuesto.objects.create(presupuesto=p, monto=5, motivo="d")\n'
+        )], env=entorno, check=True, capture_output=True)
+
+        def cerrar(*opciones):
+            informe = os.path.join(directorio, 'informe.json')
+            subprocess.run([sys.executable, manage, 'cerrar_meses', *opciones, '--informe', informe],
+                           env=entorno, check=True, capture_output=True)
+            with open(informe, encoding='utf-8') as archivo:
+                return json.load(archivo)
+
+        informe = cerrar('--hasta', '2025-06-01', '--procesos', '2')
+        self.assertEqual(informe['procesos'], 2)
+        self.assertEqual(informe['totales'], {'familias': 8, 'mesesCerrados': 48, 'familiasConError': 0})
+        self.assertEqual(cerrar('--hasta', '2025-06-01')['totales']['familias'], 0)
+
+        # Sin --procesos: en SQLite sin el perfil de producción, uno solo
+        self.assertEqual(procesos_por_defecto(), 1)
+        with mock.patch.dict(connection.settings_dict, {'OPTIONS': {'transaction_mode': 'IMMEDIATE'}}):
+            self.assertEqual(procesos_por_defecto(), os.cpu_count())
+
+
+class ImportacionTests(APITestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_user('ana', password='x')
+        self.client.force_authenticate(self.usuario)
+
+    def test_reimporta_la_exportacion(self):
+        presupuesto = PresupuestoMensual.objects.create(familia='familia_camnr', fecha_mes=date(2025, 1, 1), monto_objetivo=0)
+        proveedor = Proveedor.objects.create(nombre='Luz', categoria='servicios')
+        crear_cuenta(self.usuario, proveedor, monto=100, pagos=[40])
+        crear_cuenta(self.usuario, proveedor, monto=60, fecha_vencimiento=date(2025, 2, 3))
+        exportado = b''.join(self.client.get('/api/cuentas/exportar/').streaming_content)
+
+        response = self.client.post('/api/cuentas/importar/', {'archivo': StringIO(exportado.decode())}, format='multipart')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data, {'cuentas': 2, 'pagos': 1, 'gastos': 1, 'proveedoresCreados': 0})
+        self.assertEqual(Cuenta.objects.filter(proveedor=proveedor).count(), 4)
+        self.assertEqual(GastoPresupuesto.objects.get(presupuesto=presupuesto).monto, Decimal('40.00'))
+        self.assertEqual(SaldoPresupuesto.objects.get(presupuesto=presupuesto).total_gastos, Decimal('40.00'))
+
+    def test_json_con_errores_no_escribe_nada(self):
+        filas = [
+            {'monto': 10, 'proveedor': 'Agua', 'categoria': 'agua', 'fechaVencimiento': '2025-03-01', 'montoPagado': 10},
+            {'monto': 'diez', 'proveedor': 'Agua', 'categoria': 'agua', 'fechaVencimiento': '2025-03-01'},
+        ]
+        response = self.client.post('/api/cuentas/importar/', filas, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['errores'], [{'fila': 2, 'errores': {'monto': 'Número inválido.'}}])
+        self.assertFalse(Proveedor.objects.filter(nombre='Agua').exists())
+
+        response = self.client.post('/api/cuentas/importar/', filas[:1], format='json')
+        self.assertEqual(response.data['proveedoresCreados'], 1)
+        cuenta = Cuenta.objects.get(proveedor__nombre='Agua')
+        self.assertEqual(cuenta.nombre, 'agua / March 2025')
+        self.assertEqual(cuenta.pagos.get().usuario, self.usuario)
+
+    def test_montos_no_finitos_fuera_de_rango_y_textos_largos(self):
+        fila = {'monto': 10, 'proveedor': 'Agua', 'categoria': 'agua', 'fechaVencimiento': '2025-03-01'}
+        filas = [
+            {**fila, 'monto': 'NaN'},
+            {**fila, 'montoPagado': 'Infinity'},
+            {**fila, 'monto': '1e20'},
+            {**fila, 'categoria': 'a' * 51, 'proveedor': 'p' * 101},
+        ]
+        response = self.client.post('/api/cuentas/importar/', filas, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['errores'], [
+            {'fila': 1, 'errores': {'monto': 'Número inválido.'}},
+            {'fila': 2, 'errores': {'monto_pagado': 'Número inválido.'}},
+            {'fila': 3, 'errores': {'monto': 'No puede ser mayor a 99999999.99.'}},
+            {'fila': 4, 'errores': {'proveedor': 'No puede tener más de 100 caracteres.',
+                                    'categoria': 'No puede tener más de 50 caracteres.'}},
+        ])
+        self.assertFalse(Cuenta.objects.exists())
+
+
+class ReportesTests(APITestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_user('ana', password='x')
+        self.luz = Proveedor.objects.create(nombre='Luz', categoria='servicios')
+        self.client.force_authenticate(self.usuario)
+
+    def assertResumenCoincide(self):
+        # El resumen incremental debe ser igual al recalculado desde cero (ignorando filas en cero)
+        def claves(filas):
+            campos = [f'{medida}_{tipo}' for tipo in reportes.TIPOS for medida in ('total', 'cantidad')]
+            return {
+                tuple(getattr(f, c) for c in reportes.CLAVE): tuple(getattr(f, c) for c in campos)
+                for f in filas if any(getattr(f, c) for c in campos)
+            }
+        self.assertEqual(claves(ResumenMensual.objects.all()), claves(reportes.calcular()))
+
+    def test_se_mantiene_al_crear_editar_y_borrar(self):
+        bea = User.objects.create_user('bea', password='x')
+        presupuesto = PresupuestoMensual.objects.create(familia='familia_camnr', fecha_mes=date(2025, 1, 1), monto_objetivo=0)
+        cuenta = crear_cuenta(self.usuario, self.luz, monto=100, pagos=[40, 60])
+        otra = crear_cuenta(bea, self.luz, monto=30, fecha_vencimiento=date(2025, 2, 5), pagos=[30])
+        gasto = GastoPresupuesto.objects.create(presupuesto=presupuesto, cuenta=cuenta, monto=40, pagado_por=bea)
+        self.assertResumenCoincide()
+        fila = ResumenMensual.objects.get(mes=date(2025, 1, 1), usuario=self.usuario.id)
+        self.assertEqual((fila.total_cuentas, fila.total_pagos, fila.cantidad_pagos), (Decimal('100'), Decimal('100'), 2))
+
+        # Cambios en la cuenta mueven también sus pagos y gastos
+        cuenta.categoria = 'luz'
+        cuenta.save()
+        presupuesto.fecha_mes = date(2025, 3, 1)
+        presupuesto.save()
+        pago = cuenta.pagos.first()
+        pago.monto_pagado = 45
+        pago.save()
+        self.assertResumenCoincide()
+        self.assertEqual(ResumenMensual.objects.get(mes=date(2025, 3, 1)).total_gastos, Decimal('40'))
+
+        # Borrar la cuenta borra sus pagos y deja el gasto sin cuenta; borrar un usuario deja el gasto sin usuario
+        cuenta.delete()
+        self.assertResumenCoincide()
+        bea.delete()
+        self.assertFalse(Cuenta.objects.filter(pk=otra.pk).exists())
+        self.assertResumenCoincide()
+        gasto.refresh_from_db()
+        self.assertIsNone(gasto.pagado_por)
+        gasto.delete()
+        presupuesto.delete()
+        self.assertResumenCoincide()
+
+    def test_importacion_y_reconstruccion(self):
+        filas = [
+            {'monto': 10, 'proveedor': 'Agua', 'categoria': 'agua', 'fechaVencimiento': '2025-03-01', 'montoPagado': 10},
+            {'monto': 20, 'proveedor': 'Agua', 'categoria': 'agua', 'fechaVencimiento': '2025-03-20'},
+        ]
+        self.assertEqual(self.client.post('/api/cuentas/importar/', filas, format='json').status_code, 201)
+        self.assertResumenCoincide()
+        fila = ResumenMensual.objects.get(categoria='agua')
+        self.assertEqual((fila.total_cuentas, fila.cantidad_cuentas, fila.total_pagos), (Decimal('30'), 2, Decimal('10')))
+
+        ResumenMensual.objects.update(total_cuentas=0)
+        salida = StringIO()
+        call_command('recalcular_reportes', '--verificar', stdout=salida)
+        self.assertIn('1 diferencia(s)', salida.getvalue())
+        call_command('recalcular_reportes', stdout=StringIO())
+        salida = StringIO()
+        call_command('recalcular_reportes', '--verificar', stdout=salida)
+        self.assertIn('Todos los totales coinciden.', salida.getvalue())
+
+    def test_tendencias_con_variacion_interanual(self):
+        agua = Proveedor.objects.create(nombre='Agua', categoria='agua')
+        crear_cuenta(self.usuario, self.luz, monto=100, fecha_vencimiento=date(2024, 1, 10), pagos=[100])
+        crear_cuenta(self.usuario, self.luz, monto=150, fecha_vencimiento=date(2025, 1, 12))
+        crear_cuenta(self.usuario, agua, monto=20, fecha_vencimiento=date(2025, 2, 1))
+
+        response = self.client.get('/api/reportes/tendencias/', {'desde': '2024-01', 'hasta': '2025-02'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['meses']), 14)
+        servicios, agua_serie = response.data['series']
+        self.assertEqual(servicios['nombre'], 'servicios')
+        self.assertEqual(servicios['cuentas'][0], '100.00')
+        self.assertEqual(servicios['pagos'][0], '100.00')
+        self.assertEqual(servicios['cuentas'][12], '150.00')
+        self.assertEqual(agua_serie['cuentas'][13], '20.00')
+        anual = response.data['anual']
+        self.assertEqual([a['anio'] for a in anual], [2024, 2025])
+        self.assertEqual(anual[1]['cuentas'], '170.00')
+        self.assertEqual(anual[1]['variacion']['cuentas'], 70.0)
+        self.assertIsNone(anual[0]['variacion']['cuentas'])
+
+        response = self.client.get('/api/reportes/tendencias/', {'desde': '2024-01', 'hasta': '2025-02', 'agrupar': 'proveedor'})
+        self.assertEqual({s['nombre'] for s in response.data['series']}, {'Luz', 'Agua'})
+        self.assertEqual(self.client.get('/api/reportes/tendencias/', {'agrupar': 'color'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/reportes/tendencias/', {'desde': '2025-13'}).status_code, 400)
+        self.assertEqual(len(self.client.get('/api/reportes/tendencias/').data['meses']), 24)
+
+class ProyeccionTests(APITestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_user('ana', password='x')
+        self.client.force_authenticate(self.usuario)
+
+    def presupuesto(self, mes):
+        return PresupuestoMensual.objects.get_or_create(familia='familia_camnr', fecha_mes=mes, defaults={'monto_objetivo': 0})[0]
+
+    @skipUnless(proyeccion.disponible(), 'La proyección requiere NumPy')
+    def test_proyecta_cuotas_vencidas_y_cuentas_recurrentes(self):
+        febrero, marzo = self.presupuesto(date(2025, 2, 1)), self.presupuesto(date(2025, 3, 1))
+        # 3 cuotas de 100 desde febrero: la de febrero ya pasó y la de marzo ya tiene su deuda remanente
+        DeudaPresupuesto.objects.create(presupuesto=febrero, monto=300, motivo='Auto', cuotas_totales=3, fecha_inicio=date(2025, 2, 1))
+        DeudaPresupuesto.objects.create(presupuesto=marzo, monto=100, motivo='Auto', fecha_inicio=date(2025, 3, 1))
+        DeudaPresupuesto.objects.create(presupuesto=self.presupuesto(date(2025, 1, 1)), monto=50, motivo='Vencida')
+        DeudaPresupuesto.objects.create(presupuesto=marzo, monto=40, motivo='Quincenal', cuotas_totales=4, frecuencia='quincenal',
+                                        fecha_inicio=date(2025, 3, 1))
+        luz, agua = Proveedor.objects.create(nombre='Luz', categoria='luz'), Proveedor.objects.create(nombre='Agua', categoria='agua')
+        for i in range(12):
+            mes = date(2024 + (i + 2) // 12, (i + 2) % 12 + 1, 5)
+            crear_cuenta(self.usuario, luz, monto=35 if mes.month == 4 else 20, fecha_vencimiento=mes)
+        crear_cuenta(self.usuario, agua, monto=500, fecha_vencimiento=date(2024, 6, 1))
+        Aporte.objects.create(presupuesto=self.presupuesto(date(2025, 1, 1)), usuario=self.usuario, monto=1000)
+        Aporte.objects.create(presupuesto=febrero, usuario=self.usuario, monto=1200)
+
+        response = self.client.get('/api/proyeccion/', {'desde': '2025-03', 'meses': 3, 'saldo_inicial': '100'})
+        self.assertEqual(response.status_code, 200, response.data)
+        datos = response.data
+        self.assertEqual(datos['meses'], ['2025-03', '2025-04', '2025-05'])
+        self.assertEqual(datos['ingresoMensual'], '1100.00')
+        self.assertEqual(datos['deudas'], ['180.00', '110.00', '0.00'])
+        self.assertEqual(datos['cuentasRecurrentes'], ['20.00', '35.00', '20.00'])
+        self.assertEqual(datos['saldo'], ['1000.00', '1955.00', '3035.00'])
+        self.assertIsNone(datos['primerDeficit'])
+        self.assertEqual([r['nombre'] for r in datos['recurrentes']], ['Luz'])
+
+        datos = self.client.get('/api/proyeccion/', {'desde': '2025-03', 'meses': 2, 'ingreso': '0'}).data
+        self.assertEqual(datos['primerDeficit'], '2025-03')
+        self.assertEqual(self.client.get('/api/proyeccion/', {'meses': 500}).status_code, 400)
+        for params in ({'saldo_inicial': 'NaN'}, {'ingreso': 'Infinity'}, {'saldo_inicial': '1e30'}, {'ingreso': 'abc'}):
+            self.assertEqual(self.client.get('/api/proyeccion/', params).status_code, 400, params)
+        self.assertEqual(self.client.get('/api/proyeccion/', {'saldo_inicial': '-1e3'}).status_code, 200)
+
+    @skipUnless(proyeccion.disponible(), 'La proyección requiere NumPy')
+    def test_deuda_suelta_lejana_no_oculta_cuotas(self):
+        # Cuotas del mes 0 con el mismo monto que deudas sueltas del mes 256 de cada motivo: sea cual sea el
+        # código de cada motivo, antes una cuota chocaba con la deuda suelta del otro
+        for motivo in ('A', 'B'):
+            DeudaPresupuesto.objects.create(presupuesto=self.presupuesto(date(2025, 1, 1)), monto=300, motivo=motivo,
+                                            cuotas_totales=3, fecha_inicio=date(2025, 1, 1))
+            DeudaPresupuesto.objects.create(presupuesto=self.presupuesto(date(2046, 5, 1)), monto=100, motivo=motivo)
+        self.assertEqual(list(proyeccion.obligaciones_deudas('familia_camnr', date(2025, 1, 1), 3)), [20000, 20000, 20000])
+
+    def test_sin_numpy_responde_503(self):
+        with mock.patch.object(proyeccion, 'np', None):
+            self.assertEqual(self.client.get('/api/proyeccion/').status_code, 503)
+
+    def test_fecha_fin_pasa_de_diciembre(self):
+        deuda = DeudaPresupuesto(monto=400, cuotas_totales=4, frecuencia='mensual', fecha_inicio=date(2025, 11, 30))
+        self.assertEqual(deuda.calcular_fecha_fin(), date(2026, 2, 28))
+
+@skipUnless(plan_pagos.disponible(), 'El plan de pagos requiere NumPy')
+class PlanPagosTests(APITestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_user('ana', password='x')
+        self.client.force_authenticate(self.usuario)
+        self.enero = PresupuestoMensual.objects.create(familia='familia_camnr', fecha_mes=date(2025, 1, 1), monto_objetivo=0)
+        febrero = PresupuestoMensual.objects.create(familia='familia_camnr', fecha_mes=date(2025, 2, 1), monto_objetivo=0)
+        Aporte.objects.create(presupuesto=self.enero, usuario=self.usuario, monto=100)
+        self.a = DeudaPresupuesto.objects.create(presupuesto=self.enero, monto=80, motivo='A')
+        self.b = DeudaPresupuesto.objects.create(presupuesto=self.enero, monto=30, motivo='B', tasa_interes=24)
+        self.c = DeudaPresupuesto.objects.create(presupuesto=self.enero, monto=50, motivo='C')
+        self.d = DeudaPresupuesto.objects.create(presupuesto=febrero, monto=40, motivo='D')
+
+    def test_compara_estrategias(self):
+        orden = f'{self.c.id},{self.a.id}'
+        response = self.client.get(f'/api/presupuesto/{self.enero.id}/plan-pagos/', {'sobrante_mensual': '50', 'orden': orden})
+        self.assertEqual(response.status_code, 200, response.data)
+        plan = response.data
+        por_nombre = {e['nombre']: e for e in plan['estrategias']}
+        self.assertEqual(len(por_nombre), len(plan_pagos.ESTRATEGIAS) + 1)
+        # Como la transferencia actual: B espera un mes y acumula interés
+        self.assertEqual((por_nombre['fecha']['meses'], por_nombre['fecha']['intereses']), (4, '0.60'))
+        self.assertEqual((por_nombre['snowball']['meses'], por_nombre['snowball']['intereses']), (3, '0.00'))
+        self.assertEqual(por_nombre['avalanche']['meses'], 3)
+        self.assertEqual(por_nombre['personalizada']['orden'][:2], [self.c.id, self.a.id])
+        self.assertEqual(plan['mejor'], 'avalanche')
+        self.assertEqual(plan['calendario'][0], {'mes': '2025-01', 'deudas': [{'id': self.b.id, 'motivo': 'B', 'monto': '30.00'}]})
+
+        response = self.client.get(f'/api/presupuesto/{self.enero.id}/plan-pagos/', {'sobrante_mensual': '0', 'meses': 6})
+        # Nadie termina sin sobrante: gana la que deja menos pendiente (B y C en enero)
+        self.assertEqual(response.data['estrategias'][0]['saldoRestante'], '120.00')
+        self.assertIsNone(response.data['estrategias'][0]['meses'])
+        self.assertEqual(self.client.get(f'/api/presupuesto/{self.enero.id}/plan-pagos/', {'objetivo': 'rapido'}).status_code, 400)
+        for params in ({'sobrante_mensual': 'NaN'}, {'sobrante_mensual': 'Infinity'}, {'sobrante_mensual': '1e30'}, {'orden': 'a,b'}):
+            self.assertEqual(self.client.get(f'/api/presupuesto/{self.enero.id}/plan-pagos/', params).status_code, 400, params)
+
+    def test_transferir_aplica_la_estrategia(self):
+        response = self.client.post(f'/api/presupuesto/{self.enero.id}/transferir-sobrante/', {'estrategia': 'snowball'}, format='json')
+        self.assertEqual(response.status_code, 202)
+        tareas.procesar()
+        tarea = Tarea.objects.get(pk=response.data['tareaId'])
+        self.assertEqual(tarea.estado, Tarea.COMPLETADA, tarea.error)
+        self.assertEqual(Decimal(tarea.resultado['sinAsignar']), Decimal('20'))
+        self.assertEqual(
+            set(DeudaPresupuesto.objects.filter(pagado=True).values_list('id', flat=True)), {self.b.id, self.c.id}
+        )
+        self.assertEqual(
+            self.client.post(f'/api/presupuesto/{self.enero.id}/transferir-sobrante/', {'estrategia': 'azar'}, format='json').status_code,
+            400
+        )
+
+    def test_mejor_usa_el_horizonte_del_plan(self):
+        url = f'/api/presupuesto/{self.enero.id}/transferir-sobrante/'
+        plan = self.client.get(f'/api/presupuesto/{self.enero.id}/plan-pagos/', {'meses': 6, 'sobrante_mensual': '0'}).data
+        response = self.client.post(url, {'estrategia': 'mejor', 'meses': 6, 'sobrante_mensual': '0'}, format='json')
+        self.assertEqual(response.status_code, 202, response.data)
+        with mock.patch.object(plan_pagos, 'comparar', wraps=plan_pagos.comparar) as comparar:
+            tareas.procesar()
+        comparar.assert_called_once_with(mock.ANY, 6, 'meses', [], Decimal('0'))
+        tarea = Tarea.objects.get(pk=response.data['tareaId'])
+        self.assertEqual((tarea.estado, tarea.resultado['estrategia']), (Tarea.COMPLETADA, 'mejor'))
+        pagadas = set(DeudaPresupuesto.objects.filter(pagado=True).values_list('id', flat=True))
+        self.assertEqual(pagadas, {d['id'] for d in plan['calendario'][0]['deudas']})
+
+        for datos in ({'sobrante_mensual': 'NaN'}, {'meses': 500}):
+            self.assertEqual(self.client.post(url, {'estrategia': 'mejor', **datos}, format='json').status_code, 400, datos)
+
+    def test_sin_numpy_responde_503(self):
+        with mock.patch.object(plan_pagos, 'np', None):
+            self.assertEqual(self.client.get(f'/api/presupuesto/{self.enero.id}/plan-pagos/').status_code, 503)
+
+class BusquedaTests(APITestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_user('ana', password='x')
+        self.client.force_authenticate(self.usuario)
+        self.proveedor = Proveedor.objects.create(nombre='Compañía Eléctrica', categoria='servicios')
+        self.cuenta = crear_cuenta(self.usuario, self.proveedor, nombre='Luz marzo', descripcion='Consumo de energía')
+        presupuesto = PresupuestoMensual.objects.create(familia='familia_camnr', fecha_mes=date(2025, 1, 1), monto_objetivo=0)
+        self.deuda = DeudaPresupuesto.objects.create(presupuesto=presupuesto, monto=10, motivo='Préstamo auto', comentario='Cuota de la luz')
+        MovimientoPresupuesto.objects.create(presupuesto=presupuesto, tipo='ajuste', monto=1, descripcion='Corrección de saldo')
+
+    def buscar(self, **params):
+        response = self.client.get('/api/buscar/', params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_busca_sin_acentos_por_prefijo_y_ordenado(self):
+        datos = self.buscar(q='energia')
+        self.assertEqual([(r['tipo'], r['id']) for r in datos['results']], [('cuenta', self.cuenta.id)])
+        # El título pesa más que el texto
+        self.assertEqual([r['tipo'] for r in self.buscar(q='luz')['results']], ['cuenta', 'deuda'])
+        self.assertEqual(self.buscar(q='prest')['results'][0]['id'], self.deuda.id)
+        self.assertEqual(self.buscar(q='luz', tipo='deuda')['count'], 1)
+        self.assertEqual(self.buscar(q='correccion saldo')['results'][0]['tipo'], 'movimiento')
+        # La sintaxis de FTS5 no pasa: solo cuentan las palabras
+        self.assertEqual(self.buscar(q='"luz" OR NEAR(')['count'], 0)
+        self.assertEqual(self.client.get('/api/buscar/').status_code, 400)
+        self.assertEqual(self.client.get('/api/buscar/', {'q': 'luz', 'tipo': 'pago'}).status_code, 400)
+
+    def test_pagina_resultados(self):
+        for i in range(5):
+            crear_cuenta(self.usuario, self.proveedor, nombre=f'Agua {i}')
+        primera = self.buscar(q='agua', page_size=2)
+        self.assertEqual((primera['count'], len(primera['results']), primera['previous']), (5, 2, None))
+        tercera = self.client.get(primera['next'].replace('page=2', 'page=3')).data
+        self.assertEqual(len(tercera['results']), 1)
+        self.assertIsNone(tercera['next'])
+        self.assertIn('page=2', tercera['previous'])
+
+    def test_se_mantiene_y_se_reconstruye(self):
+        self.proveedor.nombre = 'Distribuidora Norte'
+        self.proveedor.save()
+        self.assertEqual(self.buscar(q='norte')['count'], 1)
+        self.assertEqual(self.buscar(q='compania')['count'], 0)
+        self.deuda.delete()
+        self.assertEqual(self.buscar(q='prestamo')['count'], 0)
+
+        DocumentoBusqueda.objects.all().delete()
+        salida = StringIO()
+        call_command('reconstruir_busqueda', stdout=salida)
+        self.assertIn('2 documento(s)', salida.getvalue())
+        self.assertEqual(self.buscar(q='energia')['count'], 1)
+
+    def test_sin_fts_usa_like(self):
+        with mock.patch.object(busqueda, 'usa_fts', return_value=False):
+            if connection.vendor == 'sqlite':
+                self.assertEqual(busqueda.motor(), 'like')
+                self.assertEqual([r['id'] for r in self.buscar(q='energía')['results']], [self.cuenta.id])
+
+
+class ReferenciaCacheTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.usuario = User.objects.create_user('ana', password='x')
+        self.client.force_authenticate(self.usuario)
+        self.proveedor = Proveedor.objects.create(nombre='Luz', categoria='servicios')
+
+    def test_etag_y_invalidacion(self):
+        primera = self.client.get('/api/proveedores-por-categoria/?categoria=servicios')
+        etag = primera['ETag']
+        with CaptureQueriesContext(connection) as ctx:
+            repetida = self.client.get('/api/proveedores-por-categoria/?categoria=servicios', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(repetida.status_code, 304)
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Proveedor.objects.create(nombre='Enel', categoria='servicios')
+            # Hasta confirmar la transacción la versión no cambia
+            self.assertEqual(self.client.get('/api/proveedores-por-categoria/?categoria=servicios', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        cambiada = self.client.get('/api/proveedores-por-categoria/?categoria=servicios', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cambiada.status_code, 200)
+        self.assertEqual(len(cambiada.data), 2)
+        self.assertNotEqual(cambiada['ETag'], etag)
+
+    def test_invalidacion_llega_a_otros_procesos(self):
+        # Como otro worker de gunicorn: la versión vive en la caché compartida, no en la memoria del proceso
+        etag = self.client.get('/api/proveedores-por-categoria/?categoria=servicios')['ETag']
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio)
+        entorno = dict(os.environ, FAMILION_SQLITE_NAME=os.path.join(directorio, 'otro.sqlite3'))
+        subprocess.run([sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'shell', '-c',
+                        'from api import cache; cache.invalidar("proveedores")'], env=entorno, check=True)
+        Proveedor.objects.create(nombre='Enel', categoria='servicios')
+        cambiada = self.client.get('/api/proveedores-por-categoria/?categoria=servicios', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cambiada.status_code, 200)
+        self.assertEqual(len(cambiada.data), 2)
+
+    def test_categorias(self):
+        crear_cuenta(self.usuario, self.proveedor)
+        self.assertEqual(self.client.get('/api/categorias/').data, [{'id': 'servicios', 'nombre': 'servicios'}])
+        with self.captureOnCommitCallbacks(execute=True):
+            crear_cuenta(self.usuario, Proveedor.objects.create(nombre='Aguas', categoria='agua'))
+        self.assertEqual([c['id'] for c in self.client.get('/api/categorias/').data], ['agua', 'servicios'])
+
+    def test_usuarios(self):
+        self.assertEqual([u['username'] for u in self.client.get('/api/usuarios/').data], ['ana'])
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.create_user('beto', password='x')
+        self.assertEqual(len(self.client.get('/api/usuarios/').data), 2)
+
+
+class SyncTests(APITestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_user('ana', password='x')
+        self.client.force_authenticate(self.usuario)
+        self.proveedor = Proveedor.objects.create(nombre='Luz', categoria='servicios')
+
+    def test_cambios_y_tombstones(self):
+        cuenta = crear_cuenta(self.usuario, self.proveedor, pagos=[40])
+        inicial = self.client.get('/api/sync/').data
+        self.assertEqual([c['id'] for c in inicial['cambios']['cuentas']], [cuenta.id])
+        self.assertEqual(len(inicial['cambios']['pagos']), 1)
+        self.assertFalse(inicial['hayMas'])
+
+        vacia = self.client.get(f"/api/sync/?since={inicial['cursor']}").data
+        self.assertEqual((vacia['cambios'], vacia['eliminados'], vacia['cursor']), ({}, {}, inicial['cursor']))
+
+        pago_id = cuenta.pagos.get().id
+        cuenta.pagos.all().delete()
+        cuenta.descripcion = 'editada'
+        cuenta.save()
+        delta = self.client.get(f"/api/sync/?since={inicial['cursor']}").data
+        self.assertEqual(delta['eliminados'], {'pagos': [pago_id]})
+        self.assertEqual(delta['cambios']['cuentas'][0]['descripcion'], 'editada')
+        self.assertNotIn('pagos', delta['cambios'])
+
+        # Compactar deja solo la última entrada por objeto sin alterar el resultado de una carga inicial
+        call_command('compactar_sync', stdout=StringIO())
+        completa = self.client.get('/api/sync/').data
+        self.assertEqual(completa['cambios']['cuentas'][0]['descripcion'], 'editada')
+        self.assertEqual(completa['eliminados'], {'pagos': [pago_id]})
+
+    def test_paginado_por_cursor(self):
+        for _ in range(3):
+            crear_cuenta(self.usuario, self.proveedor)
+        primera = self.client.get('/api/sync/?limit=2').data
+        self.assertTrue(primera['hayMas'])
+        segunda = self.client.get(f"/api/sync/?since={primera['cursor']}&limit=2").data
+        self.assertFalse(segunda['hayMas'])
+        self.assertEqual(len(primera['cambios']['cuentas']) + len(segunda['cambios']['cuentas']), 3)
+        self.assertEqual(self.client.get('/api/sync/?since=x').status_code, 400)
+
+    def test_rutas_bulk_registran(self):
+        presupuesto = PresupuestoMensual.objects.create(familia='familia_camnr', fecha_mes=date(2025, 11, 1), monto_objetivo=1000)
+        cursor = self.client.get('/api/sync/').data['cursor']
+        response = self.client.post('/api/deudas-presupuesto/', {
+            'presupuesto': presupuesto.id, 'monto': 300, 'motivo': 'auto', 'cuotas_totales': 3, 'fecha_inicio': '2025-11-01',
+        }, format='json')
+        self.assertEqual(response.status_code, 202, response.data)
+        tareas.procesar()
+        delta = self.client.get(f'/api/sync/?since={cursor}').data
+        self.assertEqual(len(delta['cambios']['deudas']), 3)
+        self.assertEqual(len(delta['cambios']['presupuestos']), 2)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'En SQLite las escrituras ya están serializadas')
+class SyncPostgresqlTests(TransactionTestCase):
+    def test_bitacora_se_confirma_en_orden(self):
+        # Mientras una transacción con cambios anotados no confirma, otra no puede anotar los suyos
+        anotado, confirmar, segunda_lista = threading.Event(), threading.Event(), threading.Event()
+        ids = {}
+
+        def escribir(nombre, despues=None):
+            try:
+                with transaction.atomic():
+                    sync.anotar([CambioSync(modelo='cuentas', objeto_id=1, operacion='upsert')])
+                    ids[nombre] = CambioSync.objects.latest('id').id
+                    if despues:
+                        despues()
+            finally:
+                connection.close()
+
+        primera = threading.Thread(target=escribir, args=('primera', lambda: (anotado.set(), confirmar.wait(5))))
+        primera.start()
+        anotado.wait(5)
+        segunda = threading.Thread(target=lambda: (escribir('segunda'), segunda_lista.set()))
+        segunda.start()
+        self.assertFalse(segunda_lista.wait(0.5))
+        confirmar.set()
+        primera.join(5)
+        segunda.join(5)
+        self.assertLess(ids['primera'], ids['segunda'])
+
+
+class LecturaRapidaTests(APITestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_user('ana', password='x')
+        self.client.force_authenticate(self.usuario)
+        self.proveedor = Proveedor.objects.create(nombre='Luz', categoria='servicios')
+        cuenta = crear_cuenta(self.usuario, self.proveedor, monto='100.10', pagos=['40.05'], descripcion='Año\u2028"ñ"\x01')
+        Pago.objects.filter(cuenta=cuenta).update(comprobante='comprobantes/a b.pdf')
+        Cuenta.objects.filter(pk=cuenta.pk).update(factura='facturas/f.pdf')
+        crear_cuenta(self.usuario, self.proveedor, fecha_emision=date(2025, 1, 2), pagos=[100])
+        crear_cuenta(self.usuario, self.proveedor, monto='7.5')
+        presupuesto = PresupuestoMensual.objects.create(familia='f', fecha_mes=date(2025, 1, 1), monto_objetivo=10)
+        MovimientoPresupuesto.objects.create(presupuesto=presupuesto, tipo='gasto', monto='3.3', usuario=self.usuario)
+        MovimientoPresupuesto.objects.create(presupuesto=presupuesto, tipo='ajuste', monto=1, descripcion='sin usuario')
+
+    def comparar(self, response, serializer_class, queryset):
+        # Contra el camino normal: serializer completo + JSONRenderer de DRF
+        datos = serializer_class(queryset, many=True, context={'request': Request(response.wsgi_request)}).data
+        esperado = JSONRenderer().render(datos)
+        if connection.vendor == 'sqlite':
+            self.assertEqual(response.content, esperado)
+        # Sin ORDER BY el orden de las filas puede variar entre consultas (PostgreSQL): mismas filas, mismas claves en orden
+        filas = lambda contenido: sorted((list(d.items()) for d in json.loads(contenido)), key=lambda d: d[0][1])
+        self.assertEqual(filas(response.content), filas(esperado))
+
+    def test_salida_identica(self):
+        response = self.client.get('/api/cuentas/')
+        cuentas = Cuenta.objects.con_totales().select_related('proveedor', 'creador').prefetch_related('pagos__usuario')
+        self.comparar(response, CuentaSerializer, cuentas)
+        self.assertIn(b'http://testserver/media/comprobantes/a%20b.pdf', response.content)
+
+        response = self.client.get('/api/movimientos-presupuesto/')
+        movimientos = MovimientoPresupuesto.objects.select_related('usuario')
+        self.comparar(response, MovimientoPresupuestoSerializer, movimientos)
+
+    def test_fields_y_paginado(self):
+        response = self.client.get('/api/cuentas/?fields=id,totalPagado,estado')
+        self.assertEqual(list(response.json()[0]), ['id', 'totalPagado', 'estado'])
+        paginada = self.client.get('/api/cuentas/?page_size=2').json()
+        self.assertEqual(len(paginada['results']), 2)
+        completa = {c['id']: c for c in self.client.get('/api/cuentas/').json()}
+        self.assertEqual(paginada['results'][0], completa[paginada['results'][0]['id']])
+
+    def test_renderer_mismos_bytes(self):
+        datos = {
+            'texto': 'ñ\u2028\u2029\x1f\n"\\', 'fecha': timezone.now(), 'dia': date(2025, 1, 2),
+            'decimal': Decimal('1.10'), 1: [1.5, None, True], 'vacio': {},
+        }
+        self.assertEqual(JSONRapidoRenderer().render(datos), JSONRenderer().render(datos))
+
+
+class AsincronoTests(TransactionTestCase):
+    # TransactionTestCase: las vistas async consultan desde otros hilos, que solo ven datos confirmados
+    def setUp(self):
+        cache.clear()
+        self.usuario = User.objects.create_user('ana', password='x')
+        Profile.objects.filter(user=self.usuario).update(color='#123456')
+        self.client = APIClient(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.usuario).access_token}')
+        luz = Proveedor.objects.create(nombre='Luz', categoria='servicios')
+        Proveedor.objects.create(nombre='Super', categoria='alimentacion')
+        crear_cuenta(self.usuario, luz, monto='100.10', pagos=['40.05'])
+        crear_cuenta(self.usuario, luz, fecha_vencimiento=date(2025, 3, 1), pagos=[100])
+        self.presupuesto = PresupuestoMensual.objects.create(familia='f', fecha_mes=date(2025, 1, 1), monto_objetivo=10)
+        Aporte.objects.create(presupuesto=self.presupuesto, usuario=self.usuario, monto=50)
+        GastoPresupuesto.objects.create(presupuesto=self.presupuesto, monto='12.5', pagado_por=self.usuario)
+        DeudaPresupuesto.objects.create(presupuesto=self.presupuesto, monto=7, motivo='m', categoria='otros', pagado=True)
+
+    def test_misma_salida_que_las_vistas_drf(self):
+        pares = [
+            ('/api/cuentas/', '/api/asinc/historial/'),
+            ('/api/cuentas/?estado=pendiente&fecha_hasta=2025-02-01', '/api/asinc/historial/?estado=pendiente&fecha_hasta=2025-02-01'),
+            ('/api/cuentas/?fields=id,saldoPendiente', '/api/asinc/historial/?fields=id,saldoPendiente'),
+            (f'/api/presupuestos/{self.presupuesto.pk}/resumen/', f'/api/asinc/presupuestos/{self.presupuesto.pk}/resumen/'),
+            ('/api/usuarios/', '/api/asinc/usuarios/'),
+            ('/api/proveedores-por-categoria/?categoria=servicios', '/api/asinc/proveedores-por-categoria/?categoria=servicios'),
+        ]
+        for normal, asincrona in pares:
+            with self.subTest(asincrona):
+                esperado, response = self.client.get(normal), self.client.get(asincrona)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response['Content-Type'], 'application/json')
+                self.assertEqual(response.json(), esperado.json())
+        self.assertEqual(len(self.client.get('/api/asinc/historial/?estado=pendiente').json()), 1)
+
+    def test_etag_y_errores(self):
+        response = self.client.get('/api/asinc/usuarios/')
+        self.assertEqual(response['ETag'], self.client.get('/api/usuarios/')['ETag'])
+        self.assertEqual(self.client.get('/api/asinc/usuarios/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        self.assertEqual(self.client.get('/api/asinc/presupuestos/999/resumen/').status_code, 404)
+        self.assertIn('estado', self.client.get('/api/asinc/historial/?estado=x').json())
+        self.assertEqual(self.client.post('/api/asinc/usuarios/').status_code, 405)
+
+        anonimo = APIClient()
+        response = anonimo.get('/api/asinc/historial/')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json(), anonimo.get('/api/usuarios/').json())
+        self.assertEqual(anonimo.get('/api/asinc/usuarios/', HTTP_AUTHORIZATION='Bearer x').status_code, 401)
+
+
+class AlmacenamientoDeduplicadoTests(APITestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        ajustes = override_settings(MEDIA_ROOT=self.media)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.usuario = User.objects.create_user('ana', password='x')
+        self.client.force_authenticate(self.usuario)
+        self.cuenta = crear_cuenta(self.usuario, Proveedor.objects.create(nombre='Luz', categoria='servicios'))
+
+    def subir_pago(self, contenido):
+        response = self.client.post('/api/pagos/', {
+            'cuenta': self.cuenta.id, 'monto_pagado': '10', 'fecha_pago': '2025-01-10',
+            'comprobante': SimpleUploadedFile('recibo.PDF', contenido),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 201, response.data)
+        return Pago.objects.get(pk=response.data['id'])
+
+    def test_mismo_contenido_un_blob(self):
+        primero = self.subir_pago(b'%PDF recibo')
+        segundo = self.subir_pago(b'%PDF recibo')
+        self.assertEqual(primero.comprobante.name, segundo.comprobante.name)
+        self.assertTrue(primero.comprobante.name.startswith('blobs/') and primero.comprobante.name.endswith('.pdf'))
+        self.assertEqual(ArchivoAlmacenado.objects.get().referencias, 2)
+        ruta = primero.comprobante.path
+
+        with self.captureOnCommitCallbacks(execute=True):
+            primero.delete()
+        self.assertTrue(os.path.exists(ruta))
+        with self.captureOnCommitCallbacks(execute=True):
+            segundo.delete()
+        self.assertFalse(os.path.exists(ruta))
+        self.assertFalse(ArchivoAlmacenado.objects.exists())
+
+    def test_fila_que_no_se_guarda_no_suma_referencia(self):
+        pago = self.subir_pago(b'%PDF recibo')
+        with self.assertRaises(IntegrityError):
+            # fecha_pago NOT NULL: el INSERT falla después de guardar el archivo
+            Pago.objects.create(cuenta=self.cuenta, monto_pagado=1, fecha_pago=None, usuario=self.usuario,
+                                comprobante=SimpleUploadedFile('otro.pdf', b'%PDF recibo'))
+        self.assertEqual(ArchivoAlmacenado.objects.get().referencias, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            pago.delete()
+        self.assertFalse(ArchivoAlmacenado.objects.exists())
+
+    def test_reemplazar_factura(self):
+        pago = self.subir_pago(b'factura')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f'/api/cuentas/{self.cuenta.id}/', {
+                'factura': SimpleUploadedFile('f.pdf', b'factura'),
+            }, format='multipart')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(ArchivoAlmacenado.objects.get().referencias, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/cuentas/{self.cuenta.id}/', {'eliminar_factura': 'true'}, format='multipart')
+        self.cuenta.refresh_from_db()
+        self.assertFalse(self.cuenta.factura)
+        self.assertEqual(ArchivoAlmacenado.objects.get().referencias, 1)
+        self.assertTrue(os.path.exists(pago.comprobante.path))
+
+    def test_migrar_archivos_existentes(self):
+        os.makedirs(os.path.join(self.media, 'comprobantes'))
+        for nombre in ('a.pdf', 'b.pdf'):
+            with open(os.path.join(self.media, 'comprobantes', nombre), 'wb') as archivo:
+                archivo.write(b'x' * 2048)
+        for nombre in ('a.pdf', 'b.pdf'):
+            pago = Pago.objects.create(cuenta=self.cuenta, monto_pagado=1, fecha_pago=date(2025, 1, 1), usuario=self.usuario)
+            Pago.objects.filter(pk=pago.pk).update(comprobante=f'comprobantes/{nombre}')
+
+        salida = StringIO()
+        call_command('deduplicar_archivos', stdout=salida)
+        self.assertIn('2 archivo(s) migrados', salida.getvalue())
+        blob = ArchivoAlmacenado.objects.get()
+        self.assertEqual(blob.referencias, 2)
+        self.assertEqual(set(Pago.objects.values_list('comprobante', flat=True)), {blob.nombre})
+        self.assertEqual(os.listdir(os.path.join(self.media, 'comprobantes')), [])
+
+    def test_migrar_ruta_compartida_y_no_borrar_blobs_en_uso(self):
+        os.makedirs(os.path.join(self.media, 'comprobantes'))
+        with open(os.path.join(self.media, 'comprobantes', 'a.pdf'), 'wb') as archivo:
+            archivo.write(b'compartido')
+        for _ in range(2):
+            pago = Pago.objects.create(cuenta=self.cuenta, monto_pagado=1, fecha_pago=date(2025, 1, 1), usuario=self.usuario)
+            Pago.objects.filter(pk=pago.pk).update(comprobante='comprobantes/a.pdf')
+        subido = self.subir_pago(b'subido')
+        # Blob con una referencia que ninguna fila usa
+        huerfano = default_storage.save('h.pdf', SimpleUploadedFile('h.pdf', b'huerfano'))
+
+        class RecuentoAnterior(Counter):
+            # Recuento tomado antes de que se confirmara la subida de `subido`
+            def update(self, nombres=None, **kwargs):
+                super().update((n for n in nombres or () if n != subido.comprobante.name), **kwargs)
+
+        salida = StringIO()
+        with mock.patch.object(deduplicar_archivos, 'Counter', RecuentoAnterior), self.captureOnCommitCallbacks(execute=True):
+            call_command('deduplicar_archivos', stdout=salida)
+        self.assertIn('2 archivo(s) migrados, 0 faltante(s), 1 blob(s) sin uso eliminados', salida.getvalue())
+        migrado = ArchivoAlmacenado.objects.get(nombre=Pago.objects.exclude(pk=subido.pk).first().comprobante.name)
+        self.assertEqual(migrado.referencias, 2)
+        self.assertEqual(set(Pago.objects.exclude(pk=subido.pk).values_list('comprobante', flat=True)), {migrado.nombre})
+        self.assertEqual(ArchivoAlmacenado.objects.get(nombre=subido.comprobante.name).referencias, 1)
+        self.assertTrue(os.path.exists(subido.comprobante.path))
+        self.assertFalse(ArchivoAlmacenado.objects.filter(nombre=huerfano).exists())
+        self.assertFalse(default_storage.exists(huerfano))
+
+
+class MediaTests(APITestCase):
+    contenido = bytes(range(256)) * 40
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        ajustes = override_settings(MEDIA_ROOT=self.media)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.usuario = User.objects.create_user('ana', password='x')
+        self.client.force_authenticate(self.usuario)
+        cuenta = crear_cuenta(self.usuario, Proveedor.objects.create(nombre='Luz', categoria='servicios'))
+        response = self.client.post('/api/pagos/', {
+            'cuenta': cuenta.id, 'monto_pagado': '10', 'fecha_pago': '2025-01-10',
+            'comprobante': SimpleUploadedFile('scan.pdf', self.contenido),
+        }, format='multipart')
+        self.url = response.data['comprobante']
+        self.client.force_authenticate(None)
+
+    def test_url_firmada_y_etag(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.contenido)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertIn('immutable', response['Cache-Control'])
+
+        repetida = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(repetida.status_code, 304)
+
+        sin_firma = self.url.split('?')[0]
+        self.assertEqual(self.client.get(sin_firma).status_code, 401)
+        self.assertEqual(self.client.get(sin_firma + '?firma=x').status_code, 401)
+        # Otro archivo con la misma firma, o la firma vencida
+        self.assertEqual(self.client.get(sin_firma.replace('.pdf', '.png') + '?' + self.url.split('?')[1]).status_code, 401)
+        with mock.patch('time.time', return_value=time.time() + settings.FAMILION_MEDIA_FIRMA_VIGENCIA + 1):
+            self.assertEqual(self.client.get(self.url).status_code, 401)
+        self.client.force_login(self.usuario)
+        self.assertEqual(self.client.get(sin_firma).status_code, 200)
+        self.assertEqual(self.client.get('/media/../manage.py').status_code, 404)
+
+    def test_range(self):
+        etag = self.client.get(self.url)['ETag']
+        parcial = self.client.get(self.url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(parcial.status_code, 206)
+        self.assertEqual(parcial['Content-Range'], f'bytes 100-199/{len(self.contenido)}')
+        self.assertEqual(b''.join(parcial.streaming_content), self.contenido[100:200])
+
+        sufijo = self.client.get(self.url, HTTP_RANGE='bytes=-10', HTTP_IF_RANGE=etag)
+        self.assertEqual(b''.join(sufijo.streaming_content), self.contenido[-10:])
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=99999-').status_code, 416)
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"otro"').status_code, 200)
+
+    @override_settings(FAMILION_MEDIA_SENDFILE='x-accel-redirect')
+    def test_x_accel_redirect(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'')
+        self.assertTrue(response['X-Accel-Redirect'].startswith('/media-interno/blobs/'))
+
+
+@skipUnless(derivados.Image is not None, 'Los derivados requieren Pillow')
+class DerivadosTests(APITestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        ajustes = override_settings(MEDIA_ROOT=self.media)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.usuario = User.objects.create_user('ana', password='x')
+        self.client.force_authenticate(self.usuario)
+        self.cuenta = crear_cuenta(self.usuario, Proveedor.objects.create(nombre='Luz', categoria='servicios'))
+
+    def archivo(self, nombre, formato, tamano=(1600, 1200)):
+        imagen = derivados.Image.radial_gradient('L').resize(tamano).convert('RGB')
+        contenido = BytesIO()
+        imagen.save(contenido, formato)
+        return SimpleUploadedFile(nombre, contenido.getvalue())
+
+    def test_miniatura_y_previa_en_segundo_plano(self):
+        escaneo = self.archivo('scan.png', 'PNG')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/pagos/', {
+                'cuenta': self.cuenta.id, 'monto_pagado': '10', 'fecha_pago': '2025-01-10', 'comprobante': escaneo,
+            }, format='multipart')
+        self.assertEqual(response.status_code, 201, response.data)
+        derivados.esperar()
+        # No quedan trabajos ni candados del archivo ya procesado
+        self.assertEqual((derivados._pendientes, derivados._candados), (set(), {}))
+
+        pago = Pago.objects.get(pk=response.data['id'])
+        miniatura = default_storage.path(derivados.nombre_derivado(pago.comprobante.name, 'miniatura'))
+        self.assertTrue(os.path.exists(miniatura))
+        with derivados.Image.open(miniatura) as imagen:
+            self.assertEqual((imagen.format, max(imagen.size)), ('JPEG', derivados.MINIATURA))
+        self.assertLess(os.path.getsize(miniatura), escaneo.size / 10)
+
+        listado = self.client.get('/api/pagos/').json()[0]
+        self.assertIn('/media/derivados/', listado['comprobanteMiniatura'])
+        self.assertEqual(self.client.get(listado['comprobantePrevia']).status_code, 200)
+
+    @skipUnless(derivados.renderizador_pdf(), 'Sin pypdfium2 ni pdftoppm')
+    def test_previa_pdf_a_pedido(self):
+        # Sin ejecutar los callbacks de commit: el derivado se genera al pedirlo
+        response = self.client.patch(f'/api/cuentas/{self.cuenta.id}/', {
+            'factura': self.archivo('factura.pdf', 'PDF', (850, 1100)),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 200, response.data)
+        previa = self.client.get(response.data['facturaPrevia'])
+        self.assertEqual(previa.status_code, 200)
+        self.assertEqual(previa['Content-Type'], 'image/jpeg')
+
+    def test_sin_archivo(self):
+        datos = self.client.get(f'/api/cuentas/{self.cuenta.id}/').data
+        self.assertIsNone(datos['facturaMiniatura'])
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Perfil propio de SQLite')
+class SQLitePerfilProduccionTests(TestCase):
+    def test_escrituras_concurrentes_sin_bloqueos(self):
+        # En otro proceso y sobre un archivo temporal: el perfil (WAL, IMMEDIATE) no aplica a la base en memoria de los tests
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio)
+        entorno = dict(os.environ, FAMILION_SQLITE_NAME=os.path.join(directorio, 'estres.sqlite3'),
+                       FAMILION_SQLITE_PERFIL='produccion')
+        manage = os.path.join(settings.BASE_DIR, 'manage.py')
+        subprocess.run([sys.executable, manage, 'migrate', '-v0'], env=entorno, check=True)
+        salida = subprocess.run(
+            [sys.executable, manage, 'estres_escrituras', '--procesos', '8', '--pagos', '10'],
+            env=entorno, check=True, capture_output=True, text=True,
+        ).stdout
+        resultado = json.loads(salida.strip().splitlines()[-1])
+        self.assertEqual(resultado['perfil'], 'produccion')
+        self.assertEqual((resultado['erroresBloqueo'], resultado['otrosErrores']), (0, 0))
+        self.assertEqual(resultado['pagosGuardados'], 80)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'El plan de EXPLAIN QUERY PLAN es propio de SQLite')
+class IndicesTests(TestCase):
+    def assertUsaIndice(self, queryset, indice):
+        plan = queryset.explain()
+        self.assertIn(f'INDEX {indice}', plan)
+
+    def test_cuenta_por_vencimiento(self):
+        self.assertUsaIndice(
+            Cuenta.objects.filter(fecha_vencimiento__gte='2025-01-01', fecha_vencimiento__lte='2025-12-31'),
+            'cuenta_venc_idx'
+        )
+        self.assertUsaIndice(
+            Cuenta.objects.filter(categoria='servicios', fecha_vencimiento__gte='2025-01-01'),
+            'cuenta_cat_venc_idx'
+        )
+
+    def test_pago_por_fecha(self):
+        self.assertUsaIndice(Pago.objects.filter(fecha_pago__gte='2025-01-01', fecha_pago__lt='2025-02-01'), 'pago_fecha_idx')
+
+    def test_presupuesto_del_mes(self):
+        inicio, fin = PresupuestoMensual.rango_mes(date(2025, 12, 15))
+        self.assertEqual((inicio, fin), (date(2025, 12, 1), date(2026, 1, 1)))
+        self.assertUsaIndice(
+            PresupuestoMensual.objects.filter(fecha_mes__gte=inicio, fecha_mes__lt=fin).order_by('id'),
+            'presupuesto_mes_idx'
+        )
+        # get_or_create de DeudaPresupuestoViewSet: índice de la restricción única
+        plan = PresupuestoMensual.objects.filter(familia='familia_camnr', fecha_mes=inicio).explain()
+        self.assertRegex(plan, r'SEARCH api_presupuestomensual USING INDEX sqlite_autoindex_api_presupuestomensual_\d \(familia=\? AND fecha_mes=\?\)')
+
+    def test_movimientos_por_tipo(self):
+        self.assertUsaIndice(
+            MovimientoPresupuesto.objects.filter(presupuesto_id=1, tipo='gasto').order_by('fecha'),
+            'movimiento_pres_tipo_fecha_idx'
+        )
+
+    def test_deudas_no_pagadas(self):
+        self.assertUsaIndice(
+            DeudaPresupuesto.objects.filter(presupuesto_id=1, pagado=False).order_by('fecha'),
+            'deuda_pendiente_idx'
+        )
@@ -1,10 +1,12 @@
 from rest_framework import routers
 from .views import (
-    CuentaViewSet, PagoViewSet, profile_view, ProveedoresPorCategoriaView, TransferirSobranteView, CerrarMesView,
+    CuentaViewSet, PagoViewSet, profile_view, ProveedoresPorCategoriaView, CategoriasListView, TransferirSobranteView, CerrarMesView,
     PresupuestoMensualViewSet, AporteViewSet, GastoPresupuestoViewSet, DeudaPresupuestoViewSet, AhorroPresupuestoViewSet, MovimientoPresupuestoViewSet,
-    UsuariosListView, ExportarCuentasCSVView, PagoDeudaPresupuestoViewSet
+    UsuariosListView, ExportarCuentasCSVView, ImportarCuentasView, SyncView, PagoDeudaPresupuestoViewSet, TareaViewSet,
+    TendenciasView, ProyeccionView, PlanPagosView, BuscarView
 )
 from django.urls import path
+from . import asincrono
 
 router = routers.DefaultRouter()
 router.register(r'cuentas', CuentaViewSet)
@@ -16,12 +18,27 @@ router.register(r'deudas-presupuesto', DeudaPresupuestoViewSet)
 router.register(r'ahorros-presupuesto', AhorroPresupuestoViewSet)
 router.register(r'movimientos-presupuesto', MovimientoPresupuestoViewSet)
 router.register(r'pagos-deuda', PagoDeudaPresupuestoViewSet)
+router.register(r'tareas', TareaViewSet, basename='tarea')
 
-urlpatterns = router.urls + [
+# Las rutas explícitas van antes que las del router para que `cuentas/exportar/`
+# no sea capturada por el detalle `cuentas/<pk>/`
+urlpatterns = [
     path('profile/', profile_view, name='profile'),
     path('usuarios/', UsuariosListView.as_view(), name='usuarios-list'),
     path('proveedores-por-categoria/', ProveedoresPorCategoriaView.as_view(), name='proveedores-por-categoria'),
+    path('categorias/', CategoriasListView.as_view(), name='categorias-list'),
     path('presupuesto/<int:presupuesto_id>/transferir-sobrante/', TransferirSobranteView.as_view(), name='transferir-sobrante'),
+    path('presupuesto/<int:presupuesto_id>/plan-pagos/', PlanPagosView.as_view(), name='plan-pagos'),
     path('presupuesto/<int:presupuesto_id>/cerrar-mes/', CerrarMesView.as_view(), name='cerrar-mes'),
     path('cuentas/exportar/', ExportarCuentasCSVView.as_view(), name='exportar-cuentas-csv'),
-]
\ No newline at end of file
+    path('cuentas/importar/', ImportarCuentasView.as_view(), name='importar-cuentas'),
+    path('sync/', SyncView.as_view(), name='sync'),
+    path('buscar/', BuscarView.as_view(), name='buscar'),
+    path('reportes/tendencias/', TendenciasView.as_view(), name='reportes-tendencias'),
+    path('proyeccion/', ProyeccionView.as_view(), name='proyeccion'),
+    # Lecturas async para servir con uvicorn (ver api/asincrono.py)
+    path('asinc/historial/', asincrono.historial, name='asinc-historial'),
+    path('asinc/presupuestos/<int:pk>/resumen/', asincrono.resumen_presupuesto, name='asinc-resumen-presupuesto'),
+    path('asinc/usuarios/', asincrono.usuarios, name='asinc-usuarios'),
+    path('asinc/proveedores-por-categoria/', asincrono.proveedores_por_categoria, name='asinc-proveedores-por-categoria'),
+] + router.urls
\ No newline at end of file
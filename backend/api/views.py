@@ -1,29 +1,64 @@
 from django.shortcuts import render
 from rest_framework import viewsets, permissions, status, serializers
 from rest_framework.response import Response
-import os
 from django.conf import settings
-from .models import Cuenta, Pago, Profile, Proveedor, PresupuestoMensual, Aporte, GastoPresupuesto, DeudaPresupuesto, AhorroPresupuesto, MovimientoPresupuesto, PagoDeudaPresupuesto
+from .models import FAMILIA_POR_DEFECTO, Tarea, Cuenta, Pago, Profile, Proveedor, PresupuestoMensual, Aporte, GastoPresupuesto, DeudaPresupuesto, AhorroPresupuesto, MovimientoPresupuesto, PagoDeudaPresupuesto
 from .serializers import (
     CuentaSerializer, PagoSerializer, ProfileSerializer, ProveedorSerializer,
-    PresupuestoMensualSerializer, AporteSerializer, GastoPresupuestoSerializer, DeudaPresupuestoSerializer, AhorroPresupuestoSerializer, MovimientoPresupuestoSerializer, PagoDeudaPresupuestoSerializer
+    PresupuestoMensualSerializer, ResumenPresupuestoSerializer, SaldoPresupuestoSerializer, AporteSerializer, GastoPresupuestoSerializer, DeudaPresupuestoSerializer, AhorroPresupuestoSerializer, MovimientoPresupuestoSerializer, PagoDeudaPresupuestoSerializer,
+    TareaSerializer, campos_solicitados
 )
 from collections import defaultdict
 from rest_framework.views import APIView
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from rest_framework.parsers import JSONParser, MultiPartParser
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.decorators import api_view, permission_classes, authentication_classes
+from rest_framework.decorators import api_view, permission_classes, authentication_classes, action
 from rest_framework.authentication import SessionAuthentication, BasicAuthentication
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db import transaction
+from .filters import CuentaFilter
+from . import busqueda, lectura, plan_pagos, proyeccion, reportes, sync, tareas
+from .cache import respuesta_referencia
+from .cuotas import tiene_cuotas
+from .importacion import COLUMNAS_CSV, ErrorImportacion, filas_csv, filas_json, importar
+from django.db import transaction, IntegrityError
 from django.contrib.auth.models import User
 import csv
-from django.http import HttpResponse
+from django.http import StreamingHttpResponse
+from django.db.models import Prefetch
 from datetime import datetime
-
-class CuentaViewSet(viewsets.ModelViewSet):
+from decimal import Decimal
+
+class ListadoRapidoMixin:
+    # Listados sin paginar por la ruta de lectura rápida (api/lectura.py); misma salida que el serializer
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        datos = lectura.listar(self.get_serializer_class(), queryset, request)
+        if datos is None:
+            datos = self.get_serializer(queryset, many=True).data
+        return Response(datos)
+
+def cuentas_con_detalle(campos=None):
+    # Número fijo de consultas sin importar cuántas cuentas se listen:
+    # proveedor/creador por JOIN, pagos (con su usuario) en un solo prefetch
+    queryset = Cuenta.objects.con_totales().select_related('proveedor', 'creador')
+    if campos is None or 'pagos' in campos:
+        queryset = queryset.prefetch_related(Prefetch('pagos', queryset=Pago.objects.select_related('usuario')))
+    return queryset
+
+class CuentaViewSet(ListadoRapidoMixin, viewsets.ModelViewSet):
     queryset = Cuenta.objects.all()
     serializer_class = CuentaSerializer
     permission_classes = [permissions.IsAuthenticated]
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = CuentaFilter
+    cursor_ordering = ('-fecha_vencimiento', '-id')
+
+    def get_queryset(self):
+        return cuentas_con_detalle(campos_solicitados(self.request))
 
     def update(self, request, *args, **kwargs):
         partial = kwargs.pop('partial', False)
@@ -32,19 +67,11 @@ class CuentaViewSet(viewsets.ModelViewSet):
             request.data.get('eliminar_factura') == 'true' or
             request.data.get('eliminar_factura') is True
         )
-        # Si hay que eliminar la factura
+        # El archivo anterior se libera al guardar (señales de api/signals.py); el almacén
+        # deduplicado solo lo borra del disco si ninguna otra fila lo referencia
         if eliminar_factura and instance.factura:
-            factura_path = instance.factura.path
-            instance.factura.delete(save=False)
-            if os.path.exists(factura_path):
-                os.remove(factura_path)
-        # Si se sube un nuevo archivo, reemplaza el anterior
+            instance.factura = None
         if 'factura' in request.FILES:
-            if instance.factura:
-                old_path = instance.factura.path
-                instance.factura.delete(save=False)
-                if os.path.exists(old_path):
-                    os.remove(old_path)
             instance.factura = request.FILES['factura']
         # Actualiza el resto de los campos normalmente
         serializer = self.get_serializer(instance, data=request.data, partial=partial)
@@ -52,13 +79,15 @@ class CuentaViewSet(viewsets.ModelViewSet):
         self.perform_update(serializer)
         return Response(serializer.data)
 
-class PagoViewSet(viewsets.ModelViewSet):
-    queryset = Pago.objects.all()
+class PagoViewSet(ListadoRapidoMixin, viewsets.ModelViewSet):
+    queryset = Pago.objects.select_related('usuario')
     serializer_class = PagoSerializer
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['cuenta']
+    cursor_ordering = ('-fecha_pago', '-id')
 
+    @transaction.atomic
     def perform_create(self, serializer):
         cuenta = serializer.validated_data.get('cuenta')
         monto_pagado = serializer.validated_data.get('monto_pagado')
@@ -74,10 +103,12 @@ class PagoViewSet(viewsets.ModelViewSet):
         from .models import PresupuestoMensual, GastoPresupuesto
         presupuesto = None
         if cuenta and cuenta.fecha_vencimiento:
+            # Rango de fechas en vez de __year/__month para poder usar el índice de fecha_mes
+            inicio_mes, fin_mes = PresupuestoMensual.rango_mes(cuenta.fecha_vencimiento)
             presupuesto = PresupuestoMensual.objects.filter(
-                fecha_mes__year=cuenta.fecha_vencimiento.year,
-                fecha_mes__month=cuenta.fecha_vencimiento.month
-            ).first()
+                fecha_mes__gte=inicio_mes,
+                fecha_mes__lt=fin_mes
+            ).order_by('id').first()
         if presupuesto:
             GastoPresupuesto.objects.create(
                 presupuesto=presupuesto,
@@ -129,97 +160,150 @@ class ProveedoresPorCategoriaView(APIView):
 
     def get(self, request):
         categoria = request.query_params.get('categoria')
-        if categoria:
-            proveedores = Proveedor.objects.filter(categoria=categoria)
-        else:
-            proveedores = Proveedor.objects.all()
-        data = ProveedorSerializer(proveedores, many=True).data
-        return Response(data)
+        return respuesta_referencia(request, 'proveedores', categoria or '*', lambda: datos_proveedores(categoria))
+
+def proveedores_de(categoria):
+    return Proveedor.objects.filter(categoria=categoria) if categoria else Proveedor.objects.all()
 
-class TransferirSobranteView(APIView):
+def datos_proveedores(categoria):
+    return ProveedorSerializer(proveedores_de(categoria), many=True).data
+
+class CategoriasListView(APIView):
+    # Categorías distintas de las cuentas, sin descargar todo /api/cuentas/
     permission_classes = [IsAuthenticated]
 
-    @transaction.atomic
-    def post(self, request, presupuesto_id):
+    def get(self, request):
+        def construir():
+            categorias = (
+                Cuenta.objects.exclude(categoria='').order_by('categoria')
+                .values_list('categoria', flat=True).distinct()
+            )
+            return [{'id': categoria, 'nombre': categoria} for categoria in categorias]
+
+        return respuesta_referencia(request, 'categorias', '*', construir)
+
+class OperacionEnColaMixin:
+    # Encola la operación y responde 202; el header Idempotency-Key evita encolarla dos veces
+    def encolar(self, request, tipo, parametros):
         try:
-            presupuesto = PresupuestoMensual.objects.get(id=presupuesto_id)
-        except PresupuestoMensual.DoesNotExist:
-            return Response({'detail': 'Presupuesto no encontrado.'}, status=404)
+            tarea = tareas.encolar(tipo, parametros, request.user, request.headers.get('Idempotency-Key'))
+        except tareas.ClaveReutilizada:
+            return Response({'detail': 'La clave de idempotencia ya se usó para otra operación.'}, status=422)
+        return tareas.respuesta_aceptada(request, tarea)
+
+    def repetida(self, request, tipo, presupuesto_id):
+        # Reintento con una clave ya usada: la tarea original aunque ya se haya ejecutado,
+        # antes de validar el presupuesto (que después de ejecutarla ya no pasaría)
+        clave = request.headers.get('Idempotency-Key')
+        tarea = Tarea.objects.filter(usuario=request.user, clave_idempotencia=clave).first() if clave else None
+        if tarea is None:
+            return None
+        if tarea.tipo != tipo or tarea.parametros.get('presupuesto_id') != presupuesto_id:
+            return Response({'detail': 'La clave de idempotencia ya se usó para otra operación.'}, status=422)
+        return tareas.respuesta_aceptada(request, tarea)
+
+class TransferirSobranteView(OperacionEnColaMixin, APIView):
+    permission_classes = [IsAuthenticated]
 
-        # Calcular sobrante: aportes - gastos - deudas pagadas - ahorros
-        total_aportes = sum(a.monto for a in presupuesto.aportes.all())
-        total_gastos = sum(g.monto for g in presupuesto.gastos.all())
-        total_ahorros = sum(a.monto for a in presupuesto.ahorros.all())
-        total_deudas_pagadas = sum(d.monto for d in presupuesto.deudas.filter(pagado=True))
-        total_deudas_no_pagadas = sum(d.monto for d in presupuesto.deudas.filter(pagado=False))
-        sobrante = total_aportes - total_gastos - total_ahorros - total_deudas_pagadas
-        if sobrante <= 0:
+    def post(self, request, presupuesto_id):
+        repetida = self.repetida(request, 'transferir_sobrante', presupuesto_id)
+        if repetida is not None:
+            return repetida
+        # Solo lectura: la tarea vuelve a verificar el sobrante al ejecutarse
+        presupuesto = PresupuestoMensual.objects.con_totales().filter(id=presupuesto_id).first()
+        if presupuesto is None:
+            return Response({'detail': 'Presupuesto no encontrado.'}, status=404)
+        if presupuesto.sobrante <= 0:
             return Response({'detail': 'No hay sobrante para transferir.'}, status=400)
+        parametros = {'presupuesto_id': presupuesto.id}
+        # Opcional: pagar las deudas en el orden de un plan (ver PlanPagosView)
+        estrategia = request.data.get('estrategia')
+        if estrategia:
+            if estrategia not in ('mejor', 'personalizada', *plan_pagos.ESTRATEGIAS):
+                return Response({'detail': f'Estrategia desconocida: {estrategia}.'}, status=400)
+            objetivo = request.data.get('objetivo', 'meses')
+            if objetivo not in plan_pagos.OBJETIVOS:
+                return Response({'detail': f"objetivo debe ser uno de: {', '.join(plan_pagos.OBJETIVOS)}."}, status=400)
+            orden = request.data.get('orden') or []
+            if not isinstance(orden, list) or not all(isinstance(deuda_id, int) for deuda_id in orden):
+                return Response({'detail': 'orden debe ser una lista de ids de deudas.'}, status=400)
+            # Con 'mejor', el mismo horizonte y sobrante que el plan que vio el usuario
+            try:
+                meses, sobrante_mensual = PlanPagosView.horizonte(request.data)
+            except ValueError as exc:
+                return Response({'detail': str(exc)}, status=400)
+            if not plan_pagos.disponible():
+                return Response({'detail': 'El plan de pagos requiere NumPy, que no está instalado en el servidor.'}, status=503)
+            parametros.update(estrategia=estrategia, objetivo=objetivo, orden=orden, meses=meses,
+                              sobrante_mensual=str(sobrante_mensual) if sobrante_mensual is not None else None)
+        return self.encolar(request, 'transferir_sobrante', parametros)
+
+class PlanPagosView(APIView):
+    """
+    Compara estrategias de pago de las deudas pendientes de la familia desde
+    este mes (ver api/plan_pagos.py). ?objetivo=meses|total, ?meses=60 (hasta
+    120), ?sobrante_mensual= y ?orden=3,1,2 (estrategia personalizada).
+    """
+    permission_classes = [IsAuthenticated]
+    MAXIMO_MESES = 120
 
-        # Prioridad: pagar deudas no pagadas, luego ahorro
-        deudas = presupuesto.deudas.filter(pagado=False).order_by('fecha')
-        monto_para_deuda = min(sobrante, total_deudas_no_pagadas)
-        monto_para_ahorro = sobrante - monto_para_deuda
-        movimientos = []
-        # Pagar deudas
-        for deuda in deudas:
-            if monto_para_deuda <= 0:
-                break
-            pago = min(deuda.monto, monto_para_deuda)
-            deuda.pagado = True
-            deuda.fecha_pago = transaction.now()
-            deuda.save()
-            MovimientoPresupuesto.objects.create(
-                presupuesto=presupuesto,
-                tipo='deuda',
-                monto=pago,
-                usuario=request.user,
-                descripcion=f'Pago automático de deuda al transferir sobrante',
-                referencia_id=deuda.id
-            )
-            monto_para_deuda -= pago
-            movimientos.append({'deuda_id': deuda.id, 'pagado': pago})
-        # Transferir a ahorro si queda
-        ahorro_obj = None
-        if monto_para_ahorro > 0:
-            ahorro_obj = AhorroPresupuesto.objects.create(
-                presupuesto=presupuesto,
-                monto=monto_para_ahorro,
-                motivo='Ahorro automático por sobrante',
-                comentario='Transferencia automática de sobrante a ahorro'
-            )
-            MovimientoPresupuesto.objects.create(
-                presupuesto=presupuesto,
-                tipo='ahorro',
-                monto=monto_para_ahorro,
-                usuario=request.user,
-                descripcion='Transferencia automática de sobrante a ahorro',
-                referencia_id=ahorro_obj.id
-            )
-        return Response({
-            'sobranteTotal': sobrante,
-            'pagadoEnDeudas': sobrante - monto_para_ahorro,
-            'ahorrado': monto_para_ahorro,
-            'movimientos': movimientos,
-            'ahorroId': ahorro_obj.id if ahorro_obj else None
-        })
+    @classmethod
+    def horizonte(cls, datos):
+        # meses y sobrante_mensual del plan, del GET o del POST de transferir-sobrante
+        try:
+            meses = int(datos.get('meses') or 60)
+            sobrante = datos.get('sobrante_mensual')
+            sobrante_mensual = proyeccion.monto_parametro(str(sobrante)) if sobrante not in (None, '') else None
+        except (ValueError, TypeError, ArithmeticError):
+            raise ValueError(f'Parámetros inválidos: meses es entero y sobrante_mensual un monto (hasta {proyeccion.MONTO_MAXIMO}).')
+        if not 1 <= meses <= cls.MAXIMO_MESES:
+            raise ValueError(f'meses debe estar entre 1 y {cls.MAXIMO_MESES}.')
+        return meses, sobrante_mensual
+
+    def get(self, request, presupuesto_id):
+        presupuesto = PresupuestoMensual.objects.filter(id=presupuesto_id).first()
+        if presupuesto is None:
+            return Response({'detail': 'Presupuesto no encontrado.'}, status=404)
+        if not plan_pagos.disponible():
+            return Response({'detail': 'El plan de pagos requiere NumPy, que no está instalado en el servidor.'}, status=503)
+        params = request.query_params
+        try:
+            meses, sobrante_mensual = self.horizonte(params)
+        except ValueError as exc:
+            return Response({'detail': str(exc)}, status=400)
+        try:
+            orden = [int(deuda_id) for deuda_id in params['orden'].split(',')] if params.get('orden') else None
+        except ValueError:
+            return Response({'detail': 'orden son ids de deudas separados por coma.'}, status=400)
+        try:
+            plan = plan_pagos.comparar(presupuesto, meses, params.get('objetivo', 'meses'), orden, sobrante_mensual)
+        except plan_pagos.ErrorPlan as exc:
+            return Response({'detail': str(exc)}, status=400)
+        return Response(plan)
 
-class CerrarMesView(APIView):
+class CerrarMesView(OperacionEnColaMixin, APIView):
     permission_classes = [IsAuthenticated]
 
-    @transaction.atomic
     def post(self, request, presupuesto_id):
-        try:
-            presupuesto = PresupuestoMensual.objects.get(id=presupuesto_id)
-        except PresupuestoMensual.DoesNotExist:
+        repetida = self.repetida(request, 'cerrar_mes', presupuesto_id)
+        if repetida is not None:
+            return repetida
+        cerrado = PresupuestoMensual.objects.filter(id=presupuesto_id).values_list('cerrado', flat=True).first()
+        if cerrado is None:
             return Response({'detail': 'Presupuesto no encontrado.'}, status=404)
-        # Ejecutar transferencia de sobrante
-        transfer_view = TransferirSobranteView()
-        transfer_response = transfer_view.post(request, presupuesto_id)
-        return Response({
-            'mensaje': 'Mes cerrado. Sobrante transferido.',
-            'transferencia': transfer_response.data
-        })
+        if cerrado:
+            return Response({'detail': 'El mes ya está cerrado.'}, status=400)
+        return self.encolar(request, 'cerrar_mes', {'presupuesto_id': presupuesto_id})
+
+class SaldoPresupuestoMixin:
+    # El registro y el cambio de su saldo (señales, ver api/saldos.py) en una sola transacción
+    @transaction.atomic
+    def perform_update(self, serializer):
+        serializer.save()
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        instance.delete()
 
 class PresupuestoMensualViewSet(viewsets.ModelViewSet):
     queryset = PresupuestoMensual.objects.all()
@@ -227,18 +311,42 @@ class PresupuestoMensualViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['familia', 'fecha_mes']
+    cursor_ordering = ('-fecha_mes', '-id')
+
+    def get_queryset(self):
+        if self.action in ('resumen', 'saldos_mensuales'):
+            return PresupuestoMensual.objects.con_saldo()
+        return PresupuestoMensual.objects.all()
+
+    @action(detail=True, methods=['get'])
+    def resumen(self, request, pk=None):
+        # Totales del mes desde SaldoPresupuesto y desglose por categoría (otra consulta)
+        presupuesto = self.get_object()
+        return Response(ResumenPresupuestoSerializer(presupuesto).data)
+
+    @action(detail=False, methods=['get'], url_path='saldos')
+    def saldos_mensuales(self, request):
+        # Saldos de todos los meses (filtrables por familia) en una sola consulta
+        presupuestos = self.filter_queryset(self.get_queryset()).order_by('fecha_mes')
+        return Response(SaldoPresupuestoSerializer(presupuestos, many=True).data)
 
     def perform_create(self, serializer):
         # Asigna automáticamente el valor fijo para familia
-        serializer.save(familia='familia_camnr', creado_por=self.request.user)
+        try:
+            with transaction.atomic():
+                serializer.save(familia=FAMILIA_POR_DEFECTO, creado_por=self.request.user)
+        except IntegrityError:
+            raise serializers.ValidationError({'fecha_mes': 'Ya existe un presupuesto para este mes.'})
 
-class AporteViewSet(viewsets.ModelViewSet):
+class AporteViewSet(ListadoRapidoMixin, SaldoPresupuestoMixin, viewsets.ModelViewSet):
     queryset = Aporte.objects.all()
     serializer_class = AporteSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['presupuesto', 'usuario']
+    cursor_ordering = ('-fecha', '-id')
 
+    @transaction.atomic
     def perform_create(self, serializer):
         aporte = serializer.save()
         MovimientoPresupuesto.objects.create(
@@ -250,13 +358,15 @@ class AporteViewSet(viewsets.ModelViewSet):
             referencia_id=aporte.id
         )
 
-class GastoPresupuestoViewSet(viewsets.ModelViewSet):
+class GastoPresupuestoViewSet(SaldoPresupuestoMixin, viewsets.ModelViewSet):
     queryset = GastoPresupuesto.objects.all()
     serializer_class = GastoPresupuestoSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['presupuesto', 'cuenta', 'pagado_por']
+    cursor_ordering = ('-fecha', '-id')
 
+    @transaction.atomic
     def perform_create(self, serializer):
         gasto = serializer.save()
         MovimientoPresupuesto.objects.create(
@@ -268,15 +378,16 @@ class GastoPresupuestoViewSet(viewsets.ModelViewSet):
             referencia_id=gasto.id
         )
 
-class DeudaPresupuestoViewSet(viewsets.ModelViewSet):
+class DeudaPresupuestoViewSet(SaldoPresupuestoMixin, viewsets.ModelViewSet):
     queryset = DeudaPresupuesto.objects.all()
     serializer_class = DeudaPresupuestoSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['presupuesto', 'pagado']
+    cursor_ordering = ('-fecha', '-id')
 
+    @transaction.atomic
     def perform_create(self, serializer):
-        from datetime import timedelta, date
         deuda = serializer.save()
         MovimientoPresupuesto.objects.create(
             presupuesto=deuda.presupuesto,
@@ -286,76 +397,47 @@ class DeudaPresupuestoViewSet(viewsets.ModelViewSet):
             descripcion=f'Deuda: {deuda.motivo}',
             referencia_id=deuda.id
         )
-
-        presupuestos_afectados = [deuda.presupuesto]
-        # --- Lógica para crear presupuestos futuros y asociar deuda remanente ---
-        if deuda.cuotas_totales > 1 or (deuda.fecha_inicio and deuda.fecha_inicio.month != deuda.presupuesto.fecha_mes.month):
-            meses_futuros = []
-            fecha_inicio = deuda.fecha_inicio or deuda.presupuesto.fecha_mes
-            cuotas = deuda.cuotas_totales
-            frecuencia = deuda.frecuencia or 'mensual'
-            familia = deuda.presupuesto.familia
-            monto_cuota = deuda.monto / deuda.cuotas_totales if deuda.cuotas_totales > 1 else deuda.monto
-            fechas_cuotas = []
-            actual = fecha_inicio
-            for i in range(cuotas):
-                if frecuencia == 'mensual':
-                    mes = (actual.month + i - 1) % 12 + 1
-                    year = actual.year + ((actual.month + i - 1) // 12)
-                    fechas_cuotas.append(date(year, mes, 1))
-                elif frecuencia == 'quincenal':
-                    fechas_cuotas.append(actual + timedelta(days=15*i))
-                elif frecuencia == 'semanal':
-                    fechas_cuotas.append(actual + timedelta(days=7*i))
-                else:
-                    fechas_cuotas.append(actual)
-            for fecha_cuota in fechas_cuotas:
-                presupuesto, creado = PresupuestoMensual.objects.get_or_create(
-                    familia=familia,
-                    fecha_mes=date(fecha_cuota.year, fecha_cuota.month, 1),
-                    defaults={'monto_objetivo': 0, 'creado_por': self.request.user}
-                )
-                if presupuesto.id != deuda.presupuesto.id:
-                    if not DeudaPresupuesto.objects.filter(
-                        presupuesto=presupuesto,
-                        motivo=deuda.motivo,
-                        monto=monto_cuota,
-                        cuotas_totales=1,
-                        pagado=False
-                    ).exists():
-                        DeudaPresupuesto.objects.create(
-                            presupuesto=presupuesto,
-                            monto=monto_cuota,
-                            motivo=deuda.motivo,
-                            pagado=False,
-                            comentario=f'Deuda remanente de cuota generada automáticamente',
-                            cuenta_origen=deuda.cuenta_origen,
-                            cuotas_totales=1,
-                            cuotas_pagadas=0,
-                            frecuencia='mensual',
-                            fecha_inicio=fecha_cuota,
-                            categoria=deuda.categoria
-                        )
-                    presupuestos_afectados.append(presupuesto)
-        # Guardar en la instancia para usar en create()
-        self.presupuestos_afectados = presupuestos_afectados
+        # Las cuotas de los meses siguientes se generan en una tarea (api/tareas.py); con
+        # Idempotency-Key, un POST repetido devuelve la tarea (y la deuda) del primero
+        self.tarea_cuotas = None
+        if tiene_cuotas(deuda):
+            self.tarea_cuotas = tareas.encolar(
+                'generar_cuotas', {'deuda_id': deuda.id}, self.request.user, self.request.headers.get('Idempotency-Key')
+            )
 
     def create(self, request, *args, **kwargs):
-        response = super().create(request, *args, **kwargs)
-        # Agregar info de presupuestos afectados si existe
-        presupuestos_afectados = getattr(self, 'presupuestos_afectados', None)
-        if presupuestos_afectados:
-            from .serializers import PresupuestoMensualSerializer
-            response.data['presupuestos_afectados'] = PresupuestoMensualSerializer(presupuestos_afectados, many=True).data
+        clave = request.headers.get('Idempotency-Key')
+        existente = Tarea.objects.filter(usuario=request.user, clave_idempotencia=clave).first() if clave else None
+        if existente is None:
+            try:
+                response = super().create(request, *args, **kwargs)
+            except tareas.ClaveReutilizada:
+                # Otro POST con la misma clave ganó la carrera: se descarta esta deuda
+                existente = Tarea.objects.get(usuario=request.user, clave_idempotencia=clave)
+            else:
+                if self.tarea_cuotas is None:
+                    return response
+                return self.respuesta_cuotas(request, self.tarea_cuotas, response.data)
+        if existente.tipo != 'generar_cuotas':
+            return Response({'detail': 'La clave de idempotencia ya se usó para otra operación.'}, status=422)
+        deuda = DeudaPresupuesto.objects.filter(pk=existente.parametros['deuda_id']).first()
+        return self.respuesta_cuotas(request, existente, self.get_serializer(deuda).data if deuda else {})
+
+    def respuesta_cuotas(self, request, tarea, datos):
+        # 202: la deuda ya existe y sus cuotas están en la cola
+        response = tareas.respuesta_aceptada(request, tarea)
+        response.data = {**datos, 'tarea': response.data}
         return response
 
-class AhorroPresupuestoViewSet(viewsets.ModelViewSet):
+class AhorroPresupuestoViewSet(SaldoPresupuestoMixin, viewsets.ModelViewSet):
     queryset = AhorroPresupuesto.objects.all()
     serializer_class = AhorroPresupuestoSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['presupuesto']
+    cursor_ordering = ('-fecha', '-id')
 
+    @transaction.atomic
     def perform_create(self, serializer):
         ahorro = serializer.save()
         MovimientoPresupuesto.objects.create(
@@ -367,89 +449,65 @@ class AhorroPresupuestoViewSet(viewsets.ModelViewSet):
             referencia_id=ahorro.id
         )
 
-class MovimientoPresupuestoViewSet(viewsets.ModelViewSet):
+class MovimientoPresupuestoViewSet(ListadoRapidoMixin, viewsets.ModelViewSet):
     queryset = MovimientoPresupuesto.objects.all()
     serializer_class = MovimientoPresupuestoSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['presupuesto', 'tipo', 'usuario']
+    cursor_ordering = ('-fecha', '-id')
 
 class UsuariosListView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        perfiles = Profile.objects.select_related('user').all()
-        data = [
-            {
-                'id': p.user.id,
-                'username': p.user.username,
-                'color': p.color
-            }
-            for p in perfiles
-        ]
-        return Response(data)
+        def construir():
+            return [usuario_con_color(p) for p in Profile.objects.select_related('user')]
+
+        return respuesta_referencia(request, 'usuarios', '*', construir)
+
+def usuario_con_color(perfil):
+    return {
+        'id': perfil.user.id,
+        'username': perfil.user.username,
+        'color': perfil.color
+    }
+
+class EchoBuffer:
+    """Pseudo-buffer para csv.writer: devuelve cada línea en vez de acumularla."""
+    def write(self, value):
+        return value
 
 class ExportarCuentasCSVView(APIView):
     permission_classes = [IsAuthenticated]
-    
+    chunk_size = 2000
+    ESTADOS_CSV = {'pagada': 'Pagada', 'parcial': 'Pago Parcial', 'pendiente': 'Pendiente'}
+
     def get(self, request):
-        # Obtener parámetros de filtrado
-        fecha_desde = request.query_params.get('fecha_desde')
-        fecha_hasta = request.query_params.get('fecha_hasta')
-        categoria = request.query_params.get('categoria')
-        estado = request.query_params.get('estado')
-        
-        # Filtrar cuentas según parámetros
-        cuentas = Cuenta.objects.all().select_related('proveedor', 'creador')
-        
-        if fecha_desde:
-            cuentas = cuentas.filter(fecha_vencimiento__gte=fecha_desde)
-        if fecha_hasta:
-            cuentas = cuentas.filter(fecha_vencimiento__lte=fecha_hasta)
-        if categoria:
-            cuentas = cuentas.filter(categoria=categoria)
-        if estado:
-            if estado == 'pagada':
-                cuentas = cuentas.filter(pagos__isnull=False).distinct()
-            elif estado == 'pendiente':
-                # Subconsulta para obtener cuentas sin pagos o con pagos parciales
-                from django.db.models import Sum, F, Q
-                cuentas_con_pagos_completos = Cuenta.objects.annotate(
-                    total_pagado=Sum('pagos__monto_pagado')
-                ).filter(total_pagado__gte=F('monto'))
-                cuentas = cuentas.exclude(id__in=cuentas_con_pagos_completos)
-        
-        # Crear respuesta HTTP con contenido CSV
-        response = HttpResponse(content_type='text/csv')
+        # Monto pagado y último pago se anotan en la misma consulta (Sum/Max);
+        # los filtros son los mismos que usa el listado de /api/cuentas/
+        cuentas = Cuenta.objects.con_totales().select_related('proveedor', 'creador').order_by('id')
+        filtro = CuentaFilter(request.query_params, queryset=cuentas)
+        if not filtro.is_valid():
+            return Response(filtro.errors, status=400)
+        cuentas = filtro.qs
+
+        # Respuesta en streaming: las filas se escriben a medida que se leen
+        writer = csv.writer(EchoBuffer())
+        response = StreamingHttpResponse(self.filas_csv(cuentas, writer), content_type='text/csv')
         response['Content-Disposition'] = f'attachment; filename="historial-cuentas-{datetime.now().strftime("%Y%m%d")}.csv"'
-        
-        # Configurar escritor CSV
-        writer = csv.writer(response)
-        
+        return response
+
+    def filas_csv(self, cuentas, writer):
         # Escribir encabezados
-        writer.writerow([
-            'ID', 'Nombre', 'Monto', 'Proveedor', 'Categoría', 
-            'Fecha Emisión', 'Fecha Vencimiento', 'Descripción',
-            'Creador', 'Fecha Creación', 'Estado', 'Monto Pagado', 
-            'Fecha Último Pago'
-        ])
-        
-        # Iterar sobre las cuentas y escribir filas
-        for cuenta in cuentas:
-            # Calcular estado y monto pagado
-            pagos = Pago.objects.filter(cuenta=cuenta)
-            monto_pagado = sum(pago.monto_pagado for pago in pagos)
-            ultimo_pago = pagos.order_by('-fecha_pago').first()
-            
-            if monto_pagado >= cuenta.monto:
-                estado_cuenta = 'Pagada'
-            elif monto_pagado > 0:
-                estado_cuenta = 'Pago Parcial'
-            else:
-                estado_cuenta = 'Pendiente'
-                
-            # Escribir datos de la cuenta
-            writer.writerow([
+        yield writer.writerow([encabezado for encabezado, _ in COLUMNAS_CSV])
+
+        # iterator() lee por bloques, la memoria no crece con el número de cuentas
+        for cuenta in cuentas.iterator(chunk_size=self.chunk_size):
+            monto_pagado = cuenta.total_pagado.quantize(Decimal('0.01'))
+            estado_cuenta = self.ESTADOS_CSV[cuenta.estado_pago]
+
+            yield writer.writerow([
                 cuenta.id,
                 cuenta.nombre,
                 cuenta.monto,
@@ -462,10 +520,149 @@ class ExportarCuentasCSVView(APIView):
                 cuenta.fecha_creacion.strftime('%Y-%m-%d %H:%M'),
                 estado_cuenta,
                 monto_pagado,
-                ultimo_pago.fecha_pago.strftime('%Y-%m-%d') if ultimo_pago else ''
+                cuenta.ultimo_pago.strftime('%Y-%m-%d') if cuenta.ultimo_pago else ''
             ])
-        
-        return response
+
+class ImportarCuentasView(APIView):
+    # Carga masiva: archivo CSV (campo `archivo`, formato de la exportación) o lista JSON
+    permission_classes = [IsAuthenticated]
+    parser_classes = [JSONParser, MultiPartParser]
+
+    def post(self, request):
+        try:
+            if 'archivo' in request.FILES:
+                filas = filas_csv(request.FILES['archivo'])
+            else:
+                filas = filas_json(request.data)
+            resultado = importar(filas, request.user)
+        except ErrorImportacion as e:
+            return Response({'detail': str(e), 'errores': e.errores}, status=400)
+        except UnicodeDecodeError:
+            return Response({'detail': 'El archivo debe estar en UTF-8.'}, status=400)
+        return Response(resultado, status=201)
+
+class SyncView(APIView):
+    # Cambios desde `since` (cursor devuelto por la llamada anterior; 0 = carga inicial)
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            cursor = int(request.query_params.get('since', 0))
+            limite = min(int(request.query_params.get('limit', sync.LIMITE)), sync.LIMITE_MAXIMO)
+        except ValueError:
+            return Response({'detail': 'since y limit deben ser enteros.'}, status=400)
+        return Response(sync.cambios_desde(cursor, max(limite, 1), request))
+
+class TendenciasView(APIView):
+    """
+    Series mensuales y variación interanual de cuentas, pagos y gastos,
+    leídas de ResumenMensual (ver api/reportes.py).
+    ?desde=AAAA-MM&hasta=AAAA-MM (por defecto, los últimos 24 meses),
+    ?agrupar=categoria|proveedor|usuario|total y ?familia=.
+    """
+    permission_classes = [IsAuthenticated]
+    AGRUPAR = ('categoria', 'proveedor', 'usuario', 'total')
+    MAXIMO_MESES = 120
+
+    def get(self, request):
+        hoy = datetime.today().date()
+        try:
+            hasta = self.mes(request.query_params.get('hasta')) or hoy.replace(day=1)
+            # Por defecto, 24 meses terminando en `hasta`: dos años para comparar
+            desde = self.mes(request.query_params.get('desde')) or (
+                hasta.replace(year=hasta.year - 2, month=hasta.month + 1) if hasta.month < 12
+                else hasta.replace(year=hasta.year - 1, month=1)
+            )
+        except ValueError:
+            return Response({'detail': 'desde y hasta deben tener el formato AAAA-MM.'}, status=400)
+        agrupar = request.query_params.get('agrupar', 'categoria')
+        if agrupar not in self.AGRUPAR:
+            return Response({'detail': f"agrupar debe ser uno de: {', '.join(self.AGRUPAR)}."}, status=400)
+        meses = (hasta.year - desde.year) * 12 + hasta.month - desde.month + 1
+        if meses < 1 or meses > self.MAXIMO_MESES:
+            return Response({'detail': f'El rango debe tener entre 1 y {self.MAXIMO_MESES} meses.'}, status=400)
+        familia = request.query_params.get('familia') or FAMILIA_POR_DEFECTO
+        return Response(reportes.tendencias(familia, desde, hasta, agrupar))
+
+    @staticmethod
+    def mes(valor):
+        return datetime.strptime(valor, '%Y-%m').date() if valor else None
+
+class ProyeccionView(APIView):
+    """
+    Obligaciones (cuotas de deudas y cuentas recurrentes), flujo y saldo
+    esperado mes a mes (ver api/proyeccion.py). ?meses=12 (hasta 120),
+    ?desde=AAAA-MM (por defecto, el mes actual), ?saldo_inicial=, ?ingreso=
+    (por defecto, el promedio de aportes del último año) y ?familia=.
+    """
+    permission_classes = [IsAuthenticated]
+    MAXIMO_MESES = 120
+
+    def get(self, request):
+        if not proyeccion.disponible():
+            return Response({'detail': 'La proyección requiere NumPy, que no está instalado en el servidor.'}, status=503)
+        params = request.query_params
+        try:
+            meses = int(params.get('meses', 12))
+            desde = TendenciasView.mes(params.get('desde')) or datetime.today().date().replace(day=1)
+            saldo_inicial = proyeccion.monto_parametro(params.get('saldo_inicial', '0'))
+            ingreso = proyeccion.monto_parametro(params['ingreso']) if params.get('ingreso') else None
+        except (ValueError, ArithmeticError):
+            return Response({'detail': f'Parámetros inválidos: meses es entero, desde AAAA-MM, saldo_inicial e ingreso son montos (hasta {proyeccion.MONTO_MAXIMO}).'}, status=400)
+        if not 1 <= meses <= self.MAXIMO_MESES:
+            return Response({'detail': f'meses debe estar entre 1 y {self.MAXIMO_MESES}.'}, status=400)
+        familia = params.get('familia') or FAMILIA_POR_DEFECTO
+        return Response(proyeccion.proyectar(familia, desde, meses, saldo_inicial, ingreso))
+
+class BuscarView(APIView):
+    """
+    Búsqueda de texto en cuentas, deudas y movimientos, de más a menos
+    relevante (ver api/busqueda.py). ?q=, ?tipo=cuenta,deuda,movimiento,
+    ?page= y ?page_size= (hasta 100).
+    """
+    permission_classes = [IsAuthenticated]
+    PAGE_SIZE = 20
+    MAXIMO_PAGE_SIZE = 100
+
+    def get(self, request):
+        params = request.query_params
+        q = params.get('q', '').strip()
+        if not q:
+            return Response({'detail': 'Falta el texto a buscar (q).'}, status=400)
+        tipos = [tipo for tipo in params.get('tipo', '').split(',') if tipo]
+        desconocidos = set(tipos) - set(busqueda.TIPOS)
+        if desconocidos:
+            return Response({'detail': f"tipo debe ser uno de: {', '.join(busqueda.TIPOS)}."}, status=400)
+        try:
+            pagina = max(int(params.get('page', 1)), 1)
+            tamano = min(max(int(params.get('page_size', self.PAGE_SIZE)), 1), self.MAXIMO_PAGE_SIZE)
+        except ValueError:
+            return Response({'detail': 'page y page_size deben ser enteros.'}, status=400)
+
+        total, resultados = busqueda.buscar(q, tipos, tamano, (pagina - 1) * tamano)
+        url = request.build_absolute_uri()
+        anterior = None
+        if pagina > 1:
+            anterior = remove_query_param(url, 'page') if pagina == 2 else replace_query_param(url, 'page', pagina - 1)
+        return Response({
+            'count': total,
+            'next': replace_query_param(url, 'page', pagina + 1) if pagina * tamano < total else None,
+            'previous': anterior,
+            'results': resultados,
+        })
+
+class TareaViewSet(viewsets.ReadOnlyModelViewSet):
+    # Estado y resultado de las operaciones encoladas por el usuario (202 de cerrar mes, transferir, cuotas)
+    serializer_class = TareaSerializer
+    permission_classes = [IsAuthenticated]
+    cursor_ordering = ('-fecha_creacion', '-id')
+
+    def get_queryset(self):
+        return Tarea.objects.filter(usuario=self.request.user)
+
+    def retrieve(self, request, *args, **kwargs):
+        tarea = self.get_object()
+        return Response(self.get_serializer(tarea).data, headers=tareas.cabeceras_espera(tarea))
 
 class PagoDeudaPresupuestoViewSet(viewsets.ModelViewSet):
     queryset = PagoDeudaPresupuesto.objects.all()
@@ -473,7 +670,9 @@ class PagoDeudaPresupuestoViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['deuda']
+    cursor_ordering = ('-fecha_pago', '-id')
 
+    @transaction.atomic
     def perform_create(self, serializer):
         pago = serializer.save()
         deuda = pago.deuda
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 from datetime import timedelta
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -62,6 +63,8 @@ CORS_ALLOW_ALL_ORIGINS = True  # Para desarrollo, permite cualquier origen
 #     'http://localhost:3000',
 #     'http://192.168.1.10:3000',
 # ]
+# El frontend lee Location y Retry-After de los 202 de las operaciones en cola (ver api/tareas.py)
+CORS_EXPOSE_HEADERS = ['Location', 'Retry-After']
 
 ROOT_URLCONF = 'backend.urls'
 
@@ -89,7 +92,63 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('FAMILION_SQLITE_NAME', BASE_DIR / 'db.sqlite3'),
+    }
+}
+
+# PostgreSQL con FAMILION_DB_ENGINE=postgresql; conexión con FAMILION_DB_NAME, FAMILION_DB_USER,
+# FAMILION_DB_PASSWORD, FAMILION_DB_HOST y FAMILION_DB_PORT.
+# - Por defecto usa el pool de conexiones de psycopg 3 (requiere `psycopg[pool]`), tamaño
+#   FAMILION_DB_POOL_MIN/FAMILION_DB_POOL_MAX.
+# - Con FAMILION_DB_PGBOUNCER=1 el pool lo hace PgBouncer (modo transaction): conexiones
+#   persistentes hacia PgBouncer y sin cursores del lado del servidor, que ese modo no admite.
+# Los listados grandes y la exportación CSV leen con iterator(), que en
+# PostgreSQL usa cursores del lado del servidor.
+if os.environ.get('FAMILION_DB_ENGINE') == 'postgresql':
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('FAMILION_DB_NAME', 'familion'),
+        'USER': os.environ.get('FAMILION_DB_USER', 'familion'),
+        'PASSWORD': os.environ.get('FAMILION_DB_PASSWORD', ''),
+        'HOST': os.environ.get('FAMILION_DB_HOST', 'localhost'),
+        'PORT': os.environ.get('FAMILION_DB_PORT', '5432'),
+    }
+    if os.environ.get('FAMILION_DB_PGBOUNCER') == '1':
+        DATABASES['default'].update({
+            'CONN_MAX_AGE': int(os.environ.get('FAMILION_CONN_MAX_AGE', '600')),
+            'CONN_HEALTH_CHECKS': True,
+            'DISABLE_SERVER_SIDE_CURSORS': True,
+        })
+    else:
+        DATABASES['default']['OPTIONS'] = {
+            'pool': {
+                'min_size': int(os.environ.get('FAMILION_DB_POOL_MIN', '2')),
+                'max_size': int(os.environ.get('FAMILION_DB_POOL_MAX', '10')),
+                'timeout': 10,
+            },
+        }
+
+# Perfil de producción para SQLite con varios usuarios a la vez: WAL, busy timeout,
+# transacciones IMMEDIATE y conexiones persistentes (ver api/sqlite.py)
+elif os.environ.get('FAMILION_SQLITE_PERFIL') == 'produccion':
+    from api.sqlite import PRAGMAS_PRODUCCION
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': int(os.environ.get('FAMILION_CONN_MAX_AGE', '600')),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {'timeout': 20, 'transaction_mode': 'IMMEDIATE'},
+        'PRAGMAS': PRAGMAS_PRODUCCION,
+    })
+
+
+# Caché de datos de referencia (proveedores, usuarios, categorías), ver api/cache.py.
+# Compartida entre procesos: las versiones que invalidan cada grupo viven en la caché, y con
+# LocMemCache la invalidación de un worker de gunicorn/uvicorn no llegaría a los demás, que
+# seguirían respondiendo datos viejos (y 304) hasta TIMEOUT. LocMemCache solo sirve con un proceso;
+# con varios servidores, un backend de red (p. ej. django.core.cache.backends.redis.RedisCache)
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('FAMILION_CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.environ.get('FAMILION_CACHE_LOCATION', os.path.join(tempfile.gettempdir(), 'familion_cache')),
     }
 }
 
@@ -133,6 +192,27 @@ STATIC_URL = 'static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Envío de /media/ delegado al servidor de adelante: 'x-sendfile' (Apache, lighttpd) o
+# 'x-accel-redirect' (nginx, con un location `internal` que apunte a MEDIA_ROOT)
+FAMILION_MEDIA_SENDFILE = os.environ.get('FAMILION_MEDIA_SENDFILE', '')
+FAMILION_MEDIA_ACCEL_PREFIX = os.environ.get('FAMILION_MEDIA_ACCEL_PREFIX', '/media-interno/')
+# Segundos que vale la firma de las URLs de /media/ (ver api/almacenamiento.py)
+FAMILION_MEDIA_FIRMA_VIGENCIA = int(os.environ.get('FAMILION_MEDIA_FIRMA_VIGENCIA', 60 * 60))
+
+# Hilos del pool local que genera miniaturas y vistas previas (ver api/derivados.py)
+FAMILION_DERIVADOS_WORKERS = int(os.environ.get('FAMILION_DERIVADOS_WORKERS', '2'))
+
+# Cola de tareas (ver api/tareas.py): segundos que un worker retiene una tarea antes de
+# que otro pueda retomarla, y espera base entre reintentos (se duplica en cada uno)
+FAMILION_TAREAS_BLOQUEO = int(os.environ.get('FAMILION_TAREAS_BLOQUEO', '300'))
+FAMILION_TAREAS_ESPERA = int(os.environ.get('FAMILION_TAREAS_ESPERA', '5'))
+
+# Subidas deduplicadas por contenido (ver api/almacenamiento.py)
+STORAGES = {
+    'default': {'BACKEND': 'api.almacenamiento.AlmacenamientoDeduplicado'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -142,6 +222,13 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
+    # orjson si está instalado, con la misma salida que el JSONRenderer de DRF (ver api/renderers.py)
+    'DEFAULT_RENDERER_CLASSES': (
+        'api.renderers.JSONRapidoRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    # Paginación por cursor opcional (?page_size=N / ?cursor=...), ver api/pagination.py
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.CursorFechaPagination',
 }
 
 SIMPLE_JWT = {
@@ -0,0 +1,52 @@
+#!/usr/bin/env bash
+# Corre la suite de la API contra PostgreSQL.
+# Levanta un contenedor (docker o podman) o, si no hay, una instancia temporal con pg_ctl.
+# Uso: scripts/test_postgres.sh [argumentos de `manage.py test`]
+# - FAMILION_TEST_PG_BIN: directorio de initdb/pg_ctl si no están en el PATH.
+# - FAMILION_TEST_PG_USUARIO: usuario del sistema que corre el servidor cuando el script
+#   se ejecuta como root (initdb no corre como root); por defecto, postgres.
+set -euo pipefail
+cd "$(dirname "$0")/.."
+
+if [ -n "${FAMILION_TEST_PG_BIN:-}" ]; then PATH="$FAMILION_TEST_PG_BIN:$PATH"; fi
+
+PUERTO="${FAMILION_TEST_PG_PORT:-54329}"
+export FAMILION_DB_ENGINE=postgresql
+export FAMILION_DB_HOST=127.0.0.1
+export FAMILION_DB_PORT="$PUERTO"
+export FAMILION_DB_USER=familion
+export FAMILION_DB_PASSWORD=familion
+export FAMILION_DB_NAME=familion
+
+CONTENEDOR=""
+for cmd in docker podman; do
+  if command -v "$cmd" >/dev/null 2>&1; then CONTENEDOR="$cmd"; break; fi
+done
+
+if [ -n "$CONTENEDOR" ]; then
+  NOMBRE="familion-test-pg-$$"
+  "$CONTENEDOR" run -d --rm --name "$NOMBRE" -p "$PUERTO:5432" \
+    -e POSTGRES_USER=familion -e POSTGRES_PASSWORD=familion -e POSTGRES_DB=familion \
+    postgres:16 >/dev/null
+  trap '"$CONTENEDOR" stop "$NOMBRE" >/dev/null' EXIT
+  until "$CONTENEDOR" exec "$NOMBRE" pg_isready -U familion -h 127.0.0.1 >/dev/null 2>&1; do sleep 1; done
+elif command -v pg_ctl >/dev/null 2>&1; then
+  DATOS="$(mktemp -d)"
+  echo familion > "$DATOS/clave"
+  COMO=()
+  if [ "$(id -u)" = 0 ]; then
+    USUARIO_PG="${FAMILION_TEST_PG_USUARIO:-postgres}"
+    chown -R "$USUARIO_PG" "$DATOS"
+    COMO=(runuser -u "$USUARIO_PG" -- env "PATH=$PATH")
+  fi
+  # UTF8 explícito: sin locale initdb crea la base en SQL_ASCII y la búsqueda sin acentos no funciona
+  "${COMO[@]}" initdb -D "$DATOS/pg" -U familion --pwfile="$DATOS/clave" -A md5 -E UTF8 --no-locale >/dev/null
+  "${COMO[@]}" pg_ctl -D "$DATOS/pg" -o "-p $PUERTO -k $DATOS -c listen_addresses=127.0.0.1" -l "$DATOS/pg.log" -w start >/dev/null
+  trap '"${COMO[@]}" pg_ctl -D "$DATOS/pg" -m fast stop >/dev/null; rm -rf "$DATOS"' EXIT
+  PGPASSWORD=familion createdb -h 127.0.0.1 -p "$PUERTO" -U familion familion
+else
+  echo "Se necesita docker, podman o pg_ctl para levantar PostgreSQL." >&2
+  exit 1
+fi
+
+python manage.py test api "$@"
@@ -225,8 +225,9 @@ const PresupuestoDashboard = () => {
       setShowDeuda(false); setForm(initialForm);
       // --- NUEVO: mostrar mensaje con los meses afectados ---
       let msg = 'Deuda registrada';
-      if (response?.data && response.data.presupuestos_afectados) {
-        const lista = response.data.presupuestos_afectados.map(p => {
+      const afectados = response?.data?.presupuestosAfectados;
+      if (afectados) {
+        const lista = afectados.map(p => {
           const fecha = p.fecha_mes || p.fechaMes;
           if (!fecha) return '';
           const [y, m] = fecha.split('-');
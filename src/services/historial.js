@@ -43,17 +43,14 @@ export async function obtenerCategorias() {
   const token = localStorage.getItem('access');
   if (!token) throw new Error('No autenticado');
   
-  // Obtendremos categorías únicas de la API
-  const response = await fetch('http://localhost:8000/api/cuentas/', {
+  // Categorías únicas calculadas en el servidor (respuesta cacheada con ETag)
+  const response = await fetch('http://localhost:8000/api/categorias/', {
     headers: { 'Authorization': `Bearer ${token}` }
   });
   
   if (!response.ok) throw new Error('Error al obtener categorías');
   
-  const cuentas = await response.json();
-  const categorias = [...new Set(cuentas.map(cuenta => cuenta.categoria))].filter(Boolean);
-  
-  return categorias.map(cat => ({ id: cat, nombre: cat }));
+  return response.json();
 }
 
 export async function exportarHistorialCSV(filtros = {}) {
@@ -88,3 +85,20 @@ export async function exportarHistorialCSV(filtros = {}) {
   link.click();
   document.body.removeChild(link);
 }
+
+// Búsqueda de texto en cuentas, deudas y movimientos, paginada y ordenada por relevancia
+export async function buscarEnHistorial(texto, { tipo, page = 1, pageSize = 20 } = {}) {
+  const token = localStorage.getItem('access');
+  if (!token) throw new Error('No autenticado');
+
+  const params = new URLSearchParams({ q: texto, page, page_size: pageSize });
+  if (tipo) params.append('tipo', tipo);
+
+  const response = await fetch(`http://localhost:8000/api/buscar/?${params.toString()}`, {
+    headers: { 'Authorization': `Bearer ${token}` }
+  });
+
+  if (!response.ok) throw new Error('Error al buscar');
+
+  return response.json();
+}
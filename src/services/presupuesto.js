@@ -3,6 +3,41 @@ import axios from 'axios';
 // Cambia aquí la URL base a la del backend
 const API_BASE = process.env.REACT_APP_API_BASE || 'http://localhost:8000/api';
 
+// Operaciones en cola: el backend responde 202 con el id de la tarea y la ejecuta un worker
+export const getTarea = (id) => axios.get(`${API_BASE}/tareas/${id}/`);
+// Sin un worker (`manage.py procesar_tareas`) la tarea nunca se toma: se deja de esperar pasado este tiempo
+const ESPERA_MAXIMA_TAREA = 2 * 60 * 1000;
+// Retry-After (segundos) del backend en milisegundos, o `porDefecto` si no viene
+const reintentarEn = (headers, porDefecto) => {
+  const segundos = Number(headers?.['retry-after']);
+  return Number.isFinite(segundos) && segundos > 0 ? segundos * 1000 : porDefecto;
+};
+export const esperarTarea = async (tareaId, { url, espera = 1000, esperaMaxima = ESPERA_MAXIMA_TAREA } = {}) => {
+  const limite = Date.now() + esperaMaxima;
+  for (;;) {
+    const { data, headers } = await axios.get(url || `${API_BASE}/tareas/${tareaId}/`);
+    if (data.estado === 'completada') return data;
+    if (data.estado === 'fallida') throw new Error(data.error || 'La operación falló');
+    espera = reintentarEn(headers, espera);
+    if (Date.now() + espera > limite) {
+      throw new Error('La operación sigue en cola sin procesarse. Verifica que el servidor de tareas (procesar_tareas) esté en marcha.');
+    }
+    await new Promise(resolve => setTimeout(resolve, espera));
+  }
+};
+// Devuelve la respuesta con el resultado de la tarea, como cuando la operación era síncrona
+const esperarSiEncolada = async (peticion) => {
+  const response = await peticion;
+  if (response.status !== 202) return response;
+  const { tarea, tareaId, ...datos } = response.data;
+  const { resultado } = await esperarTarea(tareaId ?? tarea.tareaId, {
+    // Location y Retry-After del 202 (api/tareas.py respuesta_aceptada)
+    url: response.headers?.location || (tarea ?? response.data).url,
+    espera: reintentarEn(response.headers, 1000),
+  });
+  return { ...response, data: { ...datos, ...resultado } };
+};
+
 // Presupuestos
 export const getPresupuestos = (params) => axios.get(`${API_BASE}/presupuestos/`, { params });
 export const getPresupuesto = (id) => axios.get(`${API_BASE}/presupuestos/${id}/`);
@@ -38,11 +73,11 @@ export const createDeuda = (data) => {
         }
       }
     });
-    return axios.post(`${API_BASE}/deudas-presupuesto/`, formData, {
+    return esperarSiEncolada(axios.post(`${API_BASE}/deudas-presupuesto/`, formData, {
       headers: { 'Content-Type': 'multipart/form-data' }
-    });
+    }));
   } else {
-    return axios.post(`${API_BASE}/deudas-presupuesto/`, data);
+    return esperarSiEncolada(axios.post(`${API_BASE}/deudas-presupuesto/`, data));
   }
 };
 export const updateDeuda = (id, data) => axios.patch(`${API_BASE}/deudas-presupuesto/${id}/`, data);
@@ -57,11 +92,15 @@ export const deleteAhorro = (id) => axios.delete(`${API_BASE}/ahorros-presupuest
 // Movimientos
 export const getMovimientos = (params) => axios.get(`${API_BASE}/movimientos-presupuesto/`, { params });
 
-// Transferir sobrante
-export const transferirSobrante = (presupuestoId) => axios.post(`${API_BASE}/presupuesto/${presupuestoId}/transferir-sobrante/`);
+// Transferir sobrante (opciones: { estrategia, objetivo, orden, meses, sobrante_mensual } para aplicar un plan de pago;
+// con estrategia "mejor", enviar los mismos meses y sobrante_mensual que se usaron en getPlanPagos)
+export const transferirSobrante = (presupuestoId, opciones) => esperarSiEncolada(axios.post(`${API_BASE}/presupuesto/${presupuestoId}/transferir-sobrante/`, opciones));
+
+// Plan de pago de deudas: compara estrategias (params: { objetivo, meses, sobrante_mensual, orden })
+export const getPlanPagos = (presupuestoId, params) => axios.get(`${API_BASE}/presupuesto/${presupuestoId}/plan-pagos/`, { params });
 
 // Cerrar mes
-export const cerrarMes = (presupuestoId) => axios.post(`${API_BASE}/presupuesto/${presupuestoId}/cerrar-mes/`);
+export const cerrarMes = (presupuestoId) => esperarSiEncolada(axios.post(`${API_BASE}/presupuesto/${presupuestoId}/cerrar-mes/`));
 
 // Pagos de deuda (cuotas)
 export const getPagosDeuda = (params) => axios.get(`${API_BASE}/pagos-deuda/`, { params });
@@ -75,3 +114,6 @@ export const deletePagoDeuda = (id) => axios.delete(`${API_BASE}/pagos-deuda/${i
 
 // Cuentas (para selector de cuenta_origen en deudas)
 export const getCuentas = (params) => axios.get(`${API_BASE}/cuentas/`, { params });
+
+// Resumen del mes calculado en el servidor (totales, sobrante y desglose por categoría)
+export const getResumenPresupuesto = (presupuestoId) => axios.get(`${API_BASE}/presupuestos/${presupuestoId}/resumen/`);
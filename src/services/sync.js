@@ -0,0 +1,16 @@
+// src/services/sync.js
+
+// Trae los cambios posteriores a `cursor` (0 = carga inicial). Guardar el `cursor`
+// devuelto y repetir mientras `hayMas` sea true.
+export async function obtenerCambios(cursor = 0) {
+  const token = localStorage.getItem('access');
+  if (!token) throw new Error('No autenticado');
+
+  const response = await fetch(`http://localhost:8000/api/sync/?since=${cursor}`, {
+    headers: { 'Authorization': `Bearer ${token}` }
+  });
+
+  if (!response.ok) throw new Error('Error al sincronizar cambios');
+
+  return response.json();
+}